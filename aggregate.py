@@ -0,0 +1,130 @@
+# 上报窗口聚合与死区判定
+# 每个通道在两次上报之间累计 最小/最大/平均/样本数；
+# 数值偏离上次上报值超过死区时立即上报，否则每个窗口（秒）上报一次聚合结果。
+# 设有死区的通道尚未上报过时（开机后），第一个读数立即上报，之后的跳变不必等满一个窗口。
+# 通道号与 filters.FilterBank 一致：(站点-1)*4 + 种类。
+# 平均值按“连续相同值的段”累加：数值不变时只计数，稳态下不产生浮点对象。
+from array import array
+
+
+class Aggregator:
+    def __init__(self, channels):
+        self.channels = channels
+        self.window = array('i', bytes(4 * channels))   # 聚合窗口（秒），0 表示不定期上报
+        self.deadband = [0] * channels                   # 死区（工程单位），0 表示不做死区上报
+        self.start = [0] * channels
+        self.count = array('i', bytes(4 * channels))
+        self.missing = array('i', bytes(4 * channels))
+        self.vmin = [None] * channels
+        self.vmax = [None] * channels
+        self.total = [0.0] * channels
+        self.cur = [None] * channels        # 当前段的数值及其连续次数
+        self.run = array('i', bytes(4 * channels))
+        self.reported = [None] * channels   # 上次上报的数值
+        self.triggered = 0                  # 越过死区的通道位掩码
+
+    def configure(self, ch, window, deadband, now=0):
+        self.window[ch] = int(window)
+        self.deadband[ch] = deadband
+        self.reset(ch, now)
+
+    def reset(self, ch, now):
+        self.start[ch] = now
+        self.count[ch] = 0
+        self.missing[ch] = 0
+        self.vmin[ch] = None
+        self.vmax[ch] = None
+        self.total[ch] = 0.0
+        self.cur[ch] = None
+        self.run[ch] = 0
+        self.triggered &= ~(1 << ch)
+
+    def add(self, ch, value):
+        if value is None:
+            self.missing[ch] += 1
+            return
+        self.count[ch] += 1
+        if value == self.cur[ch]:
+            self.run[ch] += 1
+            return
+        self._close_run(ch)
+        self.cur[ch] = value
+        self.run[ch] = 1
+        if self.vmin[ch] is None or value < self.vmin[ch]:
+            self.vmin[ch] = value
+        if self.vmax[ch] is None or value > self.vmax[ch]:
+            self.vmax[ch] = value
+        band = self.deadband[ch]
+        last = self.reported[ch]
+        if band and (last is None or abs(value - last) > band):
+            self.triggered |= 1 << ch
+
+    def _close_run(self, ch):
+        if self.run[ch]:
+            self.total[ch] += self.cur[ch] * self.run[ch]
+            self.run[ch] = 0
+
+    def poll(self, now):
+        # 返回需要上报的通道位掩码：越过死区的通道，以及窗口到期的通道
+        due = self.triggered
+        for ch in range(self.channels):
+            w = self.window[ch]
+            if w and now - self.start[ch] >= w:
+                due |= 1 << ch
+        return due
+
+    def mean(self, ch):
+        n = self.count[ch]
+        if not n:
+            return None
+        return (self.total[ch] + (self.cur[ch] * self.run[ch] if self.run[ch] else 0)) / n
+
+    def report(self, due, now):
+        # 取出到期通道的聚合结果 [(通道, 样本数, 最小, 最大, 平均), ...] 并开始新窗口
+        entries = []
+        for ch in range(self.channels):
+            if due & (1 << ch):
+                entries.append((ch, self.count[ch], self.vmin[ch], self.vmax[ch], self.mean(ch)))
+                if self.cur[ch] is not None:
+                    self.reported[ch] = self.cur[ch]
+                self.reset(ch, now)
+        return entries
+
+
+if __name__ == '__main__':
+    # 上位机运行：模拟 1 小时缓慢变化的温度（含一次 1 秒尖峰），对比每秒上报与聚合上报
+    import math
+    import wire
+
+    # 开机后首个读数立即上报，随后的跳变按死区立即上报，不等 300 秒窗口
+    boot = Aggregator(1)
+    boot.configure(0, 300, 1.0)
+    boot.add(0, 1013.2)
+    assert boot.poll(0) == 1 and boot.report(1, 0)[0][1:] == (1, 1013.2, 1013.2, 1013.2)
+    boot.add(0, 1013.5)
+    assert boot.poll(2) == 0
+    boot.add(0, 1009.0)
+    assert boot.poll(3) == 1
+
+    agg = Aggregator(1)
+    agg.configure(0, 60, 0.5)
+    per_second = 0
+    aggregated = 0
+    peak = None
+    for t in range(3600):
+        value = round(22 + 2 * math.sin(t / 900), 1)
+        if t == 1234:
+            value = 31.7
+        per_second += len(wire._legacy_line('temp004', '%.1f' % value, '62.3', '741', '989.0', '203.70', '已开启'))
+        agg.add(0, value)
+        due = agg.poll(t)
+        if due:
+            entries = [(1, ch, n, lo, hi, mean) for ch, n, lo, hi, mean in agg.report(due, t)]
+            aggregated += len(wire._legacy_line('temp004', '%.1f' % value, '62.3', '741', '989.0', '203.70', '已开启'))
+            aggregated += len(wire._legacy_line('agg004', wire.encode_aggregate(entries, True, False)))
+            for e in entries:
+                peak = e[4] if peak is None or e[4] > peak else peak
+    assert peak == 31.7, peak
+    print('per-second uplink : %d B/h' % per_second)
+    print('aggregated uplink : %d B/h (spike max %.1f kept)' % (aggregated, peak))
+    print('ratio             : %.1fx' % (per_second / aggregated))
@@ -0,0 +1,159 @@
+# 报警管理：按站点维护报警位掩码，只上报触发/解除跳变和周期摘要
+#
+# 上行帧格式（经 TOPIC_ALARM 发送，不含中文，通常只有几个字节）:
+#   R<站点><位>   报警触发，例如 R10 = 1号站温度过高
+#   C<站点><位>   报警解除，例如 C23 = 2号站湿度过低解除
+#   D<掩码...>    周期摘要，每个站点两位十六进制掩码，例如 D0100
+# 多个跳变拼接在同一帧中，例如 R10C23。设备发送时加 '#' 包裹（#R10C23#）。
+# 应用侧文本由 describe() 在边缘侧还原，帧可带或不带 '#' 包裹。
+
+# 报警位（每个站点一个字节）
+ALM_TEMP_HIGH = 0
+ALM_TEMP_LOW = 1
+ALM_HUM_HIGH = 2
+ALM_HUM_LOW = 3
+ALM_LUX_LOW = 4
+ALM_LUX_HIGH = 5
+ALM_SENSOR_ERR = 6
+
+TEMP_HIGH = 1 << ALM_TEMP_HIGH
+TEMP_LOW = 1 << ALM_TEMP_LOW
+HUM_HIGH = 1 << ALM_HUM_HIGH
+HUM_LOW = 1 << ALM_HUM_LOW
+LUX_LOW = 1 << ALM_LUX_LOW
+LUX_HIGH = 1 << ALM_LUX_HIGH
+SENSOR_ERR = 1 << ALM_SENSOR_ERR
+
+ALARM_TEXT = {
+    ALM_TEMP_HIGH: '温度过高',
+    ALM_TEMP_LOW: '温度过低',
+    ALM_HUM_HIGH: '湿度过高',
+    ALM_HUM_LOW: '湿度过低',
+    ALM_LUX_LOW: '光强低',
+    ALM_LUX_HIGH: '光强高',
+    ALM_SENSOR_ERR: '传感器故障',
+}
+NORMAL_TEXT = '所有参数正常'
+
+
+class AlarmManager:
+    def __init__(self, stations=2, digest_interval=60):
+        # 下标为站点号（1..stations），0号不用
+        self.masks = bytearray(stations + 1)
+        self.sent = bytearray(stations + 1)
+        self.digest_interval = digest_interval
+        self.last_digest = None
+        self.pending_digest = False
+
+    def set(self, station, mask):
+        self.masks[station] = mask
+
+    def mask(self, station):
+        return self.masks[station]
+
+    def active(self):
+        # 当前所有激活报警，(站点, 位) 列表
+        result = []
+        for station in range(1, len(self.masks)):
+            m = self.masks[station]
+            bit = 0
+            while m:
+                if m & 1:
+                    result.append((station, bit))
+                m >>= 1
+                bit += 1
+        return result
+
+    def count(self):
+        # 激活报警的数量，不分配列表
+        n = 0
+        for station in range(1, len(self.masks)):
+            m = self.masks[station]
+            while m:
+                n += m & 1
+                m >>= 1
+        return n
+
+    def any_active(self):
+        for station in range(1, len(self.masks)):
+            if self.masks[station]:
+                return True
+        return False
+
+    def digest(self):
+        return 'D' + ''.join('%02X' % self.masks[s] for s in range(1, len(self.masks)))
+
+    def poll(self, now):
+        # 返回待发送的帧；没有需要上报的内容时返回 None
+        frame = ''
+        for station in range(1, len(self.masks)):
+            mask = self.masks[station]
+            diff = mask ^ self.sent[station]
+            bit = 0
+            while diff:
+                if diff & 1:
+                    frame += ('R%d%d' if mask & (1 << bit) else 'C%d%d') % (station, bit)
+                diff >>= 1
+                bit += 1
+        self.pending_digest = False
+        if not frame and (self.last_digest is None or now - self.last_digest >= self.digest_interval):
+            frame = self.digest()
+            self.pending_digest = True
+        return frame or None
+
+    def ack(self, now):
+        # 帧发送成功后调用；发送失败则不调用，下次 poll 会重新生成跳变
+        self.sent[:] = self.masks
+        if self.pending_digest:
+            self.last_digest = now
+            self.pending_digest = False
+
+
+def decode(frame):
+    # 解析上行帧（可带 '#' 包裹），返回 (类型, 站点, 位) 列表；摘要帧中每个激活位记为 'D'
+    frame = frame.strip('#')
+    events = []
+    if frame.startswith('D'):
+        body = frame[1:]
+        for i in range(0, len(body), 2):
+            station = i // 2 + 1
+            mask = int(body[i:i + 2], 16)
+            for bit in range(8):
+                if mask & (1 << bit):
+                    events.append(('D', station, bit))
+        return events
+    for i in range(0, len(frame) - 2, 3):
+        events.append((frame[i], int(frame[i + 1]), int(frame[i + 2])))
+    return events
+
+
+def describe(frame):
+    # 边缘侧还原应用显示文本，例如 "1-温度过高\t2-湿度过低解除"
+    events = decode(frame)
+    if not events:
+        return NORMAL_TEXT
+    parts = []
+    for kind, station, bit in events:
+        text = '%d-%s' % (station, ALARM_TEXT.get(bit, '未知报警%d' % bit))
+        if kind == 'C':
+            text += '解除'
+        parts.append(text)
+    return '\t'.join(parts)
+
+
+if __name__ == '__main__':
+    # 上位机运行：按 main.send_alarm 的方式包裹帧，检查 describe() 的还原结果
+    mgr = AlarmManager(stations=2, digest_interval=60)
+    mgr.set(1, TEMP_HIGH)
+    sent = '#%s#' % mgr.poll(0)
+    mgr.ack(0)
+    assert sent == '#R10#' and describe(sent) == '1-温度过高', (sent, describe(sent))
+    mgr.set(1, 0)
+    mgr.set(2, HUM_LOW)
+    sent = '#%s#' % mgr.poll(1)
+    mgr.ack(1)
+    assert describe(sent) == '1-温度过高解除\t2-湿度过低', describe(sent)
+    sent = '#%s#' % mgr.poll(61)
+    assert sent == '#D0008#' and decode(sent) == [('D', 2, ALM_HUM_LOW)], sent
+    assert describe('##') == describe('') == NORMAL_TEXT
+    print('ok')
@@ -0,0 +1,323 @@
+# 驱动基准（上位机运行）：在模拟 I2C/SPI 总线上运行 bmp280 与 ssd1306 驱动，
+# 统计每个操作的耗时、总线事务数、字节数和按总线时钟估算的线上时间
+# 用法:
+#   python bench_drivers.py                 对比 bench_drivers.json 中的基线，总线流量变多时退出码为 1
+#   python bench_drivers.py --update        用本次结果重写基线
+#   python bench_drivers.py --rounds 2000 --json out.json
+#
+# micropython、framebuf 使用 replay.py 的替身（FrameBuffer 不画像素，设备上由 C 实现），
+# 因此 CPU 时间反映的是驱动自身的 Python 开销，只作参考；事务数与字节数是确定的，用于回归检查。
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+import replay
+
+replay.install_fakes()
+if not hasattr(time, 'sleep_ms'):
+    # SSD1306_SPI 复位时调用 MicroPython 的 time.sleep_ms
+    time.sleep_ms = lambda ms: None
+
+import bmp280
+import display
+import i2cbus
+import ssd1306
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_drivers.json')
+I2C_FREQS = (100000, 400000)
+ROUNDS = 1000
+REPEAT = 5
+
+# 与现场一致的 BMP280 校准参数（数据手册示例值）
+CAL = (27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000)
+
+
+class BusStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.tx = 0
+        self.bytes = 0
+        self.bits = 0         # 线上位数（含地址、ACK、起止条件）
+        self.extra = 0        # SPI: spi.init() 与片选/数据命令引脚翻转次数
+
+
+class MockI2C:
+    # 寄存器文件按设备地址保存；writeto 的首字节为寄存器地址，其后数据依次写入
+    # 字节数的算法与 i2cbus.I2CBus 相同（负载 + 寄存器地址），线上时间另加地址字节、
+    # 每字节 1 位 ACK 和起始/重复起始/停止条件
+    def __init__(self, devices=None, realtime=0):
+        self.realtime = realtime      # 非 0 时按该总线频率 sleep 出线上时间（用于测量并行刷新）
+        self.regs = {}
+        for addr in devices or ():
+            self.regs[addr] = bytearray(256)
+        self.stats = BusStats()
+
+    def _count(self, nbytes, addr_bytes):
+        s = self.stats
+        s.tx += 1
+        s.bytes += nbytes
+        s.bits += 9 * (nbytes + addr_bytes) + 2 * addr_bytes
+        if self.realtime:
+            time.sleep((9 * (nbytes + addr_bytes) + 2 * addr_bytes) / self.realtime)
+
+    def scan(self):
+        return sorted(self.regs)
+
+    def writeto(self, addr, buf, stop=True):
+        self._count(len(buf), 1)
+        regs = self.regs.get(addr)
+        if regs is not None and len(buf) > 1:
+            # BMP280 按寄存器/数据成对写入
+            for i in range(0, len(buf) - 1, 2):
+                regs[buf[i]] = buf[i + 1]
+        return len(buf)
+
+    def writevto(self, addr, vector, stop=True):
+        n = 0
+        for b in vector:
+            n += len(b)
+        self._count(n, 1)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        self._count(len(buf) + 1, 2)
+        regs = self.regs[addr]
+        buf[:] = regs[memaddr:memaddr + len(buf)]
+
+    def readfrom_mem(self, addr, memaddr, n):
+        self._count(n + 1, 2)
+        return bytes(self.regs[addr][memaddr:memaddr + n])
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self._count(len(buf) + 1, 1)
+        self.regs[addr][memaddr:memaddr + len(buf)] = buf
+
+    def wire_us(self, freq):
+        return self.stats.bits * 1e6 / freq
+
+
+class MockSPI:
+    def __init__(self):
+        self.baudrate = 1000000
+        self.stats = BusStats()
+
+    def init(self, baudrate=None, polarity=0, phase=0):
+        if baudrate:
+            self.baudrate = baudrate
+        self.stats.extra += 1
+
+    def write(self, buf):
+        s = self.stats
+        s.tx += 1
+        s.bytes += len(buf)
+        s.bits += 8 * len(buf)
+
+    def wire_us(self, freq=None):
+        return self.stats.bits * 1e6 / (freq or self.baudrate)
+
+
+class MockPin:
+    OUT = 1
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.v = 0
+
+    def init(self, mode=-1, value=None):
+        if value is not None:
+            self.v = value
+
+    def __call__(self, v=None):
+        if v is None:
+            return self.v
+        self.v = v
+        self.stats.extra += 1
+
+
+def bmp_regs(bus, addr, adc_T, adc_P):
+    regs = bus.regs[addr]
+    regs[0x88:0xA0] = struct.pack('<HhhHhhhhhhhh', *CAL)
+    regs[0xF7:0xFD] = bytes(((adc_P >> 12) & 0xFF, (adc_P >> 4) & 0xFF, (adc_P & 0x0F) << 4,
+                             (adc_T >> 12) & 0xFF, (adc_T >> 4) & 0xFF, (adc_T & 0x0F) << 4))
+
+
+def glyph_list(seed):
+    return [(seed * 37 + i * 11) & 0xFF for i in range(ssd1306.GLYPH_BYTES)]
+
+
+# ---------- 测量 ----------
+
+class Result:
+    def __init__(self, name, bus_kind, rounds, cpu_ns, stats, wire):
+        self.name = name
+        self.bus = bus_kind
+        self.cpu_us = cpu_ns / rounds / 1000
+        self.tx = stats.tx / rounds
+        self.bytes = stats.bytes / rounds
+        self.extra = stats.extra / rounds
+        self.wire = wire                  # {'100k': us/op, ...}
+
+    def traffic(self):
+        return {'tx': self.tx, 'bytes': self.bytes}
+
+
+def measure(name, bus, fn, rounds, setup=None):
+    # 与 pytest-benchmark 相同的做法：重复 REPEAT 轮，CPU 时间取最快一轮；总线计数取最后一轮
+    best = None
+    for _ in range(REPEAT):
+        if setup:
+            setup()
+        bus.stats.reset()
+        t0 = time.perf_counter_ns()
+        for _ in range(rounds):
+            fn()
+        dt = time.perf_counter_ns() - t0
+        best = dt if best is None else min(best, dt)
+    if isinstance(bus, MockI2C):
+        wire = {'%dk' % (f // 1000): bus.wire_us(f) / rounds for f in I2C_FREQS}
+        kind = 'i2c'
+    else:
+        wire = {'%.1fM' % (bus.baudrate / 1e6): bus.wire_us() / rounds}
+        kind = 'spi'
+    return Result(name, kind, rounds, best, bus.stats, wire)
+
+
+def bench_bmp280(rounds):
+    results = []
+    bus = MockI2C((bmp280.BMP280_I2C_ADDR,))
+    bmp_regs(bus, bmp280.BMP280_I2C_ADDR, 519888, 415148)
+    results.append(measure('bmp280.__init__', bus, lambda: bmp280.BMP280(bus), max(rounds // 10, 1)))
+    bmp = bmp280.BMP280(bus)
+    results.append(measure('bmp280.get', bus, bmp.get, rounds))
+
+    # getAltitude 只在气压变化时重新格式化：分别测量读数不变和每次变化两种情况
+    results.append(measure('bmp280.getAltitude', bus, bmp.getAltitude, rounds))
+    adc = [415148]
+
+    def changing():
+        adc[0] ^= 0x10
+        regs = bus.regs[bmp280.BMP280_I2C_ADDR]
+        regs[0xF8] = (adc[0] >> 4) & 0xFF
+        return bmp.getAltitude()
+
+    results.append(measure('bmp280.getAltitude/chg', bus, changing, rounds))
+
+    # 经过 i2cbus.I2CBus（加锁、重试、计数）时的额外开销
+    shared = i2cbus.I2CBus(bus, 'bench')
+    bmp_shared = bmp280.BMP280(shared)
+    results.append(measure('bmp280.get/I2CBus', bus, bmp_shared.get, rounds))
+    return results
+
+
+def bench_ssd1306(rounds):
+    results = []
+    bus = MockI2C((0x3C,))
+    oled = ssd1306.SSD1306_I2C(128, 64, bus, addr=0x3C)
+    results.append(measure('ssd1306_i2c.init_display', bus, oled.init_display, max(rounds // 10, 1)))
+    results.append(measure('ssd1306_i2c.show', bus, oled.show, max(rounds // 10, 1)))
+    results.append(measure('ssd1306_i2c.contrast', bus, lambda: oled.contrast(0x7F), rounds))
+
+    glyph = glyph_list(1)
+    results.append(measure('ssd1306.show_hanzi/list', bus, lambda: oled.show_hanzi(2, 16, glyph), rounds))
+    chars = '温度湿光照压'
+    data = bytearray()
+    for i in range(len(chars)):
+        data += bytes(glyph_list(i))
+    oled.use_atlas(ssd1306.GlyphAtlas(chars, data))
+    results.append(measure('ssd1306.show_hanzi/atlas', bus, lambda: oled.show_hanzi(2, 16, '温'), rounds))
+    results.append(measure('ssd1306.show_text_hanzi', bus,
+                           lambda: oled.show_text_hanzi(1, 0, '温度:25.3C'), rounds))
+
+    spi = MockSPI()
+    oled_spi = ssd1306.SSD1306_SPI(128, 64, spi, MockPin(spi.stats), MockPin(spi.stats), MockPin(spi.stats))
+    results.append(measure('ssd1306_spi.init_display', spi, oled_spi.init_display, max(rounds // 10, 1)))
+    results.append(measure('ssd1306_spi.show', spi, oled_spi.show, max(rounds // 10, 1)))
+    results.append(measure('ssd1306_spi.contrast', spi, lambda: oled_spi.contrast(0x7F), rounds))
+    return results
+
+
+def bench_dual(rounds):
+    # 两块屏各在一条 400 kHz 总线上，总线按线上时间阻塞：对比依次刷新与 DualDisplay 并行刷新的耗时
+    results = []
+    for threaded in (False, True):
+        bus1 = MockI2C((0x3C,), realtime=400000)
+        bus2 = MockI2C((0x3C,), realtime=400000)
+        screens = display.DualDisplay(ssd1306.SSD1306_I2C(128, 64, bus1), ssd1306.SSD1306_I2C(128, 64, bus2),
+                                      threaded)
+        name = 'display.show/%s' % ('threaded' if threaded else 'sequential')
+        results.append(measure(name, bus1, screens.show, max(rounds // 100, 1)))
+        screens.close()
+    return results
+
+
+def run(rounds=ROUNDS):
+    return bench_bmp280(rounds) + bench_ssd1306(rounds) + bench_dual(rounds)
+
+
+def report(results, baseline=None):
+    print('%-27s %4s %9s %6s %8s %6s  %s' % ('operation', 'bus', 'us/op', 'tx', 'bytes', 'pins', 'wire us/op'))
+    for r in results:
+        wire = '  '.join('%s %.1f' % (k, v) for k, v in r.wire.items())
+        mark = ''
+        if baseline is not None:
+            mark = compare(r, baseline.get(r.name))[1]
+        print('%-27s %4s %9.2f %6.2f %8.1f %6.1f  %s%s' % (
+            r.name, r.bus, r.cpu_us, r.tx, r.bytes, r.extra, wire, mark))
+
+
+def compare(result, base):
+    # 事务数或字节数多于基线即为回归；返回 (是否回归, 标注)
+    if base is None:
+        return False, '  (new)'
+    worse = [k for k in ('tx', 'bytes') if result.traffic()[k] > base[k] + 1e-9]
+    if worse:
+        return True, '  REGRESSION %s' % ', '.join(
+            '%s %.1f -> %.1f' % (k, base[k], result.traffic()[k]) for k in worse)
+    better = [k for k in ('tx', 'bytes') if result.traffic()[k] < base[k] - 1e-9]
+    if better:
+        return False, '  (improved %s)' % ', '.join(better)
+    return False, ''
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='bmp280/ssd1306 driver benchmarks on mock buses')
+    ap.add_argument('--rounds', type=int, default=ROUNDS)
+    ap.add_argument('--baseline', default=BASELINE)
+    ap.add_argument('--update', action='store_true', help='rewrite the baseline with this run')
+    ap.add_argument('--json', help='write all results to this file')
+    args = ap.parse_args(argv)
+
+    results = run(args.rounds)
+    baseline = None
+    if not args.update and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({r.name: {'bus': r.bus, 'cpu_us': r.cpu_us, 'tx': r.tx, 'bytes': r.bytes,
+                                'pins': r.extra, 'wire_us': r.wire} for r in results}, f, indent=1)
+    if args.update:
+        with open(args.baseline, 'w') as f:
+            json.dump({r.name: r.traffic() for r in results}, f, indent=1, sort_keys=True)
+            f.write('\n')
+        print('baseline written to %s' % args.baseline)
+        return 0
+    if baseline is None:
+        print('no baseline (%s); run with --update to create one' % args.baseline)
+        return 0
+    failed = [r.name for r in results if compare(r, baseline.get(r.name))[0]]
+    if failed:
+        print('bus traffic regressed: %s' % ', '.join(failed))
+        return 1
+    print('bus traffic within baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+# transport 后端基准：发布往返延迟与吞吐量
+# 设备上: 将 HOST 指向运行 mock_broker.py 的电脑后执行 import bench_transport
+# 上位机: python bench_transport.py [host]，不指定 host 时自动启动本地 mock_broker；
+#         没有 umqtt.simple 时使用 mock_umqtt 替身，先检查 MQTT 后端再输出 TCP 与 MQTT 两组结果
+import sys
+import time
+import transport
+
+try:
+    ticks_us = time.ticks_us
+    ticks_diff = time.ticks_diff
+except AttributeError:
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+HOST = '127.0.0.1'
+TCP_PORT = 8344
+MQTT_PORT = 9501
+TOPIC = 'bench004'
+LATENCY_ROUNDS = 50
+THROUGHPUT_MSGS = 500
+PAYLOAD = '#24.5#62.3#741#989.0#203.70#1#'
+
+
+def _wait_for(link, expected, timeout_ms=2000):
+    start = ticks_us()
+    while ticks_diff(ticks_us(), start) < timeout_ms * 1000:
+        for topic, msg in link.receive():
+            if topic == TOPIC and msg == expected:
+                return True
+    return False
+
+
+def bench(name, link):
+    link.subscribe(TOPIC)
+    link.connect()
+    time.sleep(0.2)
+    link.receive()
+
+    samples = []
+    for i in range(LATENCY_ROUNDS):
+        msg = 'lat%d' % i
+        start = ticks_us()
+        link.publish(TOPIC, msg)
+        if _wait_for(link, msg):
+            samples.append(ticks_diff(ticks_us(), start))
+    samples.sort()
+
+    start = ticks_us()
+    sent = 0
+    for _ in range(THROUGHPUT_MSGS):
+        sent += link.publish(TOPIC, PAYLOAD)
+    elapsed = ticks_diff(ticks_us(), start) / 1e6
+    link.publish(TOPIC, 'end')
+    _wait_for(link, 'end')
+    link.close()
+
+    if samples:
+        print('%-10s latency  p50 %7.2f ms  p95 %7.2f ms  (%d/%d echoed)' % (
+            name, samples[len(samples) // 2] / 1000, samples[len(samples) * 95 // 100] / 1000,
+            len(samples), LATENCY_ROUNDS))
+    print('%-10s publish  %8.0f msg/s  %8.0f B/s' % (name, THROUGHPUT_MSGS / elapsed, sent / elapsed))
+
+
+def check_mqtt(host=HOST):
+    # BemfaMQTT 的检查：publish() 返回值与实际写出的字节数一致（含中文负载），
+    # QoS 1 每次发布都等到 PUBACK，断开重连后 connect() 重新订阅
+    for qos in (0, 1):
+        link = transport.BemfaMQTT('check%d' % qos, host, MQTT_PORT, keepalive=0, qos=qos, clean_session=True)
+        link.subscribe(TOPIC)
+        link.connect()
+        client = link.client
+        msgs = ('tapon', '#24.5#62.3#741#989.0#203.70#已开启#', 'x' * 200)
+        for msg in msgs:
+            n = link.publish(TOPIC, msg)
+            if hasattr(client, 'tx_bytes'):
+                assert n == client.tx_bytes, (qos, msg, n, client.tx_bytes)
+            assert _wait_for(link, msg), (qos, msg)
+        if hasattr(client, 'pubacks'):
+            assert client.pubacks == (len(msgs) if qos else 0), client.pubacks
+        link.close()
+        link.connect()
+        link.publish(TOPIC, 'resubscribed')
+        assert _wait_for(link, 'resubscribed'), 'no resubscribe after reconnect (qos %d)' % qos
+        link.close()
+    print('mqtt       checks ok (publish_size, QoS 1 PUBACK, resubscribe on reconnect)')
+
+
+def run(host=HOST):
+    bench('tcp', transport.BemfaTCP('bench', host, TCP_PORT, keepalive=0))
+    for qos in (0, 1):
+        try:
+            link = transport.BemfaMQTT('bench', host, MQTT_PORT, keepalive=0, qos=qos, clean_session=True)
+            bench('mqtt-qos%d' % qos, link)
+        except ImportError:
+            print('mqtt-qos%d  skipped (umqtt.simple not available)' % qos)
+            return
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(sys.argv[1])
+    else:
+        import asyncio
+        import threading
+        import mock_broker
+        import mock_umqtt
+
+        mock_umqtt.install()
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(mock_broker.serve('127.0.0.1', TCP_PORT, MQTT_PORT))
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        check_mqtt('127.0.0.1')
+        run('127.0.0.1')
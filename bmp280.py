@@ -1,28 +1,84 @@
+import struct
+
+try:
+    from micropython import const
+except ImportError:
+    # allows the compensation code to be imported on the host
+    def const(x):
+        return x
+
 BMP280_I2C_ADDR = const(0x76)
 
+
+# Integer compensation from the BMP280 datasheet, shared with the host-side
+# batch implementation in bmp280_np.py. cal is the 12 calibration words
+# (dig_T1..dig_P9). Returns (temperature in 0.01 degC, pressure in Pa); the
+# pressure is None when the calibration would divide by zero. When out (a
+# 2-element list) is given the results are stored there instead of in a new tuple.
+def compensate(cal, adc_T, adc_P, out=None):
+    dig_T1, dig_T2, dig_T3, dig_P1, dig_P2, dig_P3, dig_P4, dig_P5, dig_P6, dig_P7, dig_P8, dig_P9 = cal
+    var1 = (((adc_T>>3)-(dig_T1<<1))*dig_T2)>>11
+    var2 = (((((adc_T>>4)-dig_T1)*((adc_T>>4) - dig_T1))>>12)*dig_T3)>>14
+    t = var1+var2
+    T = (t * 5 + 128) >> 8
+    var1 = (t>>1) - 64000
+    var2 = (((var1>>2) * (var1>>2)) >> 11 ) * dig_P6
+    var2 = var2 + ((var1*dig_P5)<<1)
+    var2 = (var2>>2)+(dig_P4<<16)
+    var1 = (((dig_P3*((var1>>2)*(var1>>2))>>13)>>3) + (((dig_P2) * var1)>>1))>>18
+    var1 = ((32768+var1)*dig_P1)>>15
+    if var1 == 0:
+        p = None  # avoid exception caused by division by zero
+        if out is None:
+            return T, p
+        out[0] = T
+        out[1] = p
+        return out
+    p=((1048576-adc_P)-(var2>>12))*3125
+    if p < 0x80000000:
+        p = (p << 1) // var1
+    else:
+        p = (p // var1) * 2
+    var1 = (dig_P9 * (((p>>3)*(p>>3))>>13))>>12
+    var2 = (((p>>2)) * dig_P8)>>13
+    p = p + ((var1 + var2 + dig_P7) >> 4)
+    if out is None:
+        return T, p
+    out[0] = T
+    out[1] = p
+    return out
+
+
 class BMP280():
-    def __init__(self, i2c):
+    def __init__(self, i2c, addr=BMP280_I2C_ADDR, filter=3):
         self.i2c = i2c
-        self.dig_T1 = self.get2Reg(0x88)
-        self.dig_T2 = self.short(self.get2Reg(0x8A))
-        self.dig_T3 = self.short(self.get2Reg(0x8C))
-        self.dig_P1 = self.get2Reg(0x8E)
-        self.dig_P2 = self.short(self.get2Reg(0x90))
-        self.dig_P3 = self.short(self.get2Reg(0x92))
-        self.dig_P4 = self.short(self.get2Reg(0x94))
-        self.dig_P5 = self.short(self.get2Reg(0x96))
-        self.dig_P6 = self.short(self.get2Reg(0x98))
-        self.dig_P7 = self.short(self.get2Reg(0x9A))
-        self.dig_P8 = self.short(self.get2Reg(0x9C))
-        self.dig_P9 = self.short(self.get2Reg(0x9E))
+        self.addr = addr
+        # calibration 0x88..0x9F in one burst read
+        cal = bytearray(24)
+        self.i2c.readfrom_mem_into(self.addr, 0x88, cal)
+        self.cal = struct.unpack('<HhhHhhhhhhhh', cal)
+        (self.dig_T1, self.dig_T2, self.dig_T3,
+         self.dig_P1, self.dig_P2, self.dig_P3, self.dig_P4, self.dig_P5,
+         self.dig_P6, self.dig_P7, self.dig_P8, self.dig_P9) = self.cal
+        # preallocated buffers, so steady-state reads allocate no containers
+        self.buf = bytearray(6)
+        self.reg = bytearray(2)
+        self.reg1 = memoryview(self.reg)[:1]
+        self.raw = [0, None]
+        self.result = [0, 0]
         self.mode = 3
         self.osrs_p = 3
         self.osrs_t = 1
-        self.setReg(0xF4, 0x2F)
-        self.setReg(0xF5, 0x0C)
-        self.filter = 3
+        self.filter = filter
+        # ctrl_meas and config written as register/data pairs in one transaction
+        self.i2c.writeto(self.addr, bytearray([0xF4, 0x2F, 0xF5, self.filter << 2]))
         self.T = 0
         self.P = 0
+        self.t = None
+        self.alt_P = None
+        self.alt = None
+        self.adc_T = 0
+        self.adc_P = 0
         self.version = '1.0'
 
     def	short(self,	dat):
@@ -33,44 +89,42 @@ class BMP280():
 	
     # set reg
     def	setReg(self, reg, dat):
-        self.i2c.writeto(BMP280_I2C_ADDR, bytearray([reg, dat]))
+        self.reg[0] = reg
+        self.reg[1] = dat
+        self.i2c.writeto(self.addr, self.reg)
 		
     # get reg
     def	getReg(self, reg):
-        self.i2c.writeto(BMP280_I2C_ADDR, bytearray([reg]))
-        t =	self.i2c.readfrom(BMP280_I2C_ADDR, 1)
-        return t[0]
+        self.i2c.readfrom_mem_into(self.addr, reg, self.reg1)
+        return self.reg[0]
 	
     # get two reg
     def	get2Reg(self, reg):
-        self.i2c.writeto(BMP280_I2C_ADDR, bytearray([reg]))
-        t =	self.i2c.readfrom(BMP280_I2C_ADDR, 2)
+        t =	self.reg
+        self.i2c.readfrom_mem_into(self.addr, reg, t)
         return t[0] + t[1]*256
 
     def get(self):
-        adc_T = (self.getReg(0xFA)<<12) + (self.getReg(0xFB)<<4) + (self.getReg(0xFC)>>4)
-        var1 = (((adc_T>>3)-(self.dig_T1<<1))*self.dig_T2)>>11
-        var2 = (((((adc_T>>4)-self.dig_T1)*((adc_T>>4) - self.dig_T1))>>12)*self.dig_T3)>>14
-        t = var1+var2
-        self.T = ((t * 5 + 128) >> 8)/100
-        var1 = (t>>1) - 64000
-        var2 = (((var1>>2) * (var1>>2)) >> 11 ) * self.dig_P6
-        var2 = var2 + ((var1*self.dig_P5)<<1)
-        var2 = (var2>>2)+(self.dig_P4<<16)
-        var1 = (((self.dig_P3*((var1>>2)*(var1>>2))>>13)>>3) + (((self.dig_P2) * var1)>>1))>>18
-        var1 = ((32768+var1)*self.dig_P1)>>15
-        if var1 == 0:
-            return  # avoid exception caused by division by zero
-        adc_P = (self.getReg(0xF7)<<12) + (self.getReg(0xF8)<<4) + (self.getReg(0xF9)>>4)
-        p=((1048576-adc_P)-(var2>>12))*3125
-        if p < 0x80000000:
-            p = (p << 1) // var1
-        else:
-            p = (p // var1) * 2
-        var1 = (self.dig_P9 * (((p>>3)*(p>>3))>>13))>>12
-        var2 = (((p>>2)) * self.dig_P8)>>13
-        self.P = p + ((var1 + var2 + self.dig_P7) >> 4)
-        return [self.T, self.P]
+        # press_msb..temp_xlsb (0xF7..0xFC) in one burst read, so T and P come from the same conversion
+        b = self.buf
+        self.i2c.readfrom_mem_into(self.addr, 0xF7, b)
+        adc_P = (b[0]<<12) + (b[1]<<4) + (b[2]>>4)
+        adc_T = (b[3]<<12) + (b[4]<<4) + (b[5]>>4)
+        # raw values are kept so they can be logged and reprocessed on the host
+        self.adc_T = adc_T
+        self.adc_P = adc_P
+        r = compensate(self.cal, adc_T, adc_P, self.raw)
+        if r[0] != self.t:
+            self.t = r[0]
+            self.T = r[0]/100
+        if r[1] is None:
+            return
+        self.P = r[1]
+        # the same list is returned on every call
+        res = self.result
+        res[0] = self.T
+        res[1] = self.P
+        return res
 
     # get Temperature in Celsius
     def getTemp(self):
@@ -84,7 +138,12 @@ class BMP280():
 
     # Calculating absolute altitude
     def	getAltitude(self):
-        return '%.2f'%(44330*(1-(self.getPress()/101325)**(1/5.256)))
+        P = self.getPress()
+        # the formatted string is only rebuilt when the pressure changes
+        if P != self.alt_P:
+            self.alt_P = P
+            self.alt = '%.2f'%(44330*(1-(P/101325)**(1/5.256)))
+        return self.alt
 
     # sleep mode
     def poweroff(self):
@@ -94,3 +153,8 @@ class BMP280():
     def poweron(self):
         self.setReg(0xF4, 0x2F)
 
+    # IIR filter coefficient code: 0=off, 1=2, 2=4, 3=8, 4=16 (config register bits 4:2)
+    def set_filter(self, code):
+        self.filter = code & 0x07
+        self.setReg(0xF5, self.filter << 2)
+
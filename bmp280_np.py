@@ -0,0 +1,143 @@
+# BMP280 批量补偿（上位机，NumPy）：对原始 adc_T/adc_P 数组重放设备端整数补偿算法
+# compensate() 与 bmp280.compensate() 逐位一致（int64 运算，>> 与 // 的取整方式与 Python 整数相同），
+# altitude() 按设备的单精度浮点公式批量计算海拔。
+#
+# 原始数据文件格式（文本）:
+#   cal,<dig_T1>,<dig_T2>,...,<dig_P9>      校准参数行，可出现多次（换传感器/重新校准）
+#   <timestamp>,<adc_T>,<adc_P>             之后的原始采样行
+#
+# 用法:
+#   python bmp280_np.py raw.csv                 重放文件并输出 时间戳,温度,气压,海拔
+#   python bmp280_np.py --bench 10000000        与标量驱动路径对比速度并逐位校验
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import bmp280
+
+# 数据手册示例校准参数，用于基准测试
+DATASHEET_CAL = (27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000)
+
+
+def compensate(cal, adc_T, adc_P):
+    # 返回 (温度 0.01°C 整数数组, 气压 Pa 整数数组, 有效掩码)；除零的样本气压为 0 且掩码为 False
+    adc_T = np.asarray(adc_T, dtype=np.int64)
+    adc_P = np.asarray(adc_P, dtype=np.int64)
+    dig_T1, dig_T2, dig_T3, dig_P1, dig_P2, dig_P3, dig_P4, dig_P5, dig_P6, dig_P7, dig_P8, dig_P9 = (
+        np.int64(v) for v in cal)
+    var1 = (((adc_T >> 3) - (dig_T1 << 1)) * dig_T2) >> 11
+    var2 = (((((adc_T >> 4) - dig_T1) * ((adc_T >> 4) - dig_T1)) >> 12) * dig_T3) >> 14
+    t = var1 + var2
+    T = (t * 5 + 128) >> 8
+    var1 = (t >> 1) - 64000
+    var2 = (((var1 >> 2) * (var1 >> 2)) >> 11) * dig_P6
+    var2 = var2 + ((var1 * dig_P5) << 1)
+    var2 = (var2 >> 2) + (dig_P4 << 16)
+    var1 = (((dig_P3 * ((var1 >> 2) * (var1 >> 2)) >> 13) >> 3) + ((dig_P2 * var1) >> 1)) >> 18
+    var1 = ((32768 + var1) * dig_P1) >> 15
+    valid = var1 != 0
+    var1 = np.where(valid, var1, 1)
+    p = ((1048576 - adc_P) - (var2 >> 12)) * 3125
+    p = np.where(p < 0x80000000, (p << 1) // var1, (p // var1) * 2)
+    var1 = (dig_P9 * (((p >> 3) * (p >> 3)) >> 13)) >> 12
+    var2 = ((p >> 2) * dig_P8) >> 13
+    P = p + ((var1 + var2 + dig_P7) >> 4)
+    return T, np.where(valid, P, 0), valid
+
+
+def temperature(T):
+    # 与设备端 self.T = T/100 相同的摄氏度数值
+    return np.asarray(T) / 100
+
+
+def altitude(P, dtype=np.float32):
+    # 设备端 getAltitude 的公式；MicroPython(ESP32) 使用单精度浮点，默认按 float32 计算
+    P = np.asarray(P, dtype=dtype)
+    return dtype(44330) * (dtype(1) - (P / dtype(101325)) ** (dtype(1) / dtype(5.256)))
+
+
+def altitude_str(P):
+    # 与 getAltitude() 返回的 '%.2f' 字符串一致
+    return np.char.mod('%.2f', altitude(P).astype(np.float64))
+
+
+def load_raw(path):
+    # 读取原始数据文件，返回 [(cal, timestamps, adc_T, adc_P), ...]，每段对应一组校准参数
+    segments = []
+    cal, rows = None, []
+
+    def flush():
+        if cal is not None and rows:
+            data = np.array(rows, dtype=np.float64)
+            segments.append((cal, data[:, 0], data[:, 1].astype(np.int64), data[:, 2].astype(np.int64)))
+
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line.startswith('cal,'):
+                flush()
+                cal = tuple(int(v) for v in line.split(',')[1:13])
+                rows = []
+            else:
+                rows.append([float(v) for v in line.split(',')[:3]])
+    flush()
+    return segments
+
+
+def replay(path, out=sys.stdout):
+    out.write('timestamp,temp_c,pressure_pa,altitude_m\n')
+    for cal, ts, adc_T, adc_P in load_raw(path):
+        T, P, valid = compensate(cal, adc_T, adc_P)
+        alt = altitude_str(P)
+        for i in np.flatnonzero(valid):
+            out.write('%r,%.2f,%d,%s\n' % (float(ts[i]), T[i] / 100, P[i], alt[i]))
+
+
+def bench(n, scalar_n=None, seed=0):
+    rng = np.random.default_rng(seed)
+    # 在数据手册示例附近随机生成原始值（约 -10..45 °C, 800..1100 hPa）
+    adc_T = rng.integers(470000, 560000, n, dtype=np.int64)
+    adc_P = rng.integers(250000, 480000, n, dtype=np.int64)
+    cal = DATASHEET_CAL
+
+    start = time.perf_counter()
+    T, P, valid = compensate(cal, adc_T, adc_P)
+    alt = altitude(P)
+    vec_s = time.perf_counter() - start
+
+    scalar_n = n if scalar_n is None else min(scalar_n, n)
+    ts_list, ps_list = adc_T[:scalar_n].tolist(), adc_P[:scalar_n].tolist()
+    start = time.perf_counter()
+    ref = [bmp280.compensate(cal, t, p) for t, p in zip(ts_list, ps_list)]
+    scalar_s = time.perf_counter() - start
+
+    ref_T = np.fromiter((r[0] for r in ref), dtype=np.int64, count=scalar_n)
+    ref_P = np.fromiter((0 if r[1] is None else r[1] for r in ref), dtype=np.int64, count=scalar_n)
+    mismatches = int(np.count_nonzero(ref_T != T[:scalar_n]) + np.count_nonzero(ref_P != P[:scalar_n]))
+
+    print('samples          %d (scalar reference on %d)' % (n, scalar_n))
+    print('numpy batch      %.3f s  %.1f M samples/s  (incl. altitude, %d values)' % (
+        vec_s, n / vec_s / 1e6, alt.size))
+    print('scalar driver    %.3f s  %.3f M samples/s' % (scalar_s, scalar_n / scalar_s / 1e6))
+    print('speedup          %.0fx' % ((scalar_s / scalar_n) / (vec_s / n)))
+    print('bit mismatches   %d' % mismatches)
+    return mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Vectorized BMP280 compensation for raw-data replay')
+    parser.add_argument('raw', nargs='?', help='raw data file to reprocess')
+    parser.add_argument('--bench', type=int, metavar='N', help='benchmark against the scalar driver path')
+    parser.add_argument('--scalar-samples', type=int, default=None,
+                        help='limit the scalar reference run (default: all N samples)')
+    args = parser.parse_args()
+    if args.bench:
+        sys.exit(1 if bench(args.bench, args.scalar_samples) else 0)
+    elif args.raw:
+        replay(args.raw)
+    else:
+        parser.print_help()
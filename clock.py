@@ -0,0 +1,194 @@
+# 时钟抽象：控制逻辑通过本模块取时间和延时，重放时可替换为虚拟时钟
+# 设备上默认直接转发到 time 模块；replay.py 调用 use(VirtualClock()) 后，
+# time()/sleep() 只推进虚拟时间，一天的运行可以在几秒内重放完。
+#
+# 时间戳：采样时只记 ticks_ms()（小整数，不分配内存），需要绝对时间时用 epoch_ms(ticks)
+# 换算成 UTC 毫秒。换算以最近一次 NTP 同步为锚点：sync() 记下收到应答时的 ticks_ms
+# 与服务器时间，之后的毫秒数按 ticks 差值推算，不依赖只有秒分辨率的 RTC。
+# ticks 约 12.4 天回绕一次，差值只在 ±6.2 天内有效，因此需要定期调用 sync()。
+import struct
+import time as _time
+
+try:
+    from time import ticks_ms as _ticks_ms, ticks_diff as _ticks_diff, sleep_ms as _sleep_ms
+except ImportError:
+    def _ticks_ms():
+        return int(_time.monotonic() * 1000) & 0x3FFFFFFF
+
+    def _ticks_diff(a, b):
+        return ((a - b + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+
+    def _sleep_ms(ms):
+        _time.sleep(ms / 1000)
+
+NTP_DELTA = 2208988800            # 1900-01-01 到 1970-01-01 的秒数
+# 设备 time() 的纪元：部分 MicroPython 端口从 2000-01-01 起算
+EPOCH_OFFSET = 946684800 if _time.gmtime(0)[0] == 2000 else 0
+_STALE_MS = 0x10000000            # 约 3.1 天未同步时改以 RTC 为锚点，避免 ticks 差值失效
+
+
+def _ntp_query(host, timeout_ms):
+    # SNTP 请求，返回 (UTC 毫秒, 收到应答时的 ticks_ms)；服务器时间加上往返时间的一半
+    import socket
+    addr = socket.getaddrinfo(host, 123)[0][-1]
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        s.settimeout(timeout_ms / 1000)
+        packet = bytearray(48)
+        packet[0] = 0x1B              # LI=0, VN=3, Mode=3（客户端）
+        t0 = _ticks_ms()
+        s.sendto(packet, addr)
+        data = s.recv(48)
+        t1 = _ticks_ms()
+    finally:
+        s.close()
+    if len(data) < 48:
+        raise OSError('short NTP reply')
+    sec, frac = struct.unpack_from('!II', data, 40)
+    if not sec:
+        raise OSError('NTP server not synchronised')
+    return (sec - NTP_DELTA) * 1000 + ((frac * 1000) >> 32) + _ticks_diff(t1, t0) // 2, t1
+
+
+class SystemClock:
+    def time(self):
+        return _time.time()
+
+    def ticks_ms(self):
+        return _ticks_ms()
+
+    def sleep(self, s):
+        _time.sleep(s)
+
+    def sleep_ms(self, ms):
+        _sleep_ms(ms)
+
+    def ntp(self, host, timeout_ms):
+        return _ntp_query(host, timeout_ms)
+
+    def set_rtc(self, epoch_ms):
+        # 设备上同时校准 RTC，localtime() 随之正确（UTC）；上位机不改系统时间
+        try:
+            import machine
+        except ImportError:
+            return
+        t = _time.gmtime(epoch_ms // 1000 - EPOCH_OFFSET)
+        machine.RTC().datetime((t[0], t[1], t[2], t[6] + 1, t[3], t[4], t[5], 0))
+
+
+class VirtualClock:
+    # now 为浮点秒；time() 与 MicroPython 一样返回整数秒
+    def __init__(self, start=0):
+        self.now = start
+
+    def time(self):
+        return int(self.now)
+
+    def ticks_ms(self):
+        return int(self.now * 1000) & 0x3FFFFFFF
+
+    def sleep(self, s):
+        self.now += s
+
+    def sleep_ms(self, ms):
+        self.now += ms / 1000
+
+    def advance_to(self, t):
+        # 只前进不后退
+        if t > self.now:
+            self.now = t
+
+    def ntp(self, host, timeout_ms):
+        return int(self.now * 1000), self.ticks_ms()
+
+    def set_rtc(self, epoch_ms):
+        pass
+
+
+_clock = SystemClock()
+_anchor_ticks = 0
+_anchor_ms = None                 # 最近一次同步得到的 UTC 毫秒，None 表示尚未同步
+_last_attempt = None
+_correction = 0
+
+
+def use(clock):
+    global _clock
+    _clock = clock
+    return clock
+
+
+def current():
+    return _clock
+
+
+def time():
+    return _clock.time()
+
+
+def ticks_ms():
+    return _clock.ticks_ms()
+
+
+def sleep(s):
+    _clock.sleep(s)
+
+
+def sleep_ms(ms):
+    _clock.sleep_ms(ms)
+
+
+def ticks_diff(a, b):
+    return _ticks_diff(a, b)
+
+
+def elapsed_ms(since):
+    # 距 since（ticks_ms 值）的毫秒数；回绕导致为负时按很久以前处理
+    d = _ticks_diff(_clock.ticks_ms(), since)
+    return d if d >= 0 else 0x1FFFFFFF
+
+
+def sync(host='pool.ntp.org', timeout_ms=1000):
+    # 向 NTP 服务器对时并更新锚点，成功返回 True
+    global _anchor_ticks, _anchor_ms, _last_attempt, _correction
+    _last_attempt = _clock.ticks_ms()
+    try:
+        ms, ticks = _clock.ntp(host, timeout_ms)
+    except (OSError, IndexError):
+        return False
+    if _anchor_ms is not None:
+        _correction = ms - epoch_ms(ticks)
+    _anchor_ticks, _anchor_ms = ticks, ms
+    _clock.set_rtc(ms)
+    return True
+
+
+def sync_due(interval, retry=60):
+    # 是否该重新对时：已同步时每 interval 秒一次，未同步时每 retry 秒重试
+    global _anchor_ticks, _anchor_ms
+    if _last_attempt is None:
+        return True
+    if _anchor_ms is not None and elapsed_ms(_anchor_ticks) > _STALE_MS:
+        # 长期同步失败：以（同步过的）RTC 重新建立锚点，精度降为秒
+        _anchor_ticks = _clock.ticks_ms()
+        _anchor_ms = (int(_clock.time()) + EPOCH_OFFSET) * 1000
+    return elapsed_ms(_last_attempt) >= (interval if _anchor_ms is not None else retry) * 1000
+
+
+def synced():
+    return _anchor_ms is not None
+
+
+def last_correction():
+    # 最近一次同步时本地推算时间与服务器时间之差（毫秒），反映晶振漂移
+    return _correction
+
+
+def epoch_ms(ticks=None):
+    # ticks_ms 时间戳换算为 UTC 毫秒；未同步时以本地 RTC 为准
+    now = _clock.ticks_ms()
+    if ticks is None:
+        ticks = now
+    if _anchor_ms is None:
+        return (int(_clock.time()) + EPOCH_OFFSET) * 1000 + _ticks_diff(ticks, now)
+    return _anchor_ms + _ticks_diff(ticks, _anchor_ticks)
@@ -0,0 +1,238 @@
+# 控制决策：龙头、蜂鸣器与手动锁定的状态机，纯函数 step() 每轮调用一次
+#
+# 优先级（高到低）：温度超上限 > 远程命令 > 按键 > 自动控制
+# - 状态是一个 array('i') 记录（见 new_state），step() 只读写这一记录，不访问引脚、全局变量或时钟，
+#   同样的记录与输入总是得到同样的输出，上位机可以大量随机生成场景检查不变量（python control.py）
+# - 每轮输入：now（ticks_ms）、温度分类（T_OK/T_HOT/T_UNKNOWN）、本轮收到的远程命令与按键命令
+# - 输出是一个整数掩码：龙头/蜂鸣器电平、是否需要驱动蜂鸣器、是否播放手动报警，以及本轮决定龙头的规则
+# - 命令与仲裁都查表完成（COMMANDS、ARBITER），每轮 O(1)，不分配内存
+#
+# 远程命令与按键都受切换间隔（lock_ms）限制；切换龙头的命令开始 hold_ms 的手动锁定，
+# 锁定期间自动控制不改变龙头，温度超上限时仍强制打开。锁定与间隔到期后清除标志，
+# 之后不再比较 ticks，ticks 回绕不会让过期的锁定重新生效。
+from array import array
+
+# 状态记录的字段
+TAP = 0          # 龙头 1=开
+BUZZER = 1       # 蜂鸣器状态（报警标志，上报用）
+HOLD = 2         # 手动锁定是否有效
+HOLD_T = 3       # 锁定开始的 ticks_ms
+LOCK = 4         # 切换间隔是否未到
+LOCK_T = 5       # 上次切换的 ticks_ms
+HOLD_MS = 6
+LOCK_MS = 7
+FIELDS = 8
+
+# 温度分类（由调用方根据读数与阈值给出）
+T_OK = 0         # 两个站点都有读数且不超上限
+T_HOT = 1        # 任一站点超上限
+T_UNKNOWN = 2    # 有站点没有读数（按需要浇水处理）
+
+# 命令码：1-4 为远程命令，5-6 为按键
+C_NONE = 0
+C_TAP_ON = 1
+C_TAP_OFF = 2
+C_BUZZER_ON = 3
+C_BUZZER_OFF = 4
+K_SWITCH = 5
+K_BUZZER = 6
+
+# 操作：KEEP/ON/OFF/TOGGLE，新值 = _OP[操作 * 2 + 旧值]
+KEEP = 0
+ON = 1
+OFF = 2
+TOGGLE = 3
+_OP = bytes((0, 1, 1, 1, 0, 0, 1, 0))
+
+# 命令标志
+F_HOLD = 1       # 开始手动锁定
+F_LOCK = 2       # 开始切换间隔
+F_BEEP = 4       # 打开蜂鸣器时播放手动报警音
+
+# 命令表：命令码 -> (龙头操作, 蜂鸣器操作, 标志)
+# 不改变任何状态的命令不生效；带 F_HOLD 的命令除外，龙头已处于目标状态时也开始手动锁定，
+# 否则自动控制会在下一轮把它改回去
+COMMANDS = (
+    (KEEP, KEEP, 0),                    # C_NONE
+    (ON, KEEP, F_HOLD | F_LOCK),        # C_TAP_ON
+    (OFF, KEEP, F_HOLD | F_LOCK),       # C_TAP_OFF
+    (KEEP, ON, 0),                      # C_BUZZER_ON
+    (KEEP, OFF, 0),                     # C_BUZZER_OFF
+    (TOGGLE, KEEP, F_HOLD | F_LOCK),    # K_SWITCH
+    (KEEP, TOGGLE, F_LOCK | F_BEEP),    # K_BUZZER
+)
+
+# 决定龙头的规则
+R_AUTO = 0
+R_HOLD = 1
+R_FORCED = 2
+REASONS = ('auto', 'hold', 'forced')
+
+# 仲裁表：温度分类 * 2 + 是否锁定 -> (龙头操作, 蜂鸣器操作, 规则)
+ARBITER = (
+    (OFF, KEEP, R_AUTO),        # T_OK
+    (KEEP, KEEP, R_HOLD),       # T_OK，锁定中
+    (ON, ON, R_FORCED),         # T_HOT
+    (ON, ON, R_FORCED),         # T_HOT，锁定中
+    (ON, ON, R_AUTO),           # T_UNKNOWN
+    (KEEP, KEEP, R_HOLD),       # T_UNKNOWN，锁定中
+)
+
+# 输出掩码
+O_TAP = 1        # 龙头电平
+O_BUZZER = 2     # 蜂鸣器状态
+O_DRIVE = 4      # 命令改变了蜂鸣器，需要按 O_BUZZER 设置 PWM
+O_BEEP = 8       # 播放手动报警音
+O_REMOTE = 16    # 本轮远程命令已生效
+O_KEY = 32       # 本轮按键命令已生效
+REASON_SHIFT = 6
+
+
+def new_state(hold_ms=30000, lock_ms=2000):
+    s = array('i', bytes(4 * FIELDS))
+    s[HOLD_MS] = hold_ms
+    s[LOCK_MS] = lock_ms
+    return s
+
+
+def _elapsed(now, since):
+    # 与 clock.elapsed_ms 相同：ticks 差值，回绕导致为负时按很久以前处理
+    d = ((now - since + 0x20000000) & 0x3FFFFFFF) - 0x20000000
+    return d if d >= 0 else 0x1FFFFFFF
+
+
+def _command(s, now, cmd, applied):
+    # 执行一条命令，生效时返回 applied 及蜂鸣器输出位，不生效返回 0
+    if s[LOCK]:
+        return 0
+    tap_op, buzzer_op, flags = COMMANDS[cmd]
+    tap = _OP[tap_op * 2 + s[TAP]]
+    buzzer = _OP[buzzer_op * 2 + s[BUZZER]]
+    if tap == s[TAP] and buzzer == s[BUZZER] and not flags & F_HOLD:
+        return 0
+    out = applied | O_DRIVE if buzzer != s[BUZZER] else applied
+    if flags & F_BEEP and buzzer:
+        out |= O_BEEP
+    s[TAP] = tap
+    s[BUZZER] = buzzer
+    if flags & F_HOLD:
+        s[HOLD] = 1
+        s[HOLD_T] = now
+    if flags & F_LOCK:
+        s[LOCK] = 1
+        s[LOCK_T] = now
+    return out
+
+
+def step(s, now, temp, remote=C_NONE, key=C_NONE):
+    out = 0
+    if s[LOCK] and _elapsed(now, s[LOCK_T]) >= s[LOCK_MS]:
+        s[LOCK] = 0
+    if s[HOLD] and _elapsed(now, s[HOLD_T]) >= s[HOLD_MS]:
+        s[HOLD] = 0
+    # 远程命令先于按键：远程切换龙头后切换间隔开始，同一轮的按键不再生效
+    if remote:
+        out = _command(s, now, remote, O_REMOTE)
+    if key:
+        out |= _command(s, now, key, O_KEY)
+    tap_op, buzzer_op, reason = ARBITER[temp * 2 + s[HOLD]]
+    s[TAP] = _OP[tap_op * 2 + s[TAP]]
+    s[BUZZER] = _OP[buzzer_op * 2 + s[BUZZER]]
+    return out | s[TAP] | s[BUZZER] << 1 | reason << REASON_SHIFT
+
+
+def reason(out):
+    return out >> REASON_SHIFT
+
+
+def hold_left(s, now):
+    # 手动锁定剩余毫秒数，未锁定为 0
+    return max(s[HOLD_MS] - _elapsed(now, s[HOLD_T]), 0) if s[HOLD] else 0
+
+
+def check(before, s, now, temp, remote, key, out):
+    # 一步转移应满足的不变量，返回违反的描述（满足时为 None）
+    tap0 = before[TAP]
+    applied = out & (O_REMOTE | O_KEY)
+    if (out & O_TAP) != s[TAP] or (out >> 1 & 1) != s[BUZZER]:
+        return 'output does not match state'
+    if temp == T_HOT:
+        if not s[TAP] or not s[BUZZER] or reason(out) != R_FORCED:
+            return 'over-temperature did not force tap and buzzer on'
+        return None
+    if s[HOLD]:
+        if not 0 <= _elapsed(now, s[HOLD_T]) < s[HOLD_MS]:
+            return 'manual hold outlived hold_ms'
+        if not applied and s[TAP] != tap0:
+            return 'tap changed during manual hold without a command'
+        if reason(out) != R_HOLD:
+            return 'hold active but reason is %s' % REASONS[reason(out)]
+    elif s[TAP] != (temp != T_OK) or reason(out) != R_AUTO:
+        return 'auto control did not follow temperature'
+    if s[LOCK] and not 0 <= _elapsed(now, s[LOCK_T]) < s[LOCK_MS]:
+        return 'switch lockout outlived lock_ms'
+    if applied and before[LOCK] and _elapsed(now, before[LOCK_T]) < before[LOCK_MS]:
+        return 'command accepted inside the switch lockout'
+    if out & O_KEY and out & O_REMOTE and COMMANDS[remote][2] & F_LOCK:
+        return 'key accepted in the same tick as a remote tap command'
+    if out & O_KEY and key == K_SWITCH and not s[HOLD]:
+        return 'key switch did not start a manual hold'
+    if out & O_KEY and key == K_SWITCH and not out & O_REMOTE and s[TAP] == tap0:
+        return 'key switch did not toggle the tap'
+    if remote in (C_TAP_ON, C_TAP_OFF) and s[TAP] != (remote == C_TAP_ON) and (
+            not before[LOCK] or _elapsed(now, before[LOCK_T]) >= before[LOCK_MS]):
+        return 'remote tap command ignored outside the lockout'
+    return None
+
+
+if __name__ == '__main__':
+    # 上位机运行：随机场景检查不变量
+    #   python control.py [--scenarios N] [--ticks T] [--seed S]
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description='Randomized invariant check of control.step()')
+    parser.add_argument('--scenarios', type=int, default=200000)
+    parser.add_argument('--ticks', type=int, default=16, help='steps per scenario')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    getrandbits = rng.getrandbits
+    # 时间步长：多数为一轮循环的间隔，少数为长时间停顿（接近 ticks 半周期）
+    GAPS = (0, 50, 100, 100, 100, 250, 500, 1000, 1500, 1999, 2000, 2500, 5000, 29999, 30000, 0x1FFFFFF0)
+    TEMPS = (T_OK, T_OK, T_HOT, T_UNKNOWN)
+    REMOTES = (C_NONE, C_TAP_ON, C_TAP_OFF, C_BUZZER_ON, C_BUZZER_OFF, C_NONE, C_NONE, C_NONE)
+    violations = []
+    steps = 0
+    t0 = time.perf_counter()
+    for n in range(args.scenarios):
+        seed = getrandbits(32)
+        r = random.Random(seed).getrandbits
+        s = new_state(1000 + r(16), 500 + r(12))
+        now = r(30)
+        for _ in range(args.ticks):
+            bits = r(32)
+            now = (now + GAPS[bits & 15]) & 0x3FFFFFFF
+            temp = TEMPS[bits >> 4 & 3]
+            remote = REMOTES[bits >> 6 & 7] if bits & 0x600 == 0 else C_NONE
+            key = (K_SWITCH, K_BUZZER)[bits >> 11 & 1] if bits & 0x7000 == 0 else C_NONE
+            before = s[:]
+            out = step(s, now, temp, remote, key)
+            steps += 1
+            again = before[:]
+            if step(again, now, temp, remote, key) != out or again != s:
+                err = 'step is not deterministic'
+            else:
+                err = check(before, s, now, temp, remote, key, out)
+            if err:
+                violations.append((seed, err, list(before), now, temp, remote, key))
+                break
+    dt = time.perf_counter() - t0
+    print('%d scenarios, %d steps in %.1f s (%.0f scenarios/min, %.2f us/step incl. checks)' % (
+        args.scenarios, steps, dt, args.scenarios / dt * 60, dt / steps * 1e6))
+    for seed, err, before, now, temp, remote, key in violations[:10]:
+        print('VIOLATION seed=%d: %s (state %s, now=%d temp=%d remote=%d key=%d)' % (
+            seed, err, before, now, temp, remote, key))
+    raise SystemExit(1 if violations else 0)
@@ -0,0 +1,105 @@
+# 设备 CSV 日志（main.save_to_csv 写出的 /sensor1_test.csv、/sensor2_test.csv）的上位机读取
+#
+# 文件格式（文本，每次启动追加一段）:
+#   Delta(ms),Temp(C),Hum(%),Lux,Pressure(hPa),Height(m),Tap_Status,Buzzer_On    表头
+#   #base_ms=<首行 UTC 毫秒>,synced=<0/1>                                        本段基准时间
+#   <距上一行毫秒数>,<温度>,<湿度>,<光照>,<气压>,<海拔>,<水阀>,<蜂鸣器>            数据行，首行为 0
+# synced=0 表示写入时尚未完成 SNTP 同步，基准时间取自设备 RTC，可能不准。
+# 缺失的读数写作 N/A，读出为 None。
+#
+# 用法:
+#   python csvlog.py sensor1_test.csv [...]     输出 UTC 时间,synced,各列
+#   python csvlog.py                            自检
+import sys
+import time
+
+FIELDS = ('temp', 'hum', 'lux', 'pressure', 'height', 'tap', 'buzzer')
+
+
+def _value(text):
+    if text == 'N/A':
+        return None
+    return float(text)
+
+
+def _parse_base(line):
+    # '#base_ms=1760000000000,synced=1' -> (1760000000000, True)
+    items = dict(item.split('=', 1) for item in line[1:].split(','))
+    return int(items['base_ms']), items.get('synced', '0') == '1'
+
+
+def read(lines):
+    # 逐行还原绝对时间，产生 (utc_ms, synced, {字段: 值})；
+    # 每遇到 #base_ms 行重新开始累加，出现在任何 #base_ms 之前的行（旧格式）以及无法解析的行跳过
+    base = None
+    synced = False
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('Delta('):
+            continue
+        if line.startswith('#'):
+            if line.startswith('#base_ms='):
+                try:
+                    base, synced = _parse_base(line)
+                except (ValueError, KeyError):
+                    base = None
+            continue
+        if base is None:
+            continue
+        parts = line.split(',')
+        try:
+            delta = int(parts[0])
+            values = [_value(v) for v in parts[1:]]
+        except ValueError:
+            continue
+        base += delta
+        yield base, synced, dict(zip(FIELDS, values))
+
+
+def load(path):
+    with open(path) as f:
+        return list(read(f))
+
+
+def iso(utc_ms):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(utc_ms // 1000)) + '.%03dZ' % (utc_ms % 1000)
+
+
+def convert(path, out=sys.stdout):
+    out.write('utc,synced,' + ','.join(FIELDS) + '\n')
+    for utc_ms, synced, row in load(path):
+        values = ('N/A' if row.get(k) is None else '%g' % row[k] for k in FIELDS)
+        out.write('%s,%d,%s\n' % (iso(utc_ms), synced, ','.join(values)))
+
+
+def _selftest():
+    header = 'Delta(ms),Temp(C),Hum(%),Lux,Pressure(hPa),Height(m),Tap_Status,Buzzer_On'
+    text = '\n'.join((
+        'Timestamp,Temp(C)',                      # 旧格式残留，跳过
+        '2025-01-01 00:00:00,20.0',
+        header,
+        '#base_ms=1760000000000,synced=0',
+        '0,24.5,62.3,741,989.0,203.7,0,0',
+        '5000,24.6,N/A,740,989.0,203.7,1,0',
+        'garbage',
+        header,                                   # 重启后的新一段
+        '#base_ms=1760000600000,synced=1',
+        '0,25.0,60.0,800,988.9,204.1,1,1',
+        '4999,25.1,60.1,801,988.9,204.1,1,0',
+    )).split('\n')
+    rows = list(read(text))
+    assert [(t, s) for t, s, _ in rows] == [
+        (1760000000000, False), (1760000005000, False),
+        (1760000600000, True), (1760000604999, True)], rows
+    assert rows[1][2]['hum'] is None and rows[1][2]['tap'] == 1.0
+    assert rows[2][2]['temp'] == 25.0 and rows[3][2]['buzzer'] == 0.0
+    assert iso(rows[3][0]) == '2025-10-09T09:03:24.999Z', iso(rows[3][0])
+    print('csvlog ok: %d rows from 2 sessions' % len(rows))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        for p in sys.argv[1:]:
+            convert(p)
+    else:
+        _selftest()
@@ -0,0 +1,510 @@
+# 上位机实时看板：持续读取节点数据，只重绘有变化的曲线（matplotlib blitting）
+# 用法:
+#   python dashboard.py data/                   跟踪网关日志目录中最新的 .log（类似 tail -f）
+#   python dashboard.py data/20260101.log       跟踪指定日志文件
+#   python dashboard.py serial:/dev/ttyUSB0     读取串口（需 pyserial，设备端设 ECHO_UPLINK = True）
+#   python dashboard.py tcp:127.0.0.1:8344      作为订阅者连接网关，接收各节点转发的数据
+#   python dashboard.py demo:4@0.1              4 个站点、每 0.1 秒一条的模拟数据（默认每秒一条）
+#   python dashboard.py demo:4 --bench 30       无界面运行 30 秒，报告 CPU 占用
+# 每个站点的数据保存在固定容量的 NumPy 环形缓冲中；坐标轴不变时只恢复背景并重画变化的曲线，
+# 时间轴滚动、纵轴需要扩展或阈值变化时才整图重绘。阈值带取自 main.py 的 *_LIMIT，
+# 收到阈值帧（temp3004）后随之更新。
+import argparse
+import ast
+import math
+import os
+import socket
+import time
+
+import matplotlib
+import numpy as np
+from matplotlib.collections import LineCollection
+from matplotlib.lines import Line2D
+
+import gateway
+import wire
+
+TOPIC_STATIONS = {b'temp004': 1, b'temp2004': 2}
+TOPIC_THRESHOLDS = b'temp3004'
+TOPIC_AGG = b'agg004'
+
+FIELDS = (('temp', 'Temperature (°C)'), ('hum', 'Humidity (%)'), ('lux', 'Lux'),
+          ('pressure', 'Pressure (hPa)'), ('height', 'Height (m)'))
+# 阈值带：坐标轴下标 -> (下限名, 上限名)
+BANDS = {0: ('TEMP_LOWER_LIMIT', 'TEMP_UPPER_LIMIT'),
+         1: ('HUMIDITY_LOWER_LIMIT', 'HUMIDITY_UPPER_LIMIT'),
+         2: ('LUX_LOWER_LIMIT', 'LUX_UPPER_LIMIT')}
+# 阈值帧字段（wire.THRESHOLD_FIELDS 顺序）对应的 main.py 变量名
+THRESHOLD_NAMES = ('TEMP_UPPER_LIMIT', 'TEMP_LOWER_LIMIT', 'HUMIDITY_UPPER_LIMIT',
+                   'HUMIDITY_LOWER_LIMIT', 'LUX_UPPER_LIMIT', 'LUX_LOWER_LIMIT')
+
+
+def load_limits(path):
+    # 读取 main.py 顶层的 *_LIMIT 常量（只解析不执行）
+    limits = {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError):
+        return limits
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1 and
+                isinstance(node.targets[0], ast.Name) and node.targets[0].id.endswith('_LIMIT')):
+            try:
+                limits[node.targets[0].id] = float(ast.literal_eval(node.value))
+            except (ValueError, TypeError):
+                pass
+    return limits
+
+
+def parse_feed_line(line):
+    # 返回 (uid, topic, msg)，无法识别时返回 None。支持
+    #   网关日志行  时间戳\tuid\ttopic\tmsg
+    #   巴法云报文  cmd=2&uid=..&topic=..&msg=..（网关转发或设备串口回显，前面可带其他输出）
+    line = line.rstrip(b'\r\n')
+    if line.count(b'\t') >= 3:
+        _, uid, topic, msg = line.split(b'\t', 3)
+        return uid, topic, msg
+    i = line.find(b'cmd=2')
+    if i >= 0:
+        parsed = gateway.parse_line(line, i, len(line))
+        if parsed and parsed[3] is not None:
+            return parsed[1] or b'-', parsed[2], parsed[3]
+    return None
+
+
+class Ring:
+    # 固定容量环形缓冲，按字段存放 (时间, 数值) 点对，可直接作为曲线顶点。
+    # 每个样本写两份（下标 i 与 i+capacity），最近 capacity 个样本始终是一段
+    # 按时间排列的连续视图，绘图时不需要拼接或复制
+    def __init__(self, capacity, fields=len(FIELDS)):
+        self.capacity = capacity
+        self.xy = np.full((fields, 2 * capacity, 2), np.nan, dtype=np.float32)
+        self.pos = 0
+        self.count = 0
+
+    def append(self, ts, values):
+        i = self.pos
+        j = i + self.capacity
+        xy = self.xy
+        xy[:, i, 0] = xy[:, j, 0] = ts
+        xy[:, i, 1] = xy[:, j, 1] = values
+        self.pos = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def since(self, t0):
+        # 时间 >= t0 的部分，返回 (fields, n, 2) 视图
+        end = self.pos + self.capacity
+        start = end - self.count
+        start += np.searchsorted(self.xy[0, start:end, 0], t0)
+        return self.xy[:, start:end]
+
+
+class Station:
+    def __init__(self, label, capacity, color):
+        self.label = label
+        self.color = color
+        self.ring = Ring(capacity)
+        self.last = np.full(len(FIELDS), np.nan, dtype=np.float32)
+        self.visible = self.ring.since(0)
+        self.dirty = False
+
+
+# ---------- 数据源：read() 不阻塞，返回新到的完整行 ----------
+
+class LineFeed:
+    def __init__(self):
+        self.partial = b''
+
+    def split(self, data):
+        if not data:
+            return ()
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        return lines
+
+
+class FileFeed(LineFeed):
+    # 跟踪文件末尾新增的行；给出目录时跟踪其中最新的 .log（网关按天换文件）
+    def __init__(self, path, from_start=False):
+        super().__init__()
+        self.path = path
+        self.from_start = from_start
+        self.file = None
+        self.name = None
+        self._open()
+
+    def _latest(self):
+        if not os.path.isdir(self.path):
+            return self.path
+        logs = sorted(n for n in os.listdir(self.path) if n.endswith('.log'))
+        return os.path.join(self.path, logs[-1]) if logs else None
+
+    def _open(self):
+        name = self._latest()
+        if name == self.name or name is None:
+            return
+        if self.file:
+            self.file.close()
+            self.from_start = True    # 换到新文件时从头读
+        self.file = open(name, 'rb')
+        if not self.from_start:
+            self.file.seek(0, 2)
+        self.name = name
+        self.partial = b''
+
+    def read(self):
+        data = self.file.read() if self.file else b''
+        if not data:
+            self._open()
+            return ()
+        return self.split(data)
+
+
+class SerialFeed(LineFeed):
+    def __init__(self, port, baudrate=115200):
+        super().__init__()
+        try:
+            import serial
+        except ImportError:
+            raise SystemExit('serial feeds need pyserial: pip install pyserial')
+        self.port = serial.Serial(port, baudrate, timeout=0)
+
+    def read(self):
+        n = self.port.in_waiting
+        return self.split(self.port.read(n)) if n else ()
+
+
+class SocketFeed(LineFeed):
+    # 以巴法云 TCP 协议订阅网关，节点发布的数据由网关转发过来；uid=* 订阅所有节点
+    def __init__(self, host, port, topics=tuple(TOPIC_STATIONS) + (TOPIC_THRESHOLDS, TOPIC_AGG)):
+        super().__init__()
+        self.sock = socket.create_connection((host, port), timeout=5)
+        self.sock.sendall(b'cmd=1&uid=%s&topic=%s\r\n' % (gateway.ANY_UID, b','.join(topics)))
+        self.sock.setblocking(False)
+
+    def read(self):
+        chunks = []
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                break
+            if not data:
+                raise SystemExit('gateway closed the connection')
+            chunks.append(data)
+        return self.split(b''.join(chunks))
+
+
+class DemoFeed:
+    # 每个站点每秒一条旧格式遥测，按网关日志行输出
+    def __init__(self, stations, interval=1.0):
+        self.stations = stations
+        self.interval = interval
+        self.next = time.time()
+
+    def read(self):
+        lines = []
+        now = time.time()
+        while self.next <= now:
+            t = self.next
+            for n in range(self.stations):
+                day = math.sin(t / 300 + n)
+                lines.append(b'%.3f\tdemo%d\ttemp004\t#%.1f#%.1f#%d#%.1f#%.2f#\xe5\xb7\xb2\xe5\xbc\x80\xe5\x90\xaf#' % (
+                    t, n + 1, 24 + 4 * day + n, 60 - 8 * day, 700 + 300 * day, 989 + day, 203.7 - 8 * day))
+            self.next += self.interval
+        return lines
+
+
+def open_feed(spec, from_start=False):
+    if spec.startswith('serial:'):
+        port, _, baud = spec[7:].partition('@')
+        return SerialFeed(port, int(baud or 115200))
+    if spec.startswith('tcp:'):
+        host, _, port = spec[4:].rpartition(':')
+        return SocketFeed(host or '127.0.0.1', int(port))
+    if spec.startswith('demo:'):
+        stations, _, interval = spec[5:].partition('@')
+        return DemoFeed(int(stations or 1), float(interval or 1.0))
+    return FileFeed(spec, from_start)
+
+
+# ---------- 看板 ----------
+
+class Dashboard:
+    def __init__(self, fig, axes, limits, window=600, capacity=36000):
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.axes = axes
+        self.limits = limits
+        self.window = window
+        self.capacity = capacity
+        self.stations = {}
+        self.t0 = None
+        self.bands = {}
+        self.yset = [False] * len(axes)
+        self.backgrounds = None
+        self.full = True
+        self.redraws = 0
+        self.blits = 0
+        self.bad_lines = 0          # 解析失败而跳过的行数
+        for i, (_, label) in enumerate(FIELDS):
+            axes[i].set_ylabel(label)
+            axes[i].grid(True)
+        axes[0].set_title('Greenhouse live data')
+        axes[-1].set_xlabel('Time (s)')
+        axes[-1].set_xlim(0, window)
+        self.draw_bands()
+        self.colors = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+        self.curves = []
+        for ax in axes:
+            curve = LineCollection([], linewidths=1.2, animated=True)
+            ax.add_collection(curve)
+            self.curves.append(curve)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def draw_bands(self):
+        for i, (lo_name, hi_name) in BANDS.items():
+            band = self.bands.pop(i, None)
+            if band is not None:
+                band.remove()
+            lo, hi = self.limits.get(lo_name), self.limits.get(hi_name)
+            if lo is not None and hi is not None:
+                self.bands[i] = self.axes[i].axhspan(lo, hi, color='tab:green', alpha=0.12, zorder=0)
+
+    def station(self, key):
+        st = self.stations.get(key)
+        if st is None:
+            color = self.colors[len(self.stations) % len(self.colors)]
+            st = self.stations[key] = Station(key, self.capacity, color)
+            colors = [s.color for s in self.stations.values()]
+            for c in self.curves:
+                c.set_color(colors)
+            handles = [Line2D([], [], color=s.color, lw=1.2) for s in self.stations.values()]
+            self.axes[0].legend(handles, list(self.stations), loc='upper left', fontsize='small')
+            self.full = True
+        return st
+
+    def ingest(self, line):
+        parsed = parse_feed_line(line)
+        if parsed is None:
+            return 0
+        uid, topic, msg = parsed
+        ts = time.time()
+        if line.count(b'\t') >= 3:
+            try:
+                ts = float(line.split(b'\t', 1)[0])
+            except ValueError:
+                pass
+        uid = uid.decode(errors='replace')
+        if topic == TOPIC_THRESHOLDS:
+            return self.thresholds(msg)
+        if msg.startswith(b'#') and msg.count(b'#') > 2:
+            station = TOPIC_STATIONS.get(topic)
+            if station is None:
+                return 0
+            self.sample(ts, '%s/%d' % (uid, station), gateway.parse_values(msg)[:len(FIELDS)])
+            return 1
+        try:
+            frame = wire.decode(msg.decode())
+        except wire.DECODE_ERRORS:
+            return 0
+        if frame['kind'] == 'telemetry':
+            self.stations_sample(ts, uid, frame['stations'])
+        elif frame['kind'] == 'samples':
+            # 批量帧自带时间戳；设备未对时时以接收时间作为最后一个样本的时间
+            samples = frame['samples']
+            shift = 0.0 if frame['synced'] or not samples else ts - samples[-1]['t']
+            for sample in samples:
+                self.stations_sample(sample['t'] + shift, uid, sample['stations'])
+        elif frame['kind'] == 'aggregate':
+            # 聚合帧只带到期的字段：用窗口平均值更新，其余字段沿用上一次的值
+            by_station = {}
+            for ch in frame['channels']:
+                by_station.setdefault(ch['station'], {})[ch['field']] = ch['mean']
+            for n, fields in by_station.items():
+                st = self.station('%s/%d' % (uid, n))
+                values = st.last.copy()
+                for k, (f, _) in enumerate(FIELDS):
+                    if fields.get(f) is not None:
+                        values[k] = fields[f]
+                self.sample(ts, st.label, values)
+        elif frame['kind'] == 'thresholds':
+            return self.set_limits([frame[f] for f in wire.THRESHOLD_FIELDS])
+        return 1
+
+    def stations_sample(self, ts, uid, stations):
+        for n, values in enumerate(stations, 1):
+            self.sample(ts, '%s/%d' % (uid, n), [math.nan if values[f] is None else values[f]
+                                                 for f, _ in FIELDS])
+
+    def thresholds(self, msg):
+        if msg.startswith(b'#') and msg.count(b'#') > 2:
+            return self.set_limits(gateway.parse_values(msg))
+        try:
+            frame = wire.decode(msg.decode())
+        except wire.DECODE_ERRORS:
+            return 0
+        if frame['kind'] != 'thresholds':
+            return 0
+        return self.set_limits([frame[f] for f in wire.THRESHOLD_FIELDS])
+
+    def set_limits(self, values):
+        changed = False
+        for name, value in zip(THRESHOLD_NAMES, values):
+            if value == value and self.limits.get(name) != value:
+                self.limits[name] = value
+                changed = True
+        if changed:
+            self.draw_bands()
+            self.full = True
+        return 1
+
+    def sample(self, ts, key, values):
+        st = self.station(key)
+        if self.t0 is None:
+            self.t0 = ts
+        st.last[:] = values
+        st.ring.append(ts - self.t0, st.last)
+        st.dirty = True
+
+    def refresh_station(self, st, x0):
+        st.visible = st.ring.since(x0)
+        st.dirty = False
+        return st.visible
+
+    def check_scale(self, xy):
+        # 时间轴越过右边界时整体右移半个窗口；数值超出纵轴时扩展纵轴。两者都需要整图重绘
+        ax = self.axes[-1]
+        x0, x1 = ax.get_xlim()
+        n = xy.shape[1]
+        if n and xy[0, -1, 0] > x1:
+            x0 = xy[0, -1, 0] - self.window / 2
+            ax.set_xlim(x0, x0 + self.window)
+            self.yset = [False] * len(self.axes)   # 滚动后按可见数据重新收紧纵轴
+            self.full = True
+        if not n:
+            return
+        # 未越界时只需检查最新一点
+        for i, axis in enumerate(self.axes):
+            col = xy[i, :, 1] if not self.yset[i] or self.full else xy[i, -1:, 1]
+            col = col[col == col]
+            if not len(col):
+                continue
+            lo, hi = col.min(), col.max()
+            y0, y1 = axis.get_ylim()
+            if self.yset[i] and y0 <= lo and hi <= y1:
+                continue
+            if self.yset[i]:
+                lo, hi = min(lo, y0), max(hi, y1)
+            pad = (hi - lo) * 0.1 or max(abs(hi) * 0.01, 1.0)
+            axis.set_ylim(lo - pad, hi + pad)
+            self.yset[i] = True
+            self.full = True
+
+    def on_draw(self, event=None):
+        # 整图重绘（含窗口缩放）后缓存各坐标轴背景，再画上曲线
+        self.backgrounds = [self.canvas.copy_from_bbox(ax.bbox) for ax in self.axes]
+        for i in range(len(self.axes)):
+            self.blit_axis(i)
+
+    def blit_axis(self, i):
+        # 每个坐标轴只有一个动画对象：所有站点的曲线合成一个 LineCollection
+        ax = self.axes[i]
+        self.canvas.restore_region(self.backgrounds[i])
+        ax.draw_artist(self.curves[i])
+        self.canvas.blit(ax.bbox)
+
+    def update(self, feed):
+        # 定时调用：读取新数据，只有数据变化时才重画曲线；返回处理的消息数
+        n = 0
+        for line in feed.read():
+            # 串口或日志中的坏行直接跳过，不中断定时刷新
+            try:
+                n += self.ingest(line)
+            except wire.DECODE_ERRORS:
+                self.bad_lines += 1
+        dirty = [st for st in self.stations.values() if st.dirty]
+        if not dirty and not self.full:
+            return n
+        x0 = self.axes[-1].get_xlim()[0]
+        for st in dirty:
+            self.check_scale(self.refresh_station(st, x0))
+        if self.full:
+            x0 = self.axes[-1].get_xlim()[0]
+            for st in self.stations.values():
+                self.check_scale(self.refresh_station(st, x0))
+        visible = [st.visible for st in self.stations.values()]
+        for i, curve in enumerate(self.curves):
+            curve.set_segments([xy[i] for xy in visible])
+        if self.full:
+            self.full = False
+            self.redraws += 1
+            self.canvas.draw()            # 触发 on_draw
+        else:
+            for i in range(len(self.axes)):
+                self.blit_axis(i)
+            self.blits += 1
+        return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Live greenhouse dashboard')
+    parser.add_argument('source', help='log file or directory, serial:PORT[@BAUD], tcp:HOST:PORT or demo:N')
+    parser.add_argument('--window', type=float, default=600, help='visible time span in seconds')
+    parser.add_argument('--rate', type=float, default=10, help='screen updates per second')
+    parser.add_argument('--capacity', type=int, default=36000, help='samples kept per station')
+    parser.add_argument('--limits', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'),
+                        help='file to read the *_LIMIT defaults from')
+    parser.add_argument('--from-start', action='store_true', help='read a log file from the beginning')
+    parser.add_argument('--stats', action='store_true', help='print CPU usage every 5 seconds')
+    parser.add_argument('--bench', type=float, metavar='SECONDS', help='run headless and report CPU usage')
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    feed = open_feed(args.source, args.from_start)
+    fig, axes = plt.subplots(len(FIELDS), 1, figsize=(10, 12), sharex=True)
+    dash = Dashboard(fig, list(axes), load_limits(args.limits), args.window, args.capacity)
+    fig.tight_layout()
+    interval = 1.0 / args.rate
+
+    if args.bench:
+        fig.canvas.draw()
+        wall, cpu = time.perf_counter(), time.process_time()
+        end = wall + args.bench
+        messages = 0
+        while time.perf_counter() < end:
+            tick = time.perf_counter()
+            messages += dash.update(feed)
+            time.sleep(max(0.0, interval - (time.perf_counter() - tick)))
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        print('stations %d  messages %d  updates/s %.1f  full redraws %d' % (
+            len(dash.stations), messages, (dash.blits + dash.redraws) / wall, dash.redraws))
+        print('CPU %.1f%% at %.0f Hz' % (100 * cpu / wall, args.rate))
+        return 0
+
+    state = {'wall': time.perf_counter(), 'cpu': time.process_time()}
+
+    def tick():
+        dash.update(feed)
+        if args.stats:
+            wall = time.perf_counter()
+            if wall - state['wall'] >= 5:
+                cpu = time.process_time()
+                print('[dashboard] CPU %.1f%%  stations %d  full redraws %d' % (
+                    100 * (cpu - state['cpu']) / (wall - state['wall']), len(dash.stations), dash.redraws))
+                state['wall'], state['cpu'] = wall, cpu
+
+    timer = fig.canvas.new_timer(interval=int(interval * 1000))
+    timer.add_callback(tick)
+    timer.start()
+    plt.show()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
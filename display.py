@@ -0,0 +1,106 @@
+# 双屏显示管理：两块 SSD1306 分别挂在独立的硬件 I2C 总线上
+# - 两块屏内容相同的画面（阈值页、启动/关机提示）只画一次，再把帧缓冲整块复制到另一块屏
+# - show() 同时刷新两块屏：辅助线程发送第二块屏的 1 KB 帧，主线程同时发送第一块屏，
+#   两条总线并行传输，刷新两块屏的时间约等于一块屏。没有 _thread 时依次刷新。
+# 刷新耗时（微秒）记在 last_us/max_us 中，可与 threaded=False 时对比。
+import time
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+# show() 的屏幕掩码
+FIRST = 1
+SECOND = 2
+BOTH = 3
+
+
+class DualDisplay:
+    def __init__(self, first, second, threaded=True, stack_size=0):
+        self.first = first
+        self.second = second
+        self.error = None
+        self.stop = False
+        self.count = 0
+        self.last_us = 0
+        self.max_us = 0
+        self.go = None
+        if threaded and _thread:
+            # 两个锁当作信号量使用：go 通知辅助线程开始，done 通知主线程已完成
+            self.go = _thread.allocate_lock()
+            self.done = _thread.allocate_lock()
+            self.go.acquire()
+            self.done.acquire()
+            if stack_size and hasattr(_thread, 'stack_size'):
+                _thread.stack_size(stack_size)
+            _thread.start_new_thread(self._worker, ())
+
+    def _worker(self):
+        while True:
+            self.go.acquire()
+            if self.stop:
+                self.done.release()
+                return
+            try:
+                self.second.show()
+            except Exception as e:
+                self.error = e
+            self.done.release()
+
+    def mirror(self):
+        # 第一块屏的帧缓冲原样复制到第二块屏（切片赋值，不分配内存）
+        self.second.buffer[:] = self.first.buffer
+
+    def fill(self, c):
+        self.first.fill(c)
+        self.second.fill(c)
+
+    def message(self, s, x, y):
+        # 两块屏清空后显示同一行提示并刷新
+        self.first.fill(0)
+        self.first.text(s, x, y)
+        self.mirror()
+        self.show()
+
+    def show(self, which=BOTH):
+        t0 = ticks_us()
+        if which == BOTH and self.go:
+            self.go.release()
+            try:
+                self.first.show()
+            finally:
+                self.done.acquire()
+            if self.error:
+                e, self.error = self.error, None
+                raise e
+        else:
+            if which & FIRST:
+                self.first.show()
+            if which & SECOND:
+                self.second.show()
+        dt = ticks_diff(ticks_us(), t0)
+        self.count += 1
+        self.last_us = dt
+        if dt > self.max_us:
+            self.max_us = dt
+
+    def stats(self):
+        return {'threaded': self.go is not None, 'flushes': self.count,
+                'last_ms': self.last_us / 1000, 'max_ms': self.max_us / 1000}
+
+    def close(self):
+        if self.go:
+            self.stop = True
+            self.go.release()
+            self.done.acquire()
+            self.go = None
@@ -0,0 +1,128 @@
+# 定点流式滤波器组：尖峰剔除 -> 滑动中值 -> EMA，所有通道状态预分配在数组中
+# 数值按 Q8 定点（x256）保存为 32 位整数，MicroPython 上不产生中间浮点对象。
+from array import array
+
+Q = 8
+ONE = 1 << Q
+MAX_WINDOW = 5
+MAX_SPIKES = 3  # 连续剔除超过此次数后视为真实阶跃并接受
+
+# 预设: (中值窗口, EMA 移位 k 即 alpha=1/2^k, 是否剔除尖峰, BMP280 片内 IIR 系数代码)
+PRESETS = (
+    (1, 0, False, 0),   # 0 关闭
+    (3, 0, True, 2),    # 1 轻度
+    (3, 2, True, 3),    # 2 中度
+    (5, 3, True, 4),    # 3 重度
+)
+
+
+class FilterBank:
+    def __init__(self, channels):
+        self.channels = channels
+        self.win = array('i', bytes(4 * channels * MAX_WINDOW))
+        self.wpos = bytearray(channels)
+        self.wcnt = bytearray(channels)
+        self.ema = array('i', bytes(4 * channels))
+        self.last = array('i', bytes(4 * channels))
+        self.primed = bytearray(channels)
+        self.spikes = bytearray(channels)
+        self.window = bytearray(channels)
+        self.shift = bytearray(channels)
+        self.spike_limit = array('i', bytes(4 * channels))  # Q8，0 表示不剔除
+        self.preset = bytearray(channels)
+        self.rejected = array('i', bytes(4 * channels))
+        self.scratch = array('i', bytes(4 * MAX_WINDOW))
+        # 输出缓存：结果不变时返回同一个浮点对象，稳态下不产生新的浮点对象
+        self.out_key = array('i', bytes(4 * channels))
+        self.out = [None] * channels
+        for ch in range(channels):
+            self.configure(ch, 0)
+
+    def configure(self, ch, preset, spike=0):
+        # spike: 该通道允许的单步最大变化（工程单位），仅在预设开启尖峰剔除时生效
+        window, shift, reject, _ = PRESETS[preset]
+        self.preset[ch] = preset
+        self.window[ch] = window
+        self.shift[ch] = shift
+        self.spike_limit[ch] = int(spike * ONE) if reject else 0
+        self.reset(ch)
+
+    def reset(self, ch):
+        self.wpos[ch] = 0
+        self.wcnt[ch] = 0
+        self.primed[ch] = 0
+        self.spikes[ch] = 0
+        self.out[ch] = None
+
+    def update(self, ch, value):
+        # 输入工程单位浮点数，返回滤波后的值；None 或关闭滤波时直接透传
+        if value is None or not self.preset[ch]:
+            return value
+        return self._output(ch, self.update_q(ch, int(value * ONE)), ONE)
+
+    def update_fixed(self, ch, n, div=1):
+        # 整数输入，数值为 n/div（例如 DHT22 原始值 x10 时 div=10），全程只有整数运算
+        if self.preset[ch]:
+            n = self.update_q(ch, (n << Q) // div)
+            div = ONE
+        return self._output(ch, n, div)
+
+    def _output(self, ch, key, div):
+        if key != self.out_key[ch] or self.out[ch] is None:
+            self.out_key[ch] = key
+            self.out[ch] = key / div
+        return self.out[ch]
+
+    def settling(self, ch):
+        # 正在剔除尖峰，或输出与最近输入相差超过尖峰门限的 1/4 时为 True（阶跃尚未走完滤波器）
+        if not self.preset[ch]:
+            return False
+        if self.spikes[ch]:
+            return True
+        d = self.out_key[ch] - self.last[ch]
+        return (d if d >= 0 else -d) > self.spike_limit[ch] >> 2
+
+    def update_q(self, ch, x):
+        if not self.primed[ch]:
+            self.primed[ch] = 1
+            self.last[ch] = x
+            self.ema[ch] = x
+        limit = self.spike_limit[ch]
+        if limit:
+            d = x - self.last[ch]
+            if (d > limit or d < -limit) and self.spikes[ch] < MAX_SPIKES:
+                self.spikes[ch] += 1
+                self.rejected[ch] += 1
+                x = self.last[ch]
+            else:
+                self.spikes[ch] = 0
+        self.last[ch] = x
+
+        n = self.window[ch]
+        if n > 1:
+            base = ch * MAX_WINDOW
+            pos = self.wpos[ch]
+            self.win[base + pos] = x
+            self.wpos[ch] = (pos + 1) % n
+            cnt = self.wcnt[ch]
+            if cnt < n:
+                cnt += 1
+                self.wcnt[ch] = cnt
+            # 插入排序到预分配的 scratch 中取中值
+            s = self.scratch
+            for i in range(cnt):
+                v = self.win[base + i]
+                j = i
+                while j > 0 and s[j - 1] > v:
+                    s[j] = s[j - 1]
+                    j -= 1
+                s[j] = v
+            x = s[cnt >> 1]
+
+        k = self.shift[ch]
+        if k:
+            e = self.ema[ch]
+            e += (x - e) >> k
+            self.ema[ch] = e
+            x = e
+        return x
@@ -0,0 +1,383 @@
+# 上位机网关：替代巴法云 TCP 服务器，汇聚多个温室节点（CPython asyncio）
+#   节点端口: 巴法云 TCP 文本协议（cmd=1 订阅 / cmd=2 发布 / ping 心跳），节点无需改动，只需把 SERVER_IP 指向网关
+#   管理端口: 按行发送命令
+#       PUSH <uid> <topic> <msg>  向该 uid 下订阅该主题的节点推送消息，例如 PUSH <uid> temp4004 tapon；
+#                                 uid 为 * 时推送给所有节点
+#       LAST <uid> <topic>        返回该节点该主题最近一条解析后的数值（站点序列为 topic#站点）
+#       UIDS                      返回有数据的节点 uid 列表
+#       STATS                     返回连接数、消息数与每 CPU 秒处理消息数
+# 所有节点运行同一固件、使用相同主题（temp004 等），以 uid 区分节点：时间序列与订阅都按 (uid, topic) 索引，
+# 节点发布的消息只转发给同一 uid 的订阅者，以 uid=* 订阅的监视端（dashboard.py）收到所有节点的消息。
+# 数据同时写入内存时间序列环形缓冲与磁盘日志（data/YYYYMMDD.log，每行: 时间戳\tuid\ttopic\tmsg）。
+# 用法: python gateway.py [--port 8344] [--admin-port 8345] [--data-dir data]
+import argparse
+import array
+import asyncio
+import json
+import math
+import os
+import time
+
+import wire
+
+MAX_LINE = 4096
+FIELDS = 8
+STATUS_WORDS = {'已开启'.encode(): 1.0, '已关闭'.encode(): 0.0}
+NO_UID = b'-'           # 不带 uid 的报文，与磁盘日志中的写法相同
+ANY_UID = b'*'          # 订阅时表示所有节点，推送时表示所有节点
+
+ACK_SUB = b'cmd=1&res=1\r\n'
+ACK_PUB = b'cmd=2&res=1\r\n'
+ACK_PING = b'cmd=0&res=1\r\n'
+
+
+def parse_line(buf, start, end):
+    # 在 buf[start:end] 上按偏移量解析，不复制整行；只有主题和消息被取出为 bytes
+    # 返回 (cmd, uid, topic, msg)，无法识别时返回 None；心跳返回 (0, None, None, None)
+    if buf.startswith(b'ping', start) or buf.startswith(b'cmd=0', start):
+        return 0, None, None, None
+    if not buf.startswith(b'cmd=', start) or end - start < 6:
+        return None
+    cmd = buf[start + 4] - 48
+    u = buf.find(b'&uid=', start, end)
+    t = buf.find(b'&topic=', start, end)
+    if t < 0:
+        return None
+    m = buf.find(b'&msg=', t, end)
+    topic_end = buf.find(b'&', t + 7, end)
+    if topic_end < 0:
+        topic_end = end
+    uid = None
+    if u >= 0:
+        uid_end = buf.find(b'&', u + 5, end)
+        uid = bytes(buf[u + 5:uid_end if uid_end >= 0 else end])
+    msg = bytes(buf[m + 5:end]) if m >= 0 else None
+    return cmd, uid, bytes(buf[t + 7:topic_end]), msg
+
+
+def parse_values(msg):
+    # "#24.5#62.3#741#989.0#203.70#已开启#" -> [24.5, 62.3, 741.0, 989.0, 203.7, 1.0]
+    values = []
+    for part in msg.split(b'#'):
+        if not part:
+            continue
+        try:
+            values.append(float(part))
+        except ValueError:
+            values.append(STATUS_WORDS.get(part, math.nan))
+    return values
+
+
+class Ring:
+    # 固定容量时间序列：一列时间戳 + FIELDS 列数值，全部预分配
+    __slots__ = ('capacity', 't', 'v', 'count', 'pos')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.t = array.array('d', bytes(8 * capacity))
+        self.v = array.array('d', bytes(8 * capacity * FIELDS))
+        self.count = 0
+        self.pos = 0
+
+    def append(self, ts, values):
+        i = self.pos
+        self.t[i] = ts
+        base = i * FIELDS
+        n = min(len(values), FIELDS)
+        for k in range(n):
+            self.v[base + k] = values[k]
+        for k in range(n, FIELDS):
+            self.v[base + k] = math.nan
+        self.pos = (i + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def latest(self):
+        if not self.count:
+            return None
+        i = (self.pos - 1) % self.capacity
+        return self.t[i], list(self.v[i * FIELDS:(i + 1) * FIELDS])
+
+    def window(self, n):
+        # 最近 n 条，按时间升序
+        n = min(n, self.count)
+        rows = []
+        for k in range(n):
+            i = (self.pos - n + k) % self.capacity
+            rows.append((self.t[i], list(self.v[i * FIELDS:(i + 1) * FIELDS])))
+        return rows
+
+
+class DiskLog:
+    # 批量写盘：数据先进内存列表，由后台任务按间隔写入当天文件
+    def __init__(self, data_dir, flush_interval=1.0):
+        self.data_dir = data_dir
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.day = None
+        self.file = None
+        if data_dir:
+            os.makedirs(data_dir, exist_ok=True)
+
+    def append(self, ts, uid, topic, msg):
+        if self.data_dir:
+            self.pending.append(b'%.3f\t%s\t%s\t%s\n' % (ts, uid or b'-', topic, msg or b''))
+
+    def flush(self):
+        if not self.pending:
+            return
+        day = time.strftime('%Y%m%d')
+        if day != self.day:
+            if self.file:
+                self.file.close()
+            self.file = open(os.path.join(self.data_dir, day + '.log'), 'ab')
+            self.day = day
+        self.file.write(b''.join(self.pending))
+        self.file.flush()
+        self.pending.clear()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def close(self):
+        self.flush()
+        if self.file:
+            self.file.close()
+
+
+class Gateway:
+    def __init__(self, data_dir='data', capacity=3600):
+        self.capacity = capacity
+        self.subs = {}          # (uid, topic) -> set(NodeProtocol)，uid 为 ANY_UID 的是监视端
+        self.series = {}        # (uid, topic 或 topic#站点) -> Ring
+        self.nodes = set()
+        self.log = DiskLog(data_dir)
+        self.messages = 0
+        self.bytes = 0
+        self.cpu_start = time.process_time()
+        self.wall_start = time.time()
+
+    def ring(self, key):
+        ring = self.series.get(key)
+        if ring is None:
+            ring = self.series[key] = Ring(self.capacity)
+        return ring
+
+    def store(self, ts, uid, topic, msg):
+        if msg.startswith(b'#') and msg.count(b'#') > 2:
+            self.ring((uid, topic)).append(ts, parse_values(msg))
+            return
+        # 紧凑编码（wire.py）的遥测帧，每个站点单独一条序列
+        try:
+            frame = wire.decode(msg.decode())
+        except wire.DECODE_ERRORS:
+            return
+        if frame['kind'] == 'telemetry':
+            self.store_stations(ts, uid, topic, frame)
+        elif frame['kind'] == 'samples':
+            # 批量帧的样本自带毫秒时间戳；设备尚未对时时，以接收时间作为最后一个样本的时间
+            samples = frame['samples']
+            shift = 0.0 if frame['synced'] or not samples else ts - samples[-1]['t']
+            for sample in samples:
+                self.store_stations(sample['t'] + shift, uid, topic, sample)
+        elif frame['kind'] == 'thresholds':
+            self.ring((uid, topic)).append(ts, [frame[f] for f in wire.THRESHOLD_FIELDS])
+        elif frame['kind'] == 'aggregate':
+            # 每个站点/字段一条序列: 样本数, 最小, 最大, 平均
+            for ch in frame['channels']:
+                key = topic + b'#%d.%s' % (ch['station'], ch['field'].encode())
+                self.ring((uid, key)).append(ts, [math.nan if ch[f] is None else ch[f]
+                                           for f in ('count', 'min', 'max', 'mean')])
+
+    def store_stations(self, ts, uid, topic, frame):
+        flags = [1.0 if frame['tap_on'] else 0.0, 1.0 if frame['buzzer_on'] else 0.0]
+        for n, station in enumerate(frame['stations'], 1):
+            values = [math.nan if station[f] is None else station[f] for f in wire.STATION_FIELDS]
+            self.ring((uid, topic + b'#%d' % n)).append(ts, values + flags)
+
+    def subscribe(self, node, uid, topics):
+        for topic in topics.split(b','):
+            if topic:
+                key = (uid, topic)
+                self.subs.setdefault(key, set()).add(node)
+                node.topics.add(key)
+
+    def publish(self, uid, topic, msg, exclude=None):
+        # 转发给同一 uid 的订阅者与监视端；uid 为 ANY_UID 时（管理端推送）转发给所有节点
+        line = b'cmd=2&uid=%s&topic=%s&msg=%s\r\n' % (uid, topic, msg)
+        if uid == ANY_UID:
+            targets = [nodes for (sub_uid, sub_topic), nodes in self.subs.items()
+                       if sub_topic == topic and sub_uid != ANY_UID]
+        else:
+            targets = (self.subs.get((uid, topic), ()), self.subs.get((ANY_UID, topic), ()))
+        delivered = 0
+        for nodes in targets:
+            for node in nodes:
+                if node is not exclude:
+                    node.transport.write(line)
+                    delivered += 1
+        return delivered
+
+    def handle(self, node, buf, start, end):
+        parsed = parse_line(buf, start, end)
+        if parsed is None:
+            return None
+        cmd, uid, topic, msg = parsed
+        if cmd == 0:
+            return ACK_PING
+        uid = uid or NO_UID
+        if cmd == 1:
+            self.subscribe(node, uid, topic)
+            return ACK_SUB
+        if cmd == 2 and msg is not None:
+            ts = time.time()
+            self.messages += 1
+            self.log.append(ts, uid, topic, msg)
+            if uid != ANY_UID:
+                self.store(ts, uid, topic, msg)
+                self.publish(uid, topic, msg, exclude=node)
+            return ACK_PUB
+        return None
+
+    def drop(self, node):
+        self.nodes.discard(node)
+        for key in node.topics:
+            subscribers = self.subs.get(key)
+            if subscribers:
+                subscribers.discard(node)
+
+    def stats(self):
+        cpu = time.process_time() - self.cpu_start
+        wall = time.time() - self.wall_start
+        return {'nodes': len(self.nodes), 'series': len(self.series), 'messages': self.messages,
+                'bytes': self.bytes, 'msg_per_s': self.messages / wall if wall else 0.0,
+                'msg_per_cpu_s': self.messages / cpu if cpu else 0.0}
+
+    def reset_stats(self):
+        self.messages = 0
+        self.bytes = 0
+        self.cpu_start = time.process_time()
+        self.wall_start = time.time()
+
+
+class NodeProtocol(asyncio.Protocol):
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.buf = bytearray()
+        self.topics = set()     # 订阅的 (uid, topic)
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.gateway.nodes.add(self)
+
+    def data_received(self, data):
+        gateway = self.gateway
+        gateway.bytes += len(data)
+        buf = self.buf
+        buf += data
+        start = 0
+        replies = []
+        while True:
+            nl = buf.find(b'\n', start)
+            if nl < 0:
+                break
+            end = nl - 1 if nl > start and buf[nl - 1] == 13 else nl
+            reply = gateway.handle(self, buf, start, end)
+            if reply:
+                replies.append(reply)
+            start = nl + 1
+        if start:
+            del buf[:start]
+        if replies:
+            self.transport.write(b''.join(replies))
+        if len(buf) > MAX_LINE:
+            self.transport.close()
+
+    def connection_lost(self, exc):
+        self.gateway.drop(self)
+
+
+class AdminProtocol(asyncio.Protocol):
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.buf = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buf += data
+        while b'\n' in self.buf:
+            line, self.buf = self.buf.split(b'\n', 1)
+            self.transport.write(self.command(line.strip()) + b'\n')
+
+    def command(self, line):
+        parts = line.split(b' ', 3)
+        op = parts[0].upper()
+        if op == b'PUSH' and len(parts) == 4:
+            return b'OK %d' % self.gateway.publish(parts[1], parts[2], parts[3])
+        if op == b'LAST' and len(parts) == 3:
+            ring = self.gateway.series.get((parts[1], parts[2]))
+            latest = ring.latest() if ring else None
+            return json.dumps(latest).encode()
+        if op == b'UIDS':
+            return json.dumps(sorted({uid.decode(errors='replace') for uid, _ in self.gateway.series})).encode()
+        if op == b'STATS':
+            return json.dumps(self.gateway.stats()).encode()
+        if op == b'RESET':
+            self.gateway.reset_stats()
+            return b'OK'
+        return b'ERR'
+
+
+async def report(gateway, interval):
+    last_msgs, last_cpu, last_wall = gateway.messages, time.process_time(), time.time()
+    while True:
+        await asyncio.sleep(interval)
+        msgs, cpu, wall = gateway.messages, time.process_time(), time.time()
+        dm = msgs - last_msgs
+        if dm:
+            print('[gateway] nodes %d  %.0f msg/s  %.0f msg/cpu-s' % (
+                len(gateway.nodes), dm / (wall - last_wall), dm / max(cpu - last_cpu, 1e-9)))
+        last_msgs, last_cpu, last_wall = msgs, cpu, wall
+
+
+async def serve(args):
+    gateway = Gateway(args.data_dir, args.capacity)
+    loop = asyncio.get_running_loop()
+    nodes = await loop.create_server(lambda: NodeProtocol(gateway), args.host, args.port, backlog=4096)
+    admin = await loop.create_server(lambda: AdminProtocol(gateway), '127.0.0.1', args.admin_port)
+    print(f'[gateway] nodes on {args.host}:{args.port}, admin on 127.0.0.1:{args.admin_port}')
+    tasks = [asyncio.create_task(gateway.log.run())]
+    if args.report:
+        tasks.append(asyncio.create_task(report(gateway, args.report)))
+    try:
+        async with nodes, admin:
+            await asyncio.gather(nodes.serve_forever(), admin.serve_forever())
+    finally:
+        for task in tasks:
+            task.cancel()
+        gateway.log.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Greenhouse node gateway (Bemfa TCP compatible)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8344)
+    parser.add_argument('--admin-port', type=int, default=8345)
+    parser.add_argument('--data-dir', default='data', help='empty string disables disk storage')
+    parser.add_argument('--capacity', type=int, default=3600, help='samples kept in memory per node and topic')
+    parser.add_argument('--report', type=float, default=5.0, help='throughput report interval (s), 0 disables')
+    args = parser.parse_args()
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
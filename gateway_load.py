@@ -0,0 +1,109 @@
+# 网关负载生成器：模拟大量节点按 main.py 的格式上传数据，并统计网关吞吐
+# 用法:
+#   python gateway.py --data-dir "" &
+#   python gateway_load.py --nodes 2000 --rate 1 --duration 30      # 模拟真实节点节奏
+#   python gateway_load.py --nodes 64 --burst --duration 10          # 压测每核最大吞吐
+#   python gateway_load.py --nodes 64 --burst --compact              # 紧凑编码（wire.py），经过网关的 wire.decode 路径
+# 节点数较多时需先提高文件描述符上限（ulimit -n）。
+# 与真实部署一样，所有节点使用相同的主题，以各自的 uid 区分。
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import wire
+
+
+def uid(node_id):
+    return '%032d' % node_id
+
+
+def frames(node_id, compact=False):
+    # 每个节点一轮上传的三个主题，格式与 main.send_data 一致；compact 时为 UPLINK_COMPACT 的编码
+    t = 20 + random.random() * 10
+    h = 50 + random.random() * 20
+    u = uid(node_id)
+    if compact:
+        telemetry = wire.encode_telemetry([(t, h, 741, 989.0, 203.7), (t, h, 738, 989.1, 203.1)], True, False)
+        limits = wire.encode_thresholds(30.0, 15.0, 70.0, 30.0, 10000, 100)
+        return (f'cmd=2&uid={u}&topic=temp004&msg=#{telemetry}#\r\n'
+                f'cmd=2&uid={u}&topic=temp3004&msg=#{limits}#\r\n').encode()
+    lines = [
+        f'cmd=2&uid={u}&topic=temp004&msg=#{t:.1f}#{h:.1f}#741#989.0#203.70#已开启#\r\n',
+        f'cmd=2&uid={u}&topic=temp2004&msg=#{t:.1f}#{h:.1f}#738#989.1#203.10#已关闭#\r\n',
+        f'cmd=2&uid={u}&topic=temp3004&msg=#30.0#15.0#70.0#30.0#10000#100#\r\n',
+    ]
+    return ''.join(lines).encode()
+
+
+async def node(args, node_id, counters, stop):
+    try:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    except OSError:
+        counters['failed'] += 1
+        return
+    counters['connected'] += 1
+    writer.write(f'cmd=1&uid={uid(node_id)}&topic=temp4004,temp5004\r\n'.encode())
+
+    async def read_acks():
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            if line.startswith(b'cmd=2&res'):
+                counters['acked'] += 1
+
+    acks = asyncio.create_task(read_acks())
+    payload = frames(node_id, args.compact)
+    per_round = payload.count(b'\n')
+    await asyncio.sleep(random.random() / args.rate)
+    try:
+        while not stop.is_set():
+            writer.write(payload)
+            counters['sent'] += per_round
+            if args.burst:
+                await writer.drain()
+            else:
+                await asyncio.sleep(1 / args.rate)
+    except ConnectionError:
+        pass
+    acks.cancel()
+    writer.close()
+
+
+async def admin(args, command):
+    reader, writer = await asyncio.open_connection('127.0.0.1', args.admin_port)
+    writer.write(command + b'\n')
+    line = await reader.readline()
+    writer.close()
+    return line.strip()
+
+
+async def main(args):
+    counters = {'connected': 0, 'failed': 0, 'sent': 0, 'acked': 0}
+    stop = asyncio.Event()
+    await admin(args, b'RESET')
+    tasks = [asyncio.create_task(node(args, 1000 + i, counters, stop)) for i in range(args.nodes)]
+    start = time.time()
+    await asyncio.sleep(args.duration)
+    stop.set()
+    elapsed = time.time() - start
+    stats = json.loads(await admin(args, b'STATS'))
+    await asyncio.gather(*tasks, return_exceptions=True)
+    print(f"nodes     {counters['connected']} connected, {counters['failed']} failed")
+    print(f"client    {counters['sent'] / elapsed:.0f} msg/s sent, {counters['acked'] / elapsed:.0f} msg/s acked")
+    print(f"gateway   {stats['msg_per_s']:.0f} msg/s, {stats['msg_per_cpu_s']:.0f} msg per cpu-second (single core)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load generator for gateway.py')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8344)
+    parser.add_argument('--admin-port', type=int, default=8345)
+    parser.add_argument('--nodes', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=1.0, help='upload rounds per second per node')
+    parser.add_argument('--burst', action='store_true', help='send as fast as the socket allows')
+    parser.add_argument('--compact', action='store_true', help='send compact wire.py frames instead of legacy text')
+    parser.add_argument('--duration', type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
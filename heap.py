@@ -0,0 +1,90 @@
+# 堆内存监控与 GC 调度
+# 控制循环每轮开始调用 begin()、结束调用 end() 统计本轮分配的字节数；
+# idle() 放在循环的空闲时段，空闲堆低于 reserve 时主动 gc.collect() 并记录停顿时间，
+# 避免堆耗尽时由分配器在循环中任意位置触发回收。
+import gc
+import time
+
+try:
+    from time import ticks_us, ticks_diff
+except ImportError:
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+# CPython（上位机重放/调试）没有 mem_free/mem_alloc，此时只计数不回收
+HAVE_HEAP = hasattr(gc, 'mem_free')
+
+
+class HeapMonitor:
+    def __init__(self, reserve=24 * 1024):
+        self.reserve = reserve      # 空闲堆低于此值时在空闲时段回收
+        self.mark = 0
+        self.loops = 0
+        self.measured = 0           # 可计量的轮次（本轮内没有发生非计划回收）
+        self.zero = 0               # 零分配轮次
+        self.last = 0               # 上一轮分配字节数
+        self.peak = 0
+        self.total = 0
+        self.unplanned = 0          # 循环内发生的自动回收次数（本轮分配计数回落）
+        self.collections = 0
+        self.pause_us = 0           # 上一次回收停顿
+        self.pause_max = 0
+        self.pause_total = 0
+
+    def begin(self):
+        if HAVE_HEAP:
+            self.mark = gc.mem_alloc()
+
+    def end(self):
+        # 返回本轮分配的字节数；本轮内发生过自动回收时无法计量，返回 -1
+        self.loops += 1
+        if not HAVE_HEAP:
+            return 0
+        used = gc.mem_alloc() - self.mark
+        if used < 0:
+            self.unplanned += 1
+            return -1
+        self.measured += 1
+        self.last = used
+        self.total += used
+        if used == 0:
+            self.zero += 1
+        if used > self.peak:
+            self.peak = used
+        return used
+
+    def idle(self, force=False):
+        # 返回本次回收的停顿时间（微秒），未回收返回 0
+        if not HAVE_HEAP or (not force and gc.mem_free() >= self.reserve):
+            return 0
+        t0 = ticks_us()
+        gc.collect()
+        pause = ticks_diff(ticks_us(), t0)
+        self.collections += 1
+        self.pause_us = pause
+        self.pause_total += pause
+        if pause > self.pause_max:
+            self.pause_max = pause
+        return pause
+
+    def stats(self):
+        return {
+            'free': gc.mem_free() if HAVE_HEAP else None,
+            'alloc': gc.mem_alloc() if HAVE_HEAP else None,
+            'loops': self.loops,
+            'alloc_last': self.last,
+            'alloc_avg': self.total // self.measured if self.measured else 0,
+            'alloc_peak': self.peak,
+            'zero_alloc_loops': self.zero,
+            'gc_count': self.collections,
+            'gc_unplanned': self.unplanned,
+            'gc_pause_us': self.pause_us,
+            'gc_pause_max_us': self.pause_max,
+            'gc_pause_avg_us': self.pause_total // self.collections if self.collections else 0,
+        }
+
+    def reset(self):
+        self.__init__(self.reserve)
@@ -0,0 +1,157 @@
+# Shared I2C bus manager
+# Wraps a machine.I2C / SoftI2C with the same method names, so drivers can be
+# given either one. Access is serialized with a lock, failed transfers are
+# retried with bounded exponential backoff, and per-device counters are kept.
+
+import time
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+try:
+    from time import ticks_us, ticks_diff, sleep_ms
+except ImportError:
+    def ticks_us():
+        return time.perf_counter_ns() // 1000
+
+    def ticks_diff(a, b):
+        return a - b
+
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)
+
+# per-device counter indices
+TX = 0
+BYTES = 1
+ERRORS = 2
+RETRIES = 3
+BUS_US = 4
+
+# transfer kinds dispatched by _call(); passing a small int instead of a bound
+# method and *args keeps each transfer free of heap allocations
+_WRITETO = 0
+_WRITEVTO = 1
+_READFROM = 2
+_READFROM_INTO = 3
+_READFROM_MEM = 4
+_READFROM_MEM_INTO = 5
+_WRITETO_MEM = 6
+
+
+class I2CBusError(OSError):
+    def __init__(self, addr, err):
+        super().__init__('I2C device 0x%02x: %s' % (addr, err))
+        self.addr = addr
+        self.err = err
+
+
+class I2CBus:
+    def __init__(self, i2c, name='i2c', retries=2, backoff_ms=1, max_backoff_ms=8):
+        self.i2c = i2c
+        self.name = name
+        self.retries = retries
+        self.backoff_ms = backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.lock = _thread.allocate_lock() if _thread else None
+        self.stats = {}
+        self.start_us = ticks_us()
+
+    def _counters(self, addr):
+        c = self.stats.get(addr)
+        if c is None:
+            c = self.stats[addr] = [0, 0, 0, 0, 0]
+        return c
+
+    def _call(self, op, addr, a, b):
+        i2c = self.i2c
+        if op == _READFROM_MEM_INTO:
+            return i2c.readfrom_mem_into(addr, a, b)
+        if op == _WRITEVTO:
+            return i2c.writevto(addr, a, b)
+        if op == _WRITETO:
+            return i2c.writeto(addr, a, b)
+        if op == _WRITETO_MEM:
+            return i2c.writeto_mem(addr, a, b)
+        if op == _READFROM_MEM:
+            return i2c.readfrom_mem(addr, a, b)
+        if op == _READFROM_INTO:
+            return i2c.readfrom_into(addr, a, b)
+        return i2c.readfrom(addr, a, b)
+
+    def _run(self, op, addr, nbytes, a, b):
+        c = self._counters(addr)
+        delay = self.backoff_ms
+        attempt = 0
+        while True:
+            if self.lock:
+                self.lock.acquire()
+            t0 = ticks_us()
+            try:
+                result = self._call(op, addr, a, b)
+                c[TX] += 1
+                c[BYTES] += nbytes
+                return result
+            except OSError as e:
+                c[ERRORS] += 1
+                if attempt >= self.retries:
+                    raise I2CBusError(addr, e)
+            finally:
+                c[BUS_US] += ticks_diff(ticks_us(), t0)
+                if self.lock:
+                    self.lock.release()
+            attempt += 1
+            c[RETRIES] += 1
+            sleep_ms(delay)
+            delay = min(delay * 2, self.max_backoff_ms)
+
+    # machine.I2C compatible methods
+
+    def scan(self):
+        return self.i2c.scan()
+
+    def writeto(self, addr, buf, stop=True):
+        return self._run(_WRITETO, addr, len(buf), buf, stop)
+
+    def writevto(self, addr, vector, stop=True):
+        n = 0
+        for b in vector:
+            n += len(b)
+        return self._run(_WRITEVTO, addr, n, vector, stop)
+
+    def readfrom(self, addr, nbytes, stop=True):
+        return self._run(_READFROM, addr, nbytes, nbytes, stop)
+
+    def readfrom_into(self, addr, buf, stop=True):
+        return self._run(_READFROM_INTO, addr, len(buf), buf, stop)
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        return self._run(_READFROM_MEM, addr, nbytes + 1, memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        return self._run(_READFROM_MEM_INTO, addr, len(buf) + 1, memaddr, buf)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        return self._run(_WRITETO_MEM, addr, len(buf) + 1, memaddr, buf)
+
+    # statistics
+
+    def utilization(self):
+        # fraction of wall time spent in transfers since start/reset
+        elapsed = ticks_diff(ticks_us(), self.start_us)
+        busy = 0
+        for c in self.stats.values():
+            busy += c[BUS_US]
+        return busy / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        out = {}
+        for addr, c in self.stats.items():
+            out['0x%02x' % addr] = {'tx': c[TX], 'bytes': c[BYTES], 'errors': c[ERRORS],
+                                    'retries': c[RETRIES], 'bus_ms': c[BUS_US] // 1000}
+        return out
+
+    def reset_stats(self):
+        self.stats = {}
+        self.start_us = ticks_us()
@@ -0,0 +1,50 @@
+# 将 PNG 等图片转换为 OLED 原始位图（上位机运行，需要 Pillow）
+# 输出为 MONO_VLSB 排列的 .bin 文件，可直接由 ssd1306.ImageCache 用 readinto() 读入。
+# 用法: python img2bin.py splash.png [-o splash.bin] [--size 128x96] [--invert] [--dither]
+# 生成后上传到开发板的 /img/ 目录，再调用 oled.show_image_file('splash')。
+import argparse
+import os
+
+from PIL import Image
+
+
+def to_vlsb(img, threshold=128):
+    width, height = img.size
+    pages = (height + 7) // 8
+    px = img.load()
+    data = bytearray(width * pages)
+    for page in range(pages):
+        for x in range(width):
+            byte = 0
+            for bit in range(8):
+                y = page * 8 + bit
+                if y < height and px[x, y] >= threshold:
+                    byte |= 1 << bit
+            data[page * width + x] = byte
+    return data
+
+
+def convert(path, width=128, height=96, invert=False, dither=False):
+    img = Image.open(path).convert('L').resize((width, height))
+    if invert:
+        img = img.point(lambda v: 255 - v)
+    if dither:
+        img = img.convert('1').convert('L')
+    return to_vlsb(img)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert images to raw MONO_VLSB .bin for the SSD1306')
+    parser.add_argument('images', nargs='+')
+    parser.add_argument('-o', '--output', help='output file (single input only)')
+    parser.add_argument('--size', default='128x96', help='WIDTHxHEIGHT')
+    parser.add_argument('--invert', action='store_true')
+    parser.add_argument('--dither', action='store_true', help='Floyd-Steinberg dithering instead of a hard threshold')
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    for path in args.images:
+        out = args.output if args.output and len(args.images) == 1 else os.path.splitext(path)[0] + '.bin'
+        data = convert(path, width, height, args.invert, args.dither)
+        with open(out, 'wb') as f:
+            f.write(data)
+        print(f'{path} -> {out} ({len(data)} bytes)')
@@ -0,0 +1,239 @@
+# 链路监管：WiFi 与服务器连接的状态机，由主循环每轮调用 poll()，不阻塞采样与控制
+#
+#   WIFI_DOWN --发起连接--> WIFI_JOIN --已连上--> TCP_DOWN --connect() 成功--> UP
+#       ^                      |超时                 |失败                    |
+#       +----------------------+---------------------+----- WiFi 断开 --------+
+#                                 TCP_DOWN <-- fail()（收发出错）/ 连接被关闭 --+
+#
+# - WLAN.connect() 本身不阻塞，WIFI_JOIN 每轮只查询一次 isconnected()
+# - 建立服务器连接由调用方的 connect()（创建传输层、订阅主题、连接）完成，阻塞时间受套接字超时限制
+# - 失败后按带抖动的指数退避重试：间隔在 [d/2, d) 内随机，d 从 min_ms 起每次加倍到 max_ms，
+#   多台设备在同一台 AP 重启后不会同时重连
+# - UP 状态下每 health_ms 检查一次 WiFi 与连接是否仍然有效
+# 时间一律用 ticks_ms 整数。
+import random
+
+import clock
+import evlog
+
+WIFI_DOWN = 0
+WIFI_JOIN = 1
+TCP_DOWN = 2
+UP = 3
+
+NAMES = ('wifi_down', 'wifi_join', 'tcp_down', 'up')
+
+
+def _later(now, ms):
+    # ticks_ms 加法，结果保持在 ticks 周期内（小整数）
+    return (now + ms) & 0x3FFFFFFF
+
+
+class LinkSupervisor:
+    def __init__(self, wlan, ssid, password, connect=None, join_ms=10000, min_ms=500, max_ms=60000,
+                 health_ms=5000):
+        self.wlan = wlan
+        self.ssid = ssid
+        self.password = password
+        self.connect = connect          # connect() -> 已连接并订阅的传输层对象，失败时抛出异常
+        self.join_ms = join_ms
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.health_ms = health_ms
+        self.client = None
+        self.state = WIFI_DOWN
+        self.since = clock.ticks_ms()   # 进入当前状态的时刻
+        self.next_ms = self.since       # 下次尝试/检查的时刻
+        self.backoff = 0                # 当前退避基数，0 表示下次立即尝试
+        self.failures = 0
+        self.reconnects = 0
+        self.last_error = None
+
+    def start(self):
+        # 上电后调用：打开 STA 接口，下一次 poll() 开始连接
+        self.wlan.active(True)
+        self._enter(WIFI_DOWN, clock.ticks_ms())
+
+    def attach(self, client):
+        # 直接使用已连接的传输层（上位机重放用）
+        self.client = client
+        self._enter(UP, clock.ticks_ms())
+
+    def _enter(self, state, now):
+        self.state = state
+        self.since = now
+        self.next_ms = now
+
+    def _retry(self, now, err):
+        # 记录失败并安排下一次尝试
+        self.failures += 1
+        self.last_error = err
+        self.backoff = self.min_ms if not self.backoff else min(self.backoff * 2, self.max_ms)
+        half = self.backoff >> 1
+        delay = half + random.getrandbits(16) % (half + 1)
+        self.next_ms = _later(now, delay)
+        evlog.log(evlog.E_LINK_FAIL, self.state == TCP_DOWN, evlog.errno(err), delay // 100, str(err)[:12])
+
+    def _due(self, now):
+        return clock.ticks_diff(now, self.next_ms) >= 0
+
+    def _drop(self):
+        if self.client:
+            try:
+                self.client.close()
+            except Exception:
+                pass
+            self.client = None
+
+    def fail(self, err=None):
+        # 收发出错时由调用方通知：关闭连接，退避后重连
+        now = clock.ticks_ms()
+        self._drop()
+        if self.state == UP:
+            self._enter(TCP_DOWN, now)
+            self._retry(now, err)
+
+    def poll(self):
+        # 每轮调用一次，返回可用的传输层对象或 None
+        now = clock.ticks_ms()
+        state = self.state
+        if state == UP:
+            if self._due(now):
+                self.next_ms = _later(now, self.health_ms)
+                if not self.wlan.isconnected():
+                    self._drop()
+                    self._enter(WIFI_DOWN, now)
+                    self._retry(now, 'wifi lost')
+                elif not self.client.connected:
+                    self._drop()
+                    self._enter(TCP_DOWN, now)
+                    self._retry(now, 'connection closed')
+        elif state == WIFI_DOWN:
+            if self.wlan.isconnected():
+                self._enter(TCP_DOWN, now)
+            elif self._due(now):
+                try:
+                    self.wlan.connect(self.ssid, self.password)
+                    self._enter(WIFI_JOIN, now)
+                except OSError as e:
+                    self._retry(now, e)
+        elif state == WIFI_JOIN:
+            if self.wlan.isconnected():
+                evlog.log(evlog.E_WIFI_UP, evlog.ip_code(self.wlan.ifconfig()[0]))
+                self._enter(TCP_DOWN, now)
+            elif clock.ticks_diff(now, self.since) >= self.join_ms:
+                try:
+                    self.wlan.disconnect()
+                except Exception:
+                    pass
+                self._enter(WIFI_DOWN, now)
+                self._retry(now, 'wifi join timeout')
+        elif self._due(now):
+            # TCP_DOWN
+            if not self.wlan.isconnected():
+                self._enter(WIFI_DOWN, now)
+            else:
+                try:
+                    self.client = self.connect()
+                except Exception as e:
+                    self.client = None
+                    self._retry(now, e)
+                else:
+                    if self.failures:
+                        self.reconnects += 1
+                    evlog.log(evlog.E_LINK_UP, self.reconnects)
+                    self.backoff = 0
+                    self._enter(UP, now)
+                    self.next_ms = _later(now, self.health_ms)
+        return self.client if self.state == UP else None
+
+    def wifi_up(self):
+        return self.state >= TCP_DOWN
+
+    def led(self, now):
+        # 状态灯电平（低电平点亮）：已连接常亮，正在连服务器快闪（4 Hz），WiFi 未连接慢闪（1 Hz）
+        if self.state == UP:
+            return 0
+        period = 250 if self.state == TCP_DOWN else 1000
+        return 0 if now % period < period // 2 else 1
+
+    def stats(self):
+        return {'state': NAMES[self.state], 'for_s': clock.ticks_diff(clock.ticks_ms(), self.since) // 1000,
+                'failures': self.failures, 'reconnects': self.reconnects, 'backoff_ms': self.backoff,
+                'last_error': None if self.last_error is None else str(self.last_error)}
+
+
+if __name__ == '__main__':
+    # 上位机运行：虚拟时钟下模拟 AP 在 30-75 s 重启、服务器在 120-150 s 拒绝连接，
+    # 主循环每 100 ms 调用一次 poll()，输出状态变化与恢复时间
+    vclock = clock.use(clock.VirtualClock())
+    random.seed(1)
+    AP_DOWN = (30, 75)
+    SERVER_DOWN = (120, 150)
+    JOIN_S = 2.5                     # AP 恢复后入网所需时间
+
+    def ap_up(t):
+        return not AP_DOWN[0] <= t < AP_DOWN[1]
+
+    class FakeWLAN:
+        def __init__(self):
+            self.joined_at = None
+
+        def active(self, on):
+            pass
+
+        def connect(self, ssid, password):
+            self.joined_at = vclock.now
+
+        def disconnect(self):
+            self.joined_at = None
+
+        def isconnected(self):
+            # 入网在 connect() 与 AP 恢复两者中较晚者之后 JOIN_S 秒完成；AP 掉线时连接随之断开
+            t = vclock.now
+            if not ap_up(t):
+                if self.joined_at is not None and self.joined_at < AP_DOWN[0]:
+                    self.joined_at = None
+                return False
+            return self.joined_at is not None and t - max(self.joined_at, AP_DOWN[1] if t >= AP_DOWN[1] else 0) >= JOIN_S
+
+        def ifconfig(self):
+            return ('192.168.1.50',)
+
+    class FakeClient:
+        connected = True
+
+        def close(self):
+            self.connected = False
+
+    def connect():
+        t = vclock.now
+        if not ap_up(t) or SERVER_DOWN[0] <= t < SERVER_DOWN[1]:
+            vclock.sleep(0.2)        # 连接被拒绝/超时所阻塞的时间
+            raise OSError('ECONNREFUSED')
+        return FakeClient()
+
+    evlog.current().sink = evlog.TextSink()
+    sup = LinkSupervisor(FakeWLAN(), 'ssid', 'pass', connect, join_ms=5000, min_ms=500, max_ms=8000)
+    sup.start()
+    last = None
+    up_at = {}
+    worst = 0.0
+    while vclock.now < 200:
+        t0 = vclock.now
+        client = sup.poll()
+        worst = max(worst, vclock.now - t0)
+        if client and ap_up(vclock.now) and SERVER_DOWN[0] <= vclock.now < SERVER_DOWN[1]:
+            sup.fail('send error')   # 服务器宕机时上行失败
+        if sup.state != last:
+            last = sup.state
+            print('%7.2f s  %s' % (vclock.now, NAMES[last]))
+            if last == UP:
+                up_at[len(up_at)] = vclock.now
+        evlog.drain()
+        vclock.sleep(0.1)
+    ups = sorted(up_at.values())
+    print('recovered %.1f s after the AP came back, %.1f s after the server came back' % (
+        next(t for t in ups if t >= AP_DOWN[1]) - AP_DOWN[1],
+        next(t for t in ups if t >= SERVER_DOWN[1]) - SERVER_DOWN[1]))
+    print('longest poll(): %.0f ms; %s' % (worst * 1000, sup.stats()))
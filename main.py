@@ -1,13 +1,28 @@
 from machine import Pin, I2C, PWM, ADC, SoftI2C
-from ssd1306 import SSD1306_I2C
-import dht, time, math
-import socket
+from ssd1306 import SSD1306_I2C, ImageCache, GlyphAtlas
+import dht, time, math, gc
+from array import array
 import network
 import machine
 import json
 import urequests
 import ujson
 import bmp280
+from i2cbus import I2CBus
+import alarm
+import filters
+import aggregate
+import wire
+import transport
+import status_server
+import heap
+import sampling
+import clock
+import recorder
+import display
+import link
+import evlog
+import control
 
 # ========== 参数配置 ==========
 # 全局变量用于存储传感器数据
@@ -26,16 +41,22 @@ height2_val = None
 show_threshold = False
 tap_status = "off"
 buzzer_on = False
-last_switch_time = 0
 SWITCH_INTERVAL = 2
 manual_override = False
 manual_override_timeout = 30
 last_manual_time = 0
+# 龙头/蜂鸣器/手动锁定的决策由 control.step() 完成；上面几个变量是其状态的镜像，供上报、显示与重放读取
+control_state = control.new_state(manual_override_timeout * 1000, SWITCH_INTERVAL * 1000)
+pending_remote = control.C_NONE     # 本轮收到、尚未交给控制状态机的远程命令
+pending_key = control.C_NONE        # 本轮按下、尚未交给控制状态机的按键命令
+CONTROL_MESSAGES = {'tapon': control.C_TAP_ON, 'tapoff': control.C_TAP_OFF,
+                    'buzzeron': control.C_BUZZER_ON, 'buzzeroff': control.C_BUZZER_OFF}
 last_alarm_time = 0
 last_temp_alarm_time = 0
 last_handled_message = None  # 新增：缓存最近处理的控制消息
 last_limit_message = None    # 新增：缓存最近处理的阈值消息
-alarms=[]
+alarm_count = 0              # 当前激活报警数量
+last_upload = 0
 # 数据记录变量
 record_count = 0
 MAX_RECORDS = 10
@@ -49,6 +70,63 @@ HUMIDITY_UPPER_LIMIT = 70.0
 HUMIDITY_LOWER_LIMIT = 30.0
 LUX_LOWER_LIMIT = 100
 LUX_UPPER_LIMIT = 10000
+# 阈值参数表（按键与远程共用），下标与 evlog.PARAMS、wire.THRESHOLD_FIELDS 顺序一致：
+# 偶数下标为上限、奇数为下限，配对参数为下标 ^ 1，设置后上下限不交叉；最小值为整数的参数按整数保存
+# (全局变量名, 远程名, 简写, 最小值, 最大值, 按键步长, 默认值)
+LIMIT_PARAMS = (
+    ('TEMP_UPPER_LIMIT', 'TEMPUPPER', 'TU', 0.0, 60.0, 1, 30.0),
+    ('TEMP_LOWER_LIMIT', 'TEMPLOWER', 'TL', -20.0, 40.0, 1, 15.0),
+    ('HUMIDITY_UPPER_LIMIT', 'HUMIDUPPER', 'HU', 20.0, 95.0, 2, 70.0),
+    ('HUMIDITY_LOWER_LIMIT', 'HUMIDLOWER', 'HL', 10.0, 80.0, 2, 30.0),
+    ('LUX_UPPER_LIMIT', 'LIGHTUPPER', 'LU', 500, 20000, 500, 10000),
+    ('LUX_LOWER_LIMIT', 'LIGHTLOWER', 'LL', 10, 5000, 100, 100),
+)
+LIMIT_KEYS = {p[0][:-6]: i for i, p in enumerate(LIMIT_PARAMS)}   # 按键参数名 'TEMP_UPPER' -> 下标
+limits_rev = 0               # 阈值任一变化时加一，显示与上传据此判断是否需要重新生成文本
+limits_seen = [None] * 6
+
+# 滤波配置：预设 0 关闭 / 1 轻度 / 2 中度 / 3 重度，可远程发送 SETFILTERLUX=3 等修改
+FILTER_CHANNELS = ('TEMP', 'HUM', 'LUX', 'PRESS')   # 通道号 = (站点-1)*4 + 下标
+F_TEMP, F_HUM, F_LUX, F_PRESS = 0, 1, 2, 3
+FILTER_CONFIG = {'TEMP': 2, 'HUM': 2, 'LUX': 3, 'PRESS': 1}
+SPIKE_LIMITS = {'TEMP': 3.0, 'HUM': 10.0, 'LUX': 5000, 'PRESS': 5.0}  # 单次采样允许的最大变化
+filter_bank = filters.FilterBank(2 * len(FILTER_CHANNELS))
+
+# 聚合上报：每通道在窗口内统计 最小/最大/平均，越过死区立即上报，否则每个窗口上报一次
+# 可远程发送 SETWINDOWTEMP=120（秒）、SETDEADBANDLUX=300（工程单位，0 关闭）修改
+# 开启后不再每秒上报，另在 TOPIC_AGG 上发送聚合帧；应用侧需能处理按窗口到达的数据后再开启
+UPLINK_AGGREGATE = False
+REPORT_WINDOW = {'TEMP': 60, 'HUM': 60, 'LUX': 60, 'PRESS': 300}
+REPORT_DEADBAND = {'TEMP': 0.5, 'HUM': 3.0, 'LUX': 500, 'PRESS': 1.0}
+aggregator = aggregate.Aggregator(2 * len(FILTER_CHANNELS))
+
+# 阈值主题的远程参数：名称 -> (类别, 参数)，一次字典查找完成分派
+# 单项 SETTEMPUPPER=32，或一帧多项 SET TU=32;HL=40;LL=200；帧前可加 "<序号>:"，序号相同的帧只应用一次
+P_LIMIT = 0
+P_FILTER = 1
+P_WINDOW = 2
+P_DEADBAND = 3
+REMOTE_SETTERS = {}
+for _i, _p in enumerate(LIMIT_PARAMS):
+    REMOTE_SETTERS[_p[1]] = REMOTE_SETTERS[_p[2]] = (P_LIMIT, _i)
+for _name in FILTER_CHANNELS:
+    REMOTE_SETTERS['FILTER' + _name] = (P_FILTER, _name)
+    REMOTE_SETTERS['WINDOW' + _name] = (P_WINDOW, _name)
+    REMOTE_SETTERS['DEADBAND' + _name] = (P_DEADBAND, _name)
+remote_seq = [None, None]    # 控制主题、阈值主题上次应用的帧序号
+
+# 自适应采样：数据源按信号变化快慢与距阈值远近调整采样间隔（sampling.py）
+ADAPTIVE_SAMPLING = True
+S_DHT1, S_DHT2, S_LUX1, S_LUX2, S_BMP1, S_BMP2 = 0, 1, 2, 3, 4, 5
+# 种类 -> (最短间隔 ms, 最长间隔 ms, 显著变化量, 第二个量的显著变化量, 接近阈值时的最长间隔 ms)
+# 变化量按滤波前的原始整数计：DHT22 温度/湿度 x10，光照 lux，气压 Pa（滤波器剔除尖峰期间输出不变，
+# 用滤波后的值会把阶跃误判为平稳）。DHT22 两次读取至少间隔 2 s；BMP280 一次转换约 14 ms；
+# 光照最长间隔即云层遮挡的最大发现延迟
+SAMPLING_CONFIG = {'DHT': (2000, 30000, 2, 10, 2000), 'LUX': (300, 1000, 100, 0, 300),
+                   'BMP': (20, 60000, 20, 0, 0)}
+NEAR_BAND = {'TEMP': 1.0, 'HUM': 3.0, 'LUX': 50}   # 距阈值小于该值时视为接近
+sampler = sampling.AdaptiveSampler(6)
+dht_alarm = bytearray(2)                           # 未到采样时刻时沿用上次的 DHT 报警掩码
 
 # 矩阵键盘配置
 ROW_PINS = [38, 37, 36, 35]
@@ -73,6 +151,20 @@ GAMMA = 0.7
 RL10 = 50
 Ro = 10000
 Vcc = 3.3
+ADC_MAX = 4095
+
+# 报警提示音：频率 (Hz), 持续时间 (ms), 重复次数
+ALARM_PATTERNS = {
+    'TEMP': (700, 300, 1),        # 哒（单短音，700 Hz，300 ms）
+    'HUM': (700, 300, 2),         # 哒-哒（两短音，700 Hz，300 ms）
+    'LIGHT_LOW':(1000, 300, 3),  # 滴-滴-滴-滴（三短音，1000 Hz，300 ms）
+    'LIGHT_HIGH': (1000, 300, 4),  # 滴-滴-滴-滴（四短音，1000 Hz，300 ms）
+    'ERROR': (500, 1000, 1),       # 哒（单长音，500 Hz，1000 ms）
+    'MANUAL': (500, 1000, 2),      # 哒-哒（两长音，500 Hz，1000 ms）
+    'OTHERS': (500, 1000, 3)       # 哒-哒（三长音，500 Hz，1000 ms）
+}
+# 优先级顺序（仅用于单一报警时选择模式）
+ALARM_PRIORITY = ('TEMP', 'HUM', 'LIGHT_LOW', 'LIGHT_HIGH', 'MANUAL', 'ERROR')
 
 # 硬件引脚（ESP32-S3）
 PIN_DHT1 = 11
@@ -92,6 +184,11 @@ I2C0_SDA = 18
 I2C1_SCL = 1
 I2C1_SDA = 2
 
+# 开机画面（/img/splash.bin，由 img2bin.py 生成，文件不存在时跳过）
+SPLASH_IMAGE = 'splash'
+# 16x16 汉字字库（mkatlas.py 生成）；存在时常规页在第 4 行显示该站点的报警文字，不存在时只显示 '!'
+HANZI_ATLAS = '/hanzi.bin'
+
 # 巴法云配置
 WIFI_SSID = "Lover3"
 WIFI_PASS = "hf201809"
@@ -99,22 +196,89 @@ CLIENT_ID = "5bcdd97db89144929f1594d50f7fc29e"
 serverIP = 'http://apis.bemfa.com/va/getmsg'
 SERVER_IP = 'bemfa.com'
 SERVER_PORT = 8344
+TRANSPORT = 'tcp'           # 'tcp' 巴法云 TCP 文本协议 / 'mqtt' 巴法云 MQTT
+MQTT_PORT = 9501
+MQTT_QOS = 0
+REMOTE_POLL = True          # 是否仍通过 HTTP 轮询控制/阈值消息（服务器推送可用时可关闭）
+REMOTE_POLL_INTERVAL = 5    # HTTP 轮询间隔（秒），每次轮询都会分配响应对象，不在每轮循环中进行
+last_remote_poll = 0
+STATUS_PORT = 80            # 局域网状态接口 http://<设备IP>/status
+STATUS_STATS_INTERVAL = 10  # /status 中运行计数（堆、链路、显示、采样、I2C、时钟等）的刷新间隔（秒）
+last_status_stats = None    # 上次刷新运行计数的 ticks_ms，None 表示尚未刷新
+ECHO_UPLINK = False         # 串口回显上行报文（cmd=2&topic=..&msg=..），供上位机 dashboard.py serial: 读取
 TOPIC_TEMP_1 = 'temp004'
 TOPIC_TEMP_2 = 'temp2004'
 TOPIC_TEMP_3 = 'temp3004'
 TOPIC_TEMP_4 = 'temp4004'
 TOPIC_TEMP_5 = 'temp5004'
 TOPIC_ALARM = 'alarm004'
+TOPIC_AGG = 'agg004'        # 聚合帧（wire.KIND_AGGREGATE），上位机用 wire.decode() 解析
 ALARM_INTERVAL = 1
+ALARM_DIGEST_INTERVAL = 60  # 报警摘要上报间隔（秒）
+alarm_mgr = alarm.AlarmManager(stations=2, digest_interval=ALARM_DIGEST_INTERVAL)
+UPLINK_COMPACT = False      # 紧凑编码（蜂窝网络站点建议开启），上位机用 wire.decode() 解析
+THRESHOLD_REFRESH = 60      # 紧凑模式下阈值未变化时的重发间隔（秒）
+UPLOAD_INTERVAL_MS = 1000   # 非聚合模式的上报间隔（毫秒，按 ticks_ms 计）
+UPLINK_BATCH = 0            # 紧凑模式下每帧打包的样本数（wire.KIND_SAMPLES，毫秒增量时间戳），0 为逐次发送
+sample_batch = wire.SampleBatch(max(UPLINK_BATCH, 1))
+NTP_HOST = 'ntp.aliyun.com'
+NTP_INTERVAL = 3600         # NTP 重新对时间隔（秒）；失败时每分钟重试
+CSV_FILES = ('/sensor1_test.csv', '/sensor2_test.csv')
+csv_last = None             # CSV 上一行的 ticks_ms，None 表示本次启动尚未写入
+uplink_bytes = 0            # 累计上行字节数
+last_threshold_frame = None
+last_threshold_time = 0
+# 上传帧缓存: [温度, 湿度, 光照, 气压, 海拔, 状态, 已生成的帧]，数值不变时直接复用帧字符串
+upload_cache = [[None] * 7, [None] * 7]
+threshold_cache = [None, None, None]   # [limits_rev, 帧, 是否紧凑编码]
+last_report_flags = None               # 聚合上报时上次发送的龙头/蜂鸣器状态
+last_batch_flags = 0                   # 批量缓冲中最后一个样本的龙头/蜂鸣器状态
+
+# 内存：稳态循环使用预分配缓冲，空闲堆低于 HEAP_RESERVE 时在空闲时段主动回收
+HEAP_RESERVE = 24 * 1024
+heap_mon = heap.HeapMonitor(HEAP_RESERVE)
+# 显示缓存: 每块屏上次显示的 [温度, 湿度, 光照, 气压, 海拔, limits_rev, 显示模式]
+shown = [None, [None] * 8, [None] * 8]
+
+# 链路监管：WiFi/服务器断开后在后台按带抖动的指数退避重连（毫秒），不阻塞控制循环
+LINK_JOIN_MS = 10000         # 单次 WiFi 入网等待上限
+LINK_BACKOFF_MS = (500, 60000)
+LINK_HEALTH_MS = 5000        # 已连接时检查 WiFi 与连接状态的间隔
+TCP_TIMEOUT = 3              # 连接服务器与收发的套接字超时（秒）
+
+# 事件日志：运行中的提示写成二进制事件记录（evlog），在空闲时段输出，不再阻塞在串口 print 上
+# LOG_SINK: 'serial' 串口输出 "@ev" 编码行（上位机 python evlog.py 解码）/ 'text' 板上渲染为文字 /
+#           'flash' 写入 LOG_PATH / None 只保留在内存环形缓冲
+LOG_LEVEL = evlog.INFO
+LOG_SINK = 'serial'
+LOG_CAPACITY = 128           # 环形缓冲记录数（每条 28 字节）
+LOG_DRAIN = 16               # 每轮空闲时段最多输出的记录数
+LOG_PATH = '/events.log'
+LOG_MAX_BYTES = 64 * 1024
+events = evlog.use(evlog.EventLog(LOG_CAPACITY, LOG_LEVEL))
+
+# 双屏刷新：两块 OLED 在各自的 I2C 总线上由辅助线程并行发送（需要 _thread）
+DISPLAY_THREADED = True
+
+# 现场记录（replay.py 重放）：记录传感器原始值、按键和远程消息，达到上限后停止
+TRACE_ENABLED = False
+TRACE_PATH = '/trace.bin'
+TRACE_MAX_BYTES = 512 * 1024
+tracer = recorder.NULL
 
 # ========== 硬件初始化 ==========
 try:
-    i2c0_oled = I2C(0, scl=Pin(I2C0_SCL), sda=Pin(I2C0_SDA), freq=400000)
-    i2c1_oled = I2C(1, scl=Pin(I2C1_SCL), sda=Pin(I2C1_SDA), freq=400000)
+    # 所有驱动都经由总线管理器访问 I2C（串行化、重试、按设备统计）
+    i2c0_oled = I2CBus(I2C(0, scl=Pin(I2C0_SCL), sda=Pin(I2C0_SDA), freq=400000), 'i2c0')
+    i2c1_oled = I2CBus(I2C(1, scl=Pin(I2C1_SCL), sda=Pin(I2C1_SDA), freq=400000), 'i2c1')
     oled1 = SSD1306_I2C(128, 64, i2c0_oled, addr=0x3C)
     oled2 = SSD1306_I2C(128, 64, i2c1_oled, addr=0x3C)
+    images = ImageCache(slots=1)  # 两块屏共用一个预分配的图片缓冲
+    oled1.use_images(images)
+    oled2.use_images(images)
+    screens = display.DualDisplay(oled1, oled2, DISPLAY_THREADED)
 
-    bmp_i2c = SoftI2C(sda=Pin(16), scl=Pin(17))
+    bmp_i2c = I2CBus(SoftI2C(sda=Pin(16), scl=Pin(17)), 'bmp')
     BMP1 = bmp280.BMP280(bmp_i2c)
     BMP2 = bmp280.BMP280(bmp_i2c)
 
@@ -130,223 +294,429 @@ try:
     led_r = Pin(PIN_LED_R, Pin.OUT, value=1)
     led_g = Pin(PIN_LED_G, Pin.OUT, value=1)
     status_led = Pin(PIN_STATUS_LED, Pin.OUT, value=1)
+    # WiFi 与服务器连接由 link_mgr 维护；tcp_client 为当前可用的连接，断开时为 None
+    link_mgr = link.LinkSupervisor(network.WLAN(network.STA_IF), WIFI_SSID, WIFI_PASS,
+                                   join_ms=LINK_JOIN_MS, min_ms=LINK_BACKOFF_MS[0],
+                                   max_ms=LINK_BACKOFF_MS[1], health_ms=LINK_HEALTH_MS)
     tcp_client = None
+    status_srv = None
 except Exception as e:
     print(f"Hardware initialization error: {e}")
     raise
 
 # ========== 函数定义 ==========
-def adjust_value(param, operation):
-    global TEMP_UPPER_LIMIT, TEMP_LOWER_LIMIT, HUMIDITY_UPPER_LIMIT, HUMIDITY_LOWER_LIMIT, LUX_UPPER_LIMIT, LUX_LOWER_LIMIT
-    global tap_status, last_switch_time, manual_override, last_manual_time, buzzer_on, show_threshold
+def set_limit(i, value, remote=0):
+    # 按参数表限幅后写入对应的全局变量；越过配对参数时同步调整配对参数
+    p = LIMIT_PARAMS[i]
+    if type(p[3]) is int:
+        value = int(value)
+    value = min(max(value, p[3]), p[4])
+    g = globals()
+    g[p[0]] = value
+    pair = LIMIT_PARAMS[i ^ 1][0]
+    if (value > g[pair]) if i & 1 else (value < g[pair]):
+        g[pair] = value
+        evlog.log(evlog.E_LIMIT_SYNC, i ^ 1, fixed(value), remote)
+    evlog.log(evlog.E_LIMIT, i, fixed(value), remote)
 
-    current_time = time.time()
-    if param in ["SWITCH", "BUZZER"] and current_time - last_switch_time < SWITCH_INTERVAL:
-        return
+def restore_limits(remote=0):
+    g = globals()
+    for p in LIMIT_PARAMS:
+        g[p[0]] = p[6]
+    evlog.log(evlog.E_RESET, remote)
+
+def adjust_value(param, operation):
+    global pending_key, show_threshold
 
-    if param == "TEMP_UPPER":
-        old_value = TEMP_UPPER_LIMIT
-        TEMP_UPPER_LIMIT = min(old_value + 1, 60.0) if operation == "+" else max(old_value - 1, 0.0)
-        if TEMP_UPPER_LIMIT < TEMP_LOWER_LIMIT:
-            TEMP_LOWER_LIMIT = TEMP_UPPER_LIMIT
-            print(f"温度下限已同步调整为: {TEMP_LOWER_LIMIT}℃")
-        print(f"温度上限: {TEMP_UPPER_LIMIT}℃")
-    elif param == "TEMP_LOWER":
-        old_value = TEMP_LOWER_LIMIT
-        TEMP_LOWER_LIMIT = min(old_value + 1, 40.0) if operation == "+" else max(old_value - 1, -20.0)
-        if TEMP_LOWER_LIMIT > TEMP_UPPER_LIMIT:
-            TEMP_UPPER_LIMIT = TEMP_LOWER_LIMIT
-            print(f"温度上限已同步调整为: {TEMP_UPPER_LIMIT}℃")
-        print(f"温度下限: {TEMP_LOWER_LIMIT}℃")
-    elif param == "HUMIDITY_UPPER":
-        old_value = HUMIDITY_UPPER_LIMIT
-        HUMIDITY_UPPER_LIMIT = min(old_value + 2, 95.0) if operation == "+" else max(old_value - 2, 20.0)
-        if HUMIDITY_UPPER_LIMIT < HUMIDITY_LOWER_LIMIT:
-            HUMIDITY_LOWER_LIMIT = HUMIDITY_UPPER_LIMIT
-            print(f"湿度下限已同步调整为: {HUMIDITY_LOWER_LIMIT}%")
-        print(f"湿度上限: {HUMIDITY_UPPER_LIMIT}%")
-    elif param == "HUMIDITY_LOWER":
-        old_value = HUMIDITY_LOWER_LIMIT
-        HUMIDITY_LOWER_LIMIT = min(old_value + 2, 80.0) if operation == "+" else max(old_value - 2, 10.0)
-        if HUMIDITY_LOWER_LIMIT > HUMIDITY_UPPER_LIMIT:
-            HUMIDITY_UPPER_LIMIT = HUMIDITY_LOWER_LIMIT
-            print(f"湿度上限已同步调整为: {HUMIDITY_UPPER_LIMIT}%")
-        print(f"湿度下限: {HUMIDITY_LOWER_LIMIT}%")
-    elif param == "LUX_UPPER":
-        old_value = LUX_UPPER_LIMIT
-        LUX_UPPER_LIMIT = min(old_value + 500, 20000) if operation == "+" else max(old_value - 500, 500)
-        if LUX_UPPER_LIMIT < LUX_LOWER_LIMIT:
-            LUX_LOWER_LIMIT = LUX_UPPER_LIMIT
-            print(f"光照下限已同步调整为: {LUX_LOWER_LIMIT}lux")
-        print(f"光照上限: {LUX_UPPER_LIMIT}lux")
-    elif param == "LUX_LOWER":
-        old_value = LUX_LOWER_LIMIT
-        LUX_LOWER_LIMIT = min(old_value + 100, 5000) if operation == "+" else max(old_value - 100, 10)
-        if LUX_LOWER_LIMIT > LUX_UPPER_LIMIT:
-            LUX_UPPER_LIMIT = LUX_LOWER_LIMIT
-            print(f"光照上限已同步调整为: {LUX_UPPER_LIMIT}lux")
-        print(f"光照下限: {LUX_LOWER_LIMIT}lux")
+    i = LIMIT_KEYS.get(param)
+    if i is not None:
+        p = LIMIT_PARAMS[i]
+        set_limit(i, globals()[p[0]] + (p[5] if operation == "+" else -p[5]))
     elif param == "PRINT":
         show_threshold = not show_threshold
-        print(f"切换显示模式: {'阈值显示' if show_threshold else '正常参数显示'}")
-        print("当前参数值:")
-        print(f"温度上限: {TEMP_UPPER_LIMIT}℃, 温度下限: {TEMP_LOWER_LIMIT}℃")
-        print(f"湿度上限: {HUMIDITY_UPPER_LIMIT}%, 湿度下限: {HUMIDITY_LOWER_LIMIT}%")
-        print(f"光照上限: {LUX_UPPER_LIMIT}lux, 光照下限: {LUX_LOWER_LIMIT}lux")
+        evlog.log(evlog.E_DISPLAY_MODE, show_threshold)
+        evlog.log(evlog.E_LIMITS, 0, fixed(TEMP_UPPER_LIMIT), fixed(TEMP_LOWER_LIMIT))
+        evlog.log(evlog.E_LIMITS, 1, fixed(HUMIDITY_UPPER_LIMIT), fixed(HUMIDITY_LOWER_LIMIT))
+        evlog.log(evlog.E_LIMITS, 2, fixed(LUX_UPPER_LIMIT), fixed(LUX_LOWER_LIMIT))
     elif param == "RESET":
-        TEMP_UPPER_LIMIT = 30.0
-        TEMP_LOWER_LIMIT = 15.0
-        HUMIDITY_UPPER_LIMIT = 70.0
-        HUMIDITY_LOWER_LIMIT = 30.0
-        LUX_UPPER_LIMIT = 10000
-        LUX_LOWER_LIMIT = 100
-        print("所有参数已重置为默认值。")
+        restore_limits()
     elif param == "SWITCH":
-        print("切换龙头 (按键优先级)")
-        manual_override = True
-        last_manual_time = current_time
-        if tap_status == "on":
-            tap_status = "off"
-            led_g.value(1)
-            led_r.value(0)
-        else:
-            tap_status = "on"
-            led_g.value(0)
-            led_r.value(1)
-        last_switch_time = current_time
+        pending_key = control.K_SWITCH   # 切换间隔与优先级由 update_control() 处理
     elif param == "BUZZER":
-        print("切换蜂鸣器")
-        buzzer_on = not buzzer_on
-        if buzzer_on:
-            buzzer.duty(512)
-            trigger_alarm(["MANUAL"])  # 手动触发报警
-        else:
-            buzzer.duty(0)
-        print('状态:', 'on' if buzzer_on else 'off')
-        last_switch_time = current_time
+        pending_key = control.K_BUZZER
 
 def handle_keyboard():
     global show_threshold
-    for i, row in enumerate(row_pins):
+    # 按下标遍历，避免每轮扫描创建 enumerate 对象和元组
+    for i in range(len(row_pins)):
+        row = row_pins[i]
         for r in row_pins:
             r.value(0)
         row.value(1)
-        time.sleep_ms(20)
-        for j, col in enumerate(col_pins):
-            if col.value() == 1:
+        clock.sleep_ms(20)
+        for j in range(len(col_pins)):
+            if col_pins[j].value() == 1:
                 key = KEYBOARD_MATRIX[i][j]
-                print(f"按键: {key} 被按下")
+                tracer.key(key)
+                evlog.log(evlog.E_KEY, ord(key))
                 if key == "*":
                     show_threshold = not show_threshold
-                    print(f"切换显示模式: {'阈值显示' if show_threshold else '正常参数显示'}")
+                    evlog.log(evlog.E_DISPLAY_MODE, show_threshold)
                 elif key in KEY_FUNCTIONS:
                     param, operation = KEY_FUNCTIONS[key]
                     adjust_value(param, operation)
                 return
         row.value(0)
-    time.sleep(0.1)
+    clock.sleep(0.1)
 
 def display_parameters(oled1, oled2):
+    # 两块屏的阈值页相同：画在第一块屏上，复制到第二块屏后并行刷新
+    if not (refresh(shown[1], 5, limits_rev) + refresh(shown[1], 6, True)):
+        return
+    shown[2][6] = True
     oled1.fill(0)
-    oled2.fill(0)
     oled1.text(f"Temp Up: {TEMP_UPPER_LIMIT} C", 0, 0)
     oled1.text(f"Temp Low: {TEMP_LOWER_LIMIT} C", 0, 10)
     oled1.text(f"Hum Up: {HUMIDITY_UPPER_LIMIT}%", 0, 20)
     oled1.text(f"Hum Low: {HUMIDITY_LOWER_LIMIT}%", 0, 30)
     oled1.text(f"Lux Up: {LUX_UPPER_LIMIT}lux", 0, 40)
     oled1.text(f"Lux Low: {LUX_LOWER_LIMIT}lux", 0, 50)
-    oled2.text(f"Temp Up: {TEMP_UPPER_LIMIT} C", 0, 0)
-    oled2.text(f"Temp Low: {TEMP_LOWER_LIMIT} C", 0, 10)
-    oled2.text(f"Hum Up: {HUMIDITY_UPPER_LIMIT}%", 0, 20)
-    oled2.text(f"Hum Low: {HUMIDITY_LOWER_LIMIT}%", 0, 30)
-    oled2.text(f"Lux Up: {LUX_UPPER_LIMIT}lux", 0, 40)
-    oled2.text(f"Lux Low: {LUX_LOWER_LIMIT}lux", 0, 50)
-    oled1.show()
-    oled2.show()
+    screens.mirror()
+    screens.show()
+
+def configure_filters():
+    for station in (1, 2):
+        for kind, name in enumerate(FILTER_CHANNELS):
+            filter_bank.configure((station - 1) * 4 + kind, FILTER_CONFIG[name], SPIKE_LIMITS[name])
+    # 气压同时使用 BMP280 片内 IIR
+    iir = filters.PRESETS[FILTER_CONFIG['PRESS']][3]
+    for bmp in (BMP1, BMP2):
+        try:
+            bmp.set_filter(iir)
+        except Exception as e:
+            evlog.error(evlog.E_BMP_FILTER_ERR, 0, e)
+
+def configure_logging():
+    if LOG_SINK == 'serial':
+        events.sink = evlog.SerialSink()
+    elif LOG_SINK == 'text':
+        events.sink = evlog.TextSink()
+    elif LOG_SINK == 'flash':
+        try:
+            events.sink = evlog.FileSink(LOG_PATH, LOG_MAX_BYTES)
+        except OSError as e:
+            print(f"Event log error: {e}")
+    evlog.log(evlog.E_BOOT, machine.reset_cause())
+
+def configure_sampling():
+    for kind, sources in (('DHT', (S_DHT1, S_DHT2)), ('LUX', (S_LUX1, S_LUX2)), ('BMP', (S_BMP1, S_BMP2))):
+        min_ms, max_ms, delta, delta2, near_ms = SAMPLING_CONFIG[kind]
+        if not ADAPTIVE_SAMPLING:
+            max_ms = min_ms = 0       # 每轮都采样
+        for i, source in enumerate(sources):
+            sampler.configure(source, '%s%d' % (kind.lower(), i + 1), min_ms, max_ms, delta, delta2, near_ms)
+
+def sample_sensors():
+    # 到期的数据源才读取；读数变化、接近阈值、滤波未收敛或读取失败时调度器缩短该数据源的间隔
+    global lux1_val, lux2_val
+    now = clock.ticks_ms()
+    band = NEAR_BAND['LUX']
+    if sampler.due(S_LUX1, now):
+        raw = read_lux(light1_ao, 1)
+        lux1_val = filter_bank.update_fixed(F_LUX, raw)
+        sampler.update(S_LUX1, now, raw, None, filter_bank.settling(F_LUX) or
+                       sampling.near_limit(lux1_val, LUX_LOWER_LIMIT, LUX_UPPER_LIMIT, band))
+    if sampler.due(S_LUX2, now):
+        raw = read_lux(light2_ao, 2)
+        lux2_val = filter_bank.update_fixed(4 + F_LUX, raw)
+        sampler.update(S_LUX2, now, raw, None, filter_bank.settling(4 + F_LUX) or
+                       sampling.near_limit(lux2_val, LUX_LOWER_LIMIT, LUX_UPPER_LIMIT, band))
+    if sampler.due(S_DHT1, now):
+        dht_alarm[0] = check_sensor(dht1, 1)
+        sample_dht(S_DHT1, now, dht1, 0, temp1_val, hum1_val)
+    if sampler.due(S_DHT2, now):
+        dht_alarm[1] = check_sensor(dht2, 2)
+        sample_dht(S_DHT2, now, dht2, 4, temp2_val, hum2_val)
+    if sampler.due(S_BMP1, now):
+        read_bmp(BMP1, 1)
+        sampler.update(S_BMP1, now, BMP1.P if pressure1_val is not None else None, None,
+                       filter_bank.settling(F_PRESS))
+    if sampler.due(S_BMP2, now):
+        read_bmp(BMP2, 2)
+        sampler.update(S_BMP2, now, BMP2.P if pressure2_val is not None else None, None,
+                       filter_bank.settling(4 + F_PRESS))
+
+def sample_dht(source, now, sensor, base, temp, hum):
+    if temp is None:
+        sampler.update(source, now, None)
+        return
+    # 滤波器仍在跟进阶跃，或读数接近阈值时保持最短间隔
+    near = (filter_bank.settling(base + F_TEMP) or filter_bank.settling(base + F_HUM) or
+            sampling.near_limit(temp, TEMP_LOWER_LIMIT, TEMP_UPPER_LIMIT, NEAR_BAND['TEMP']) or
+            sampling.near_limit(hum, HUMIDITY_LOWER_LIMIT, HUMIDITY_UPPER_LIMIT, NEAR_BAND['HUM']))
+    sampler.update(source, now, dht22_temp_x10(sensor), dht22_hum_x10(sensor), near)
+
+def set_filter_preset(name, preset):
+    if name not in FILTER_CONFIG or not 0 <= preset < len(filters.PRESETS):
+        evlog.log(evlog.E_BAD_FILTER, 0, preset, 0, name)
+        return
+    FILTER_CONFIG[name] = preset
+    configure_filters()
+    evlog.log(evlog.E_FILTER, 0, preset, 0, name)
+
+def configure_reporting():
+    now = clock.time()
+    for station in (1, 2):
+        for kind, name in enumerate(FILTER_CHANNELS):
+            aggregator.configure((station - 1) * 4 + kind, REPORT_WINDOW[name], REPORT_DEADBAND[name], now)
+
+def set_report_param(table, name, value):
+    # table 为 REPORT_WINDOW 或 REPORT_DEADBAND
+    if name not in table or value < 0 or (table is REPORT_WINDOW and not 1 <= value <= 3600):
+        evlog.log(evlog.E_BAD_REPORT, 0, fixed(value), 0, name)
+        return
+    table[name] = int(value) if table is REPORT_WINDOW else value
+    configure_reporting()
+    evlog.log(evlog.E_REPORT, table is REPORT_WINDOW, fixed(table[name]), 0, name)
 
 def calculate_lux(adc_sensor):
     try:
-        raw = adc_sensor.read()
-        if raw == 0:
-            return 0.0
-        voltage = raw / 4095.0 * Vcc
-        if voltage >= 3.2:
-            return 0.0
-        resistance = Ro * voltage / (Vcc - voltage)
-        if resistance <= 0:
-            return 0.0
-        lux = math.pow((RL10 * 1000 * math.pow(10, GAMMA) / resistance), (1 / GAMMA))
-        return min(lux, 100000.0)
+        return lux_from_raw(adc_sensor.read())
     except Exception as e:
-        print("光照计算错误:", e)
+        evlog.error(evlog.E_LUX_ERR, 0, e)
+        return 0.0
+
+def lux_from_raw(raw):
+    if raw == 0:
+        return 0.0
+    voltage = raw / 4095.0 * Vcc
+    if voltage >= 3.2:
         return 0.0
+    resistance = Ro * voltage / (Vcc - voltage)
+    if resistance <= 0:
+        return 0.0
+    lux = math.pow((RL10 * 1000 * math.pow(10, GAMMA) / resistance), (1 / GAMMA))
+    return min(lux, 100000.0)
+
+# ADC 原始值 -> 整数光照查表（启动时计算一次，16 KB），循环中读取光照不做浮点运算
+LUX_TABLE = array('i', bytes(4 * (ADC_MAX + 1)))
+for _raw in range(ADC_MAX + 1):
+    LUX_TABLE[_raw] = int(lux_from_raw(_raw))
+
+def read_lux(adc_sensor, station):
+    try:
+        raw = adc_sensor.read() & ADC_MAX
+        tracer.lux(station, raw)
+        return LUX_TABLE[raw]
+    except Exception as e:
+        evlog.error(evlog.E_LUX_ERR, station, e)
+        return 0
 
 def check_light_status(adc_sensor, digital_sensor):
     lux = calculate_lux(adc_sensor)
     digital_val = digital_sensor.value()
     return lux < LUX_LOWER_LIMIT or lux > LUX_UPPER_LIMIT or digital_val == 0
 
-def wifi_connect():
-    sta_if = network.WLAN(network.STA_IF)
-    if not sta_if.isconnected():
-        print('Connecting to WiFi...')
-        sta_if.active(True)
-        sta_if.connect(WIFI_SSID, WIFI_PASS)
-        for _ in range(20):
-            if sta_if.isconnected():
-                print('WiFi connected:', sta_if.ifconfig())
-                return True
-            time.sleep(0.5)
-    return False
-
-def tcp_connect():
-    global tcp_client
+def open_transport():
+    # 由 link_mgr 在 WiFi 已连接时调用：创建传输层、订阅主题并连接，失败时抛出异常
+    if TRANSPORT == 'mqtt':
+        client = transport.create('mqtt', CLIENT_ID, SERVER_IP, port=MQTT_PORT, qos=MQTT_QOS)
+    else:
+        client = transport.create('tcp', CLIENT_ID, SERVER_IP, port=SERVER_PORT, timeout=TCP_TIMEOUT)
+    # 订阅控制/阈值主题后，服务器会直接推送远程命令；每次重连都重新订阅
+    for topic in (TOPIC_TEMP_1, TOPIC_TEMP_2, TOPIC_TEMP_3, TOPIC_ALARM, TOPIC_TEMP_4, TOPIC_TEMP_5):
+        client.subscribe(topic)
     try:
-        addr = socket.getaddrinfo(SERVER_IP, SERVER_PORT)[0][-1]
-        tcp_client = socket.socket()
-        tcp_client.connect(addr)
-        tcp_client.settimeout(5)
-        subs = [TOPIC_TEMP_1, TOPIC_TEMP_2, TOPIC_TEMP_3, TOPIC_ALARM]
-        for topic in subs:
-            cmd = f'cmd=1&uid={CLIENT_ID}&topic={topic}\r\n'
-            tcp_client.send(cmd.encode())
-        status_led.value(0)
-        return True
-    except Exception as e:
-        print('TCP connect failed:', e)
-        status_led.value(1)
-        if tcp_client:
-            tcp_client.close()
-            tcp_client = None
-        return False
+        client.connect()
+    except Exception:
+        client.close()
+        raise
+    return client
 
-def send_data(topic, *values):
-    global tcp_client
+def send_data(topic, msg):
+    # msg 为完整载荷（#...#）；同一主题重复发送相同内容时传输层复用已编码的数据
+    global tcp_client, uplink_bytes
+    if ECHO_UPLINK:
+        print('cmd=2&topic=%s&msg=%s' % (topic, msg))
     try:
         if tcp_client:
-            msg = "#".join(map(str, values))
-            cmd = f'cmd=2&uid={CLIENT_ID}&topic={topic}&msg=#{msg}#\r\n'
-            tcp_client.send(cmd.encode())
+            uplink_bytes += tcp_client.publish(topic, msg)
             return True
     except Exception as e:
-        print('Send error:', e)
-        if tcp_client:
-            tcp_client.close()
-            tcp_client = None
+        evlog.error(evlog.E_SEND_ERR, 0, e)
+        link_mgr.fail(e)  # 关闭连接，由 link_mgr 在后台重连
+        tcp_client = None
     return False
 
-def send_alarm(alarms):
+def send_alarm():
+    # 仅上报报警跳变（R/C）与周期摘要（D），文本由应用侧通过 alarm.describe() 还原
     global last_alarm_time
-    if time.time() - last_alarm_time > ALARM_INTERVAL and alarms:
-        message = "\t".join(alarms)
-        if send_data(TOPIC_ALARM, message):
-            last_alarm_time = time.time()
-            return True
+    if clock.elapsed_ms(last_alarm_time) < ALARM_INTERVAL * 1000:
+        return False
+    current_time = clock.time()
+    frame = alarm_mgr.poll(current_time)
+    if frame and send_data(TOPIC_ALARM, f'#{frame}#'):
+        alarm_mgr.ack(current_time)
+        last_alarm_time = clock.ticks_ms()
+        return True
+    return False
+
+def send_thresholds(current_time, frame):
+    # 阈值仅在变化或超过刷新间隔时发送
+    global last_threshold_frame, last_threshold_time
+    if frame != last_threshold_frame or current_time - last_threshold_time >= THRESHOLD_REFRESH:
+        if send_data(TOPIC_TEMP_3, frame):
+            last_threshold_frame = frame
+            last_threshold_time = current_time
+
+def upload_batch(current_time):
+    # 样本以 ticks_ms 记时进入批量缓冲，满 UPLINK_BATCH 条或龙头/蜂鸣器状态变化时发送
+    global last_batch_flags
+    b = sample_batch
+    flags = (1 if tap_status == 'on' else 0) | (2 if buzzer_on else 0)
+    changed = b.count and flags != last_batch_flags
+    last_batch_flags = flags
+    stations = ((temp1_val, hum1_val, lux1_val, pressure1_val, height1_val),
+                (temp2_val, hum2_val, lux2_val, pressure2_val, height2_val))
+    now = clock.ticks_ms()
+    if not b.add(now, flags, stations):
+        flush_batch()
+        b.add(now, flags, stations)
+    if changed or b.count >= UPLINK_BATCH:
+        flush_batch()
+    send_thresholds(current_time, threshold_frame())
+
+def flush_batch():
+    b = sample_batch
+    if b.count:
+        send_data(TOPIC_TEMP_1, '#%s#' % b.frame(clock.epoch_ms(b.first), clock.synced()))
+        b.clear()
+
+def sync_clock():
+    if clock.sync(NTP_HOST):
+        # 事件日志按此记录把之后的 ticks_ms 换算为 UTC
+        evlog.log(evlog.E_CLOCK, clock.epoch_ms() // 1000, clock.last_correction())
+        return True
+    evlog.log(evlog.E_NTP_FAIL)
     return False
 
+def upload_compact(current_time):
+    # 两个站点合并为一帧
+    frame = wire.encode_telemetry(
+        ((temp1_val, hum1_val, lux1_val, pressure1_val, height1_val),
+         (temp2_val, hum2_val, lux2_val, pressure2_val, height2_val)),
+        tap_status == 'on', buzzer_on)
+    send_data(TOPIC_TEMP_1, f'#{frame}#')
+    send_thresholds(current_time, threshold_frame())
+
+def aggregate_samples():
+    aggregator.add(F_TEMP, temp1_val)
+    aggregator.add(F_HUM, hum1_val)
+    aggregator.add(F_LUX, lux1_val)
+    aggregator.add(F_PRESS, pressure1_val)
+    aggregator.add(4 + F_TEMP, temp2_val)
+    aggregator.add(4 + F_HUM, hum2_val)
+    aggregator.add(4 + F_LUX, lux2_val)
+    aggregator.add(4 + F_PRESS, pressure2_val)
+
+def upload_aggregated(current_time):
+    # 有通道越过死区或窗口到期时才上报：站点数据帧（当前值）+ 到期通道的聚合帧；
+    # 龙头/蜂鸣器状态变化时立即补发站点数据帧
+    global last_report_flags
+    due = aggregator.poll(current_time)
+    flags = (1 if tap_status == 'on' else 0) | (2 if buzzer_on else 0)
+    stations = due
+    if flags != last_report_flags:
+        stations |= 0xFF
+        last_report_flags = flags
+    if stations:
+        if UPLINK_COMPACT:
+            frame = wire.encode_telemetry(
+                ((temp1_val, hum1_val, lux1_val, pressure1_val, height1_val),
+                 (temp2_val, hum2_val, lux2_val, pressure2_val, height2_val)),
+                flags & 1, flags & 2)
+            send_data(TOPIC_TEMP_1, f'#{frame}#')
+        else:
+            if stations & 0x0F:
+                send_data(TOPIC_TEMP_1, legacy_frame(1, temp1_val, hum1_val, lux1_val, pressure1_val,
+                                                     height1_val, tap_status == 'on'))
+            if stations & 0xF0:
+                send_data(TOPIC_TEMP_2, legacy_frame(2, temp2_val, hum2_val, lux2_val, pressure2_val,
+                                                     height2_val, buzzer_on))
+    if due:
+        entries = []
+        for ch, count, vmin, vmax, mean in aggregator.report(due, current_time):
+            entries.append((ch // 4 + 1, ch % 4, count, vmin, vmax, mean))
+        send_data(TOPIC_AGG, f'#{wire.encode_aggregate(entries, flags & 1, flags & 2)}#')
+    send_thresholds(current_time, threshold_frame())
+
+def refresh(cache, i, value):
+    # 与缓存比较并更新，返回是否变化；只比较已有对象，不分配内存
+    if cache[i] == value:
+        return 0
+    cache[i] = value
+    return 1
+
+def fixed(value, scale=10):
+    # 事件日志参数用定点整数，缺失值记为 0
+    return 0 if value is None else round(value * scale)
+
+def check_limits():
+    # 阈值在按键、远程命令等多处修改，这里统一比较一次并更新 limits_rev
+    global limits_rev
+    c = limits_seen
+    if (refresh(c, 0, TEMP_UPPER_LIMIT) + refresh(c, 1, TEMP_LOWER_LIMIT) +
+            refresh(c, 2, HUMIDITY_UPPER_LIMIT) + refresh(c, 3, HUMIDITY_LOWER_LIMIT) +
+            refresh(c, 4, LUX_UPPER_LIMIT) + refresh(c, 5, LUX_LOWER_LIMIT)):
+        limits_rev += 1
+
+def fmt1(value):
+    return f"{value:.1f}" if value is not None else "0"
+
+def legacy_frame(station, temp, hum, lux, pressure, height, on):
+    c = upload_cache[station - 1]
+    if (refresh(c, 0, temp) + refresh(c, 1, hum) + refresh(c, 2, lux) + refresh(c, 3, pressure) +
+            refresh(c, 4, height) + refresh(c, 5, on)) or c[6] is None:
+        c[6] = '#%s#%s#%s#%s#%s#%s#' % (fmt1(temp), fmt1(hum),
+                                        str(int(lux)) if lux is not None else "0",
+                                        fmt1(pressure),
+                                        f"{height}" if height is not None else "0",
+                                        '已开启' if on else '已关闭')
+    return c[6]
+
+def threshold_frame():
+    c = threshold_cache
+    if refresh(c, 0, limits_rev) + refresh(c, 2, UPLINK_COMPACT) or c[1] is None:
+        if UPLINK_COMPACT:
+            c[1] = '#%s#' % wire.encode_thresholds(TEMP_UPPER_LIMIT, TEMP_LOWER_LIMIT,
+                                                    HUMIDITY_UPPER_LIMIT, HUMIDITY_LOWER_LIMIT,
+                                                    LUX_UPPER_LIMIT, LUX_LOWER_LIMIT)
+            return c[1]
+        c[1] = '#%s#%s#%s#%s#%s#%s#' % (f"{TEMP_UPPER_LIMIT:.1f}", f"{TEMP_LOWER_LIMIT:.1f}",
+                                        f"{HUMIDITY_UPPER_LIMIT:.1f}", f"{HUMIDITY_LOWER_LIMIT:.1f}",
+                                        str(int(LUX_UPPER_LIMIT)), str(int(LUX_LOWER_LIMIT)))
+    return c[1]
+
+def upload_legacy():
+    send_data(TOPIC_TEMP_1, legacy_frame(1, temp1_val, hum1_val, lux1_val, pressure1_val, height1_val,
+                                         tap_status == 'on'))
+    send_data(TOPIC_TEMP_2, legacy_frame(2, temp2_val, hum2_val, lux2_val, pressure2_val, height2_val,
+                                         buzzer_on))
+    send_data(TOPIC_TEMP_3, threshold_frame())
+
+def light_alarm_mask(lux):
+    if lux is None:
+        return alarm.SENSOR_ERR
+    if lux < LUX_LOWER_LIMIT:
+        trigger_alarm("LIGHT_LOW")
+        return alarm.LUX_LOW
+    if lux > LUX_UPPER_LIMIT:
+        trigger_alarm("LIGHT_HIGH")
+        return alarm.LUX_HIGH
+    return 0
+
 def trigger_alarm(alarm_types):
     global last_temp_alarm_time
-    global alarms
     if not alarm_types:  # 如果没有报警类型，直接返回
         return
 
@@ -356,27 +726,16 @@ def trigger_alarm(alarm_types):
 #         print(f"[alarm] 冷却中，跳过报警 (剩余时间: {ALARM_COOLDOWN - (current_time - last_temp_alarm_time):.1f}s)")
 #         return
 
-    # 基本报警模式：频率 (Hz), 持续时间 (ms), 重复次数
-    patterns = {
-        'TEMP': (700, 300, 1),        # 哒（单短音，700 Hz，300 ms）
-        'HUM': (700, 300, 2),         # 哒-哒（两短音，700 Hz，300 ms）
-        'LIGHT_LOW':(1000, 300, 3),  # 滴-滴-滴-滴（三短音，1000 Hz，300 ms）
-        'LIGHT_HIGH': (1000, 300, 4),  # 滴-滴-滴-滴（四短音，1000 Hz，300 ms）
-        'ERROR': (500, 1000, 1),       # 哒（单长音，500 Hz，1000 ms）
-        'MANUAL': (500, 1000, 2),      # 哒-哒（两长音，500 Hz，1000 ms）
-        'OTHERS': (500, 1000, 3)       # 哒-哒（三长音，500 Hz，1000 ms）
-    }
-
-    # 优先级顺序（仅用于单一报警时选择模式）
-    priority = ['TEMP', 'HUM', 'LIGHT_LOW', 'LIGHT_HIGH', 'MANUAL', 'ERROR']
-    
+    patterns = ALARM_PATTERNS
+    priority = ALARM_PRIORITY
+
     # 如果是多种参数报警，合并为 OTHERS
 #     if len(alarm_types) > 1:
 #         alarm_description = "OTHERS"
 #         freq, duration, repeat = patterns['OTHERS']
 
     # 单一报警，按优先级选择模式
-    if len(alarms)>1:
+    if alarm_count>1:
         alarm_description = "OTHERS"
         freq, duration, repeat = patterns['OTHERS']
         
@@ -389,71 +748,95 @@ def trigger_alarm(alarm_types):
     
         alarm_description = primary_alarm
         if not primary_alarm:
-            print(f"[alarm] 无有效报警类型: {alarm_types}")
+            evlog.log(evlog.E_ALARM_NONE)
             return
 
     
     
 
     # 触发报警
-    print(f"[alarm] 触发报警: {alarm_description}, {freq} Hz, {duration} ms, {repeat} 次")
+    evlog.log(evlog.E_ALARM, evlog.ALARMS.index(alarm_description), freq, duration, repeat)
     for _ in range(repeat):
         buzzer.freq(freq)
         buzzer.duty(512)
         buzzer_on=True
-        time.sleep_ms(duration)
+        clock.sleep_ms(duration)
         buzzer.duty(0)
         buzzer_on=False
-        time.sleep_ms(150)
+        clock.sleep_ms(150)
 
     #last_temp_alarm_time = current_time
 
+def dht22_temp_x10(sensor):
+    # 直接读取 DHT22 驱动的原始缓冲（0.1 ℃），避免 temperature() 每次生成浮点数
+    b = sensor.buf
+    t = (b[2] & 0x7F) << 8 | b[3]
+    return -t if b[2] & 0x80 else t
+
+def dht22_hum_x10(sensor):
+    b = sensor.buf
+    return b[0] << 8 | b[1]
+
 def check_sensor(sensor, sensor_id):
+    # 读数写入 temp/hum 全局变量，返回报警位掩码（不返回元组）
+    global temp1_val, hum1_val, temp2_val, hum2_val
     try:
         sensor.measure()
-        temp = sensor.temperature()
-        hum = sensor.humidity()
-        alarms = []
+        tracer.dht(sensor_id, sensor.buf)
+        base = (sensor_id - 1) * 4
+        temp = filter_bank.update_fixed(base + F_TEMP, dht22_temp_x10(sensor), 10)
+        hum = filter_bank.update_fixed(base + F_HUM, dht22_hum_x10(sensor), 10)
+        if sensor_id == 1:
+            temp1_val, hum1_val = temp, hum
+        else:
+            temp2_val, hum2_val = temp, hum
+        mask = 0
         if temp > TEMP_UPPER_LIMIT:
-            alarms.append(f"{sensor_id}-温度过高")
+            mask |= alarm.TEMP_HIGH
             trigger_alarm("TEMP")
         if temp < TEMP_LOWER_LIMIT:
-            alarms.append(f"{sensor_id}-温度过低")
+            mask |= alarm.TEMP_LOW
             trigger_alarm("TEMP")
         if hum > HUMIDITY_UPPER_LIMIT:
-            alarms.append(f"{sensor_id}-湿度过高")
+            mask |= alarm.HUM_HIGH
             trigger_alarm("HUM")
         if hum < HUMIDITY_LOWER_LIMIT:
-            alarms.append(f"{sensor_id}-湿度过低")
+            mask |= alarm.HUM_LOW
             trigger_alarm("HUM")
-        return temp, hum, alarms if alarms else None
+        return mask
     except Exception as e:
-        print(f"Sensor {sensor_id} error:", e)
+        evlog.error(evlog.E_DHT_ERR, sensor_id, e)
+        tracer.dht_error(sensor_id)
         trigger_alarm("ERROR")
-        return None, None, ['error']
+        if sensor_id == 1:
+            temp1_val, hum1_val = None, None
+        else:
+            temp2_val, hum2_val = None, None
+        return alarm.SENSOR_ERR
 
 def save_to_csv():
     global temp1_val, hum1_val, lux1_val, pressure1_val, height1_val
     global temp2_val, hum2_val, lux2_val, pressure2_val, height2_val, tap_status, buzzer_on
+    global csv_last
     
     try:
-        t = time.localtime()
-        timestamp = f"{t[0]:04d}-{t[1]:02d}-{t[2]:02d} {t[3]:02d}:{t[4]:02d}:{t[5]:02d}"
+        # 首列为距上一行的毫秒数（ticks_ms 差值）；每次启动后的第一段先写表头和
+        # "#base_ms=<首行 UTC 毫秒>,synced=<0/1>"，上位机按此累加还原绝对时间
+        now = clock.ticks_ms()
+        if csv_last is None:
+            session = "Delta(ms),Temp(C),Hum(%),Lux,Pressure(hPa),Height(m),Tap_Status,Buzzer_On\n" + \
+                      "#base_ms=%d,synced=%d\n" % (clock.epoch_ms(now), clock.synced())
+            timestamp = "0"
+        else:
+            session = None
+            timestamp = str(clock.ticks_diff(now, csv_last))
+        csv_last = now
         
-        # 合并调试日志为一行
-        vars_info = [
-            f"temp1={temp1_val}({type(temp1_val).__name__})",
-            f"hum1={hum1_val}({type(hum1_val).__name__})",
-            f"lux1={lux1_val}({type(lux1_val).__name__})",
-            f"pressure1={pressure1_val}({type(pressure1_val).__name__})",
-            f"height1={height1_val}({type(height1_val).__name__})",
-            f"temp2={temp2_val}({type(temp2_val).__name__})",
-            f"hum2={hum2_val}({type(hum2_val).__name__})",
-            f"lux2={lux2_val}({type(lux2_val).__name__})",
-            f"pressure2={pressure2_val}({type(pressure2_val).__name__})",
-            f"height2={height2_val}({type(height2_val).__name__})"
-        ]
-        print(f"[csv] 变量状态: {', '.join(vars_info)}")
+        # 调试事件（DEBUG 级别，默认不记录）
+        evlog.log(evlog.E_CSV_STATION, 1, fixed(temp1_val), fixed(hum1_val), fixed(lux1_val, 1))
+        evlog.log(evlog.E_CSV_AIR, 1, fixed(pressure1_val), fixed(height1_val, 100))
+        evlog.log(evlog.E_CSV_STATION, 2, fixed(temp2_val), fixed(hum2_val), fixed(lux2_val, 1))
+        evlog.log(evlog.E_CSV_AIR, 2, fixed(pressure2_val), fixed(height2_val, 100))
         
         def format_value(val, is_float=True):
             if val is None:
@@ -461,8 +844,7 @@ def save_to_csv():
             try:
                 val_float = float(val)
                 return f"{val_float:.1f}" if is_float else f"{int(val_float)}"
-            except (ValueError, TypeError) as e:
-                print(f"[csv] 格式化失败: {val} (类型: {type(val).__name__}, 错误: {e})")
+            except (ValueError, TypeError):
                 return "N/A"
         
         sensor1_data = [
@@ -487,53 +869,73 @@ def save_to_csv():
             str(buzzer_on)
         ]
         
-        sensor1_file = "/sensor1_test.csv"
-        sensor2_file = "/sensor2_test.csv"
-        
-        header = "Timestamp,Temp(C),Hum(%),Lux,Pressure(hPa),Height(m),Tap_Status,Buzzer_On\n"
+        sensor1_file, sensor2_file = CSV_FILES
         
         with open(sensor1_file, 'a') as f:
-            f.write(header)
+            if session:
+                f.write(session)
             f.write(','.join(str(x) for x in sensor1_data) + '\n')
         
         with open(sensor2_file, 'a') as f:
-            f.write(header)
+            if session:
+                f.write(session)
             f.write(','.join(str(x) for x in sensor2_data) + '\n')
         
-        print(f"[csv] 数据已保存到 {sensor1_file} 和 {sensor2_file}")
+        evlog.log(evlog.E_CSV_SAVED)
     
     except Exception as e:
-        print(f"[csv] 保存数据失败: {e}")
+        evlog.error(evlog.E_CSV_ERR, 0, e)
 
-def update_leds(temp1, temp2):
-    global tap_status, buzzer_on, manual_override, last_manual_time
-    current_time = time.time()
-    
+def temp_class(temp1, temp2):
     if (temp1 is not None and temp1 > TEMP_UPPER_LIMIT) or (temp2 is not None and temp2 > TEMP_UPPER_LIMIT):
-        tap_status = 'on'
-        buzzer_on = True
-        led_g.value(0)
-        led_r.value(1)
-        print(f"温度超上限: tap_status 强制设为 on (优先级最高)")
-        return
+        return control.T_HOT
+    if temp1 is None or temp2 is None:
+        return control.T_UNKNOWN
+    return control.T_OK
+
+def update_control(temp1, temp2):
+    # 本轮的温度、远程命令与按键交给 control.step()，这里只把输出作用到引脚并同步状态变量
+    global tap_status, buzzer_on, manual_override, last_manual_time, pending_remote, pending_key
+    s = control_state
+    now = clock.ticks_ms()
+    remote, key = pending_remote, pending_key
+    pending_remote = pending_key = control.C_NONE
+    out = control.step(s, now, temp_class(temp1, temp2), remote, key)
+    on = out & control.O_TAP
+    led_g.value(0 if on else 1)
+    led_r.value(1 if on else 0)
+    if out & control.O_DRIVE:
+        buzzer.duty(512 if out & control.O_BUZZER else 0)
+    tap_status = 'on' if on else 'off'
+    buzzer_on = bool(out & control.O_BUZZER)
+    manual_override = bool(s[control.HOLD])
+    last_manual_time = s[control.HOLD_T]
 
-    if not manual_override or (current_time - last_manual_time >= manual_override_timeout):
-        temp1_ok = temp1 is not None and temp1 <= TEMP_UPPER_LIMIT
-        temp2_ok = temp2 is not None and temp2 <= TEMP_UPPER_LIMIT
-        if temp1_ok and temp2_ok:
-            tap_status = 'off'
-            led_g.value(1)
-            led_r.value(0)
+    if out & control.O_REMOTE:
+        if remote <= control.C_TAP_OFF:
+            evlog.log(evlog.E_REMOTE_TAP, remote == control.C_TAP_ON)
         else:
-            tap_status = 'on'
-            buzzer_on = True
-            led_g.value(0)
-            led_r.value(1)
-        #print(f"温度控制: tap_status 设为 {tap_status} (优先级最低)")
-    else:
-        print(f"手动/远程锁定: 温度控制被忽略 (剩余时间: {manual_override_timeout - (current_time - last_manual_time):.1f}s)")
+            evlog.log(evlog.E_REMOTE_BUZZER, remote == control.C_BUZZER_ON)
+    if out & control.O_KEY:
+        if key == control.K_SWITCH:
+            evlog.log(evlog.E_TAP_KEY, on)
+        else:
+            evlog.log(evlog.E_BUZZER_KEY, buzzer_on)
+    reason = control.reason(out)
+    if reason == control.R_FORCED:
+        evlog.log(evlog.E_OVER_TEMP)
+    elif reason == control.R_HOLD:
+        evlog.log(evlog.E_OVERRIDE, control.hold_left(s, now) // 100)
+    if out & control.O_BEEP:
+        trigger_alarm(["MANUAL"])  # 手动触发报警
 
 def display_normal(oled, sensor_id, temp, hum, lux, pressure, height):
+    # 显示内容未变化时不重绘，也就不生成新的字符串；返回是否需要刷新（由 update_display 统一发送）
+    c = shown[sensor_id]
+    if not (refresh(c, 0, temp) + refresh(c, 1, hum) + refresh(c, 2, lux) + refresh(c, 3, pressure) +
+            refresh(c, 4, height) + refresh(c, 5, limits_rev) + refresh(c, 6, False) +
+            refresh(c, 7, alarm_mgr.mask(sensor_id))):
+        return False
     oled.fill(0)
     oled.text(f'S#{sensor_id}', 0, 0)
     oled.text(f'L:{int(lux) if lux is not None else 0}', 50, 0)
@@ -544,141 +946,157 @@ def display_normal(oled, sensor_id, temp, hum, lux, pressure, height):
     oled.text(f'{hum:.1f} %' if hum is not None else 'N/A', 70, 30)
     pressure_str = f'{pressure:.1f}hPa' if pressure is not None else 'N/A'
     height_str = f'{height}m' if height is not None else 'N/A'
-    oled.text(f'P:{pressure_str}', 0, 45)
-    oled.text(f'H:{height_str}', 0, 55)
+    mask = c[7]
+    if mask and oled.atlas:
+        # 有报警时用字库显示第一条报警文字，代替气压/海拔两行
+        bit = 0
+        while not mask >> bit & 1:
+            bit += 1
+        oled.show_text_hanzi(4, 0, alarm.ALARM_TEXT.get(bit, 'ALARM'))
+    else:
+        oled.text(f'P:{pressure_str}', 0, 45)
+        oled.text(f'H:{height_str}', 0, 55)
     if temp is not None and (temp > TEMP_UPPER_LIMIT or temp < TEMP_LOWER_LIMIT):
         oled.text('!', 115, 20)
     if hum is not None and (hum > HUMIDITY_UPPER_LIMIT or hum < HUMIDITY_LOWER_LIMIT):
         oled.text('!', 115, 40)
     if lux is not None and (lux < LUX_LOWER_LIMIT or lux > LUX_UPPER_LIMIT):
         oled.text('!', 115, 0)
-    oled.show()
+    return True
+
+def poll_remote(topic, slot):
+    # HTTP 轮询主题的最新消息；带序号的消息先在原始文本中比较序号，与上次相同时不解析 JSON，返回 None
+    response = urequests.get(serverIP + '?uid=' + CLIENT_ID + '&topic=' + topic + '&type=3')
+    try:
+        text = response.text
+    finally:
+        response.close()
+    i = text.find('"msg"')
+    if i >= 0:
+        j = text.find('"', text.find(':', i + 5)) + 1
+        k = j
+        while k < len(text) and '0' <= text[k] <= '9':
+            k += 1
+        if j < k < len(text) and text[k] == ':' and int(text[j:k]) == remote_seq[slot]:
+            return None
+    return ujson.loads(text)["data"][0]['msg']
+
+def remote_frame(slot, msg):
+    # 去掉 "<序号>:" 前缀并记下序号；序号与上次应用的相同（重复帧）时返回 None，无序号的帧原样返回
+    i = msg.find(':')
+    if 0 < i < 10 and msg[:i].isdigit():
+        seq = int(msg[:i])
+        if seq == remote_seq[slot]:
+            return None
+        remote_seq[slot] = seq
+        return msg[i + 1:]
+    return msg
 
 def handle_tcp_message():
-    global tap_status, buzzer_on, temp1_val, temp2_val, last_switch_time, manual_override, last_manual_time, last_handled_message
     try:
-        response = urequests.get(serverIP + '?uid=' + CLIENT_ID + '&topic=' + TOPIC_TEMP_4 + '&type=3')
-        parsed = ujson.loads(response.text)
-        data = parsed["data"][0]
-        msg = data['msg']
-        
-#         # 检查是否为已处理的消息
-#         if msg == last_handled_message:
-#             print(f"[remote] 跳过重复消息: {msg}")
-#             return
-        
-        current_time = time.time()
-        #print(f"[remote] Received message: {msg}")
-        
-        # 远程控制仅在按键间隔后生效
-        if current_time - last_switch_time >= SWITCH_INTERVAL:
-            if msg == "tapon" and tap_status != "on":
-                tap_status = 'on'
-                led_g.value(0)
-                led_r.value(1)
-                manual_override = True
-                last_manual_time = current_time
-                last_switch_time = current_time
-                print(f"[remote] 远程控制: tap_status 设为 on (优先级中)")
-            elif msg == "tapoff" and tap_status != "off":
-                tap_status = 'off'
-                led_g.value(1)
-                led_r.value(0)
-                manual_override = True
-                last_manual_time = current_time
-                last_switch_time = current_time
-                print(f"[remote] 远程控制: tap_status 设为 off (优先级中)")
-            elif msg == "buzzeron" and not buzzer_on:
-                buzzer.duty(512)
-                buzzer_on = True
-                print(f"[remote] 蜂鸣器开启")
-            elif msg == "buzzeroff" and buzzer_on:
-                buzzer.duty(0)
-                buzzer_on = False
-                print(f"[remote] 蜂鸣器关闭")
-            
-            # 更新已处理的消息
-            last_handled_message = msg
-        
-        update_leds(temp1_val, temp2_val)
-        time.sleep(0.1)
+        msg = poll_remote(TOPIC_TEMP_4, 0)
+        if msg is not None:
+            apply_control_message(msg)
+            clock.sleep(0.1)
 
     except Exception as e:
-        print(f"[remote] TCP message error: {e}")
+        evlog.error(evlog.E_REMOTE_POLL_ERR, 0, e)
+
+def apply_control_message(msg):
+    global pending_remote, last_handled_message
+    tracer.msg(4, msg)
+
+#     # 检查是否为已处理的消息
+#     if msg == last_handled_message:
+#         print(f"[remote] 跳过重复消息: {msg}")
+#         return
+
+    # 命令在本轮 update_control() 中按优先级与切换间隔处理；带序号的重复帧不再生效
+    body = remote_frame(0, msg)
+    cmd = CONTROL_MESSAGES.get(body) if body is not None else None
+    if cmd:
+        pending_remote = cmd
+    last_handled_message = msg
 
 def set_limit_message():
-    global TEMP_UPPER_LIMIT, TEMP_LOWER_LIMIT, HUMIDITY_UPPER_LIMIT, HUMIDITY_LOWER_LIMIT, LUX_UPPER_LIMIT, LUX_LOWER_LIMIT, last_limit_message
     try:
-        response = urequests.get(serverIP + '?uid=' + CLIENT_ID + '&topic=' + TOPIC_TEMP_5 + '&type=3')
-        parsed = ujson.loads(response.text)
-        data = parsed["data"][0]
-        msg = data['msg']
-        
-        # 检查是否为已处理的消息
-        if msg == last_limit_message:
-            #print(f"[remote] 跳过重复阈值消息: {msg}")
-            return
-        
-        #print(f"[remote] 处理阈值消息: {msg}")
-        
-        if '=' in msg:
-            param_name, value_str = msg.split('=', 1)
-            try:
-                value = float(value_str)
-                if param_name == 'SETTEMPUPPER':
-                    TEMP_UPPER_LIMIT = min(max(value, 0.0), 60.0)
-                    if TEMP_UPPER_LIMIT < TEMP_LOWER_LIMIT:
-                        TEMP_LOWER_LIMIT = TEMP_UPPER_LIMIT
-                        print(f"[remote] 温度下限已同步调整为: {TEMP_LOWER_LIMIT}")
-                    print(f"[remote] 设置温度上限: {TEMP_UPPER_LIMIT}")
-                elif param_name == 'SETTEMPLOWER':
-                    TEMP_LOWER_LIMIT = min(max(value, -20.0), 40.0)
-                    if TEMP_LOWER_LIMIT > TEMP_UPPER_LIMIT:
-                        TEMP_UPPER_LIMIT = TEMP_LOWER_LIMIT
-                        print(f"[remote] 温度上限已同步调整为: {TEMP_UPPER_LIMIT}")
-                    print(f"[remote] 设置温度下限: {TEMP_LOWER_LIMIT}")
-                elif param_name == 'SETHUMIDUPPER':
-                    HUMIDITY_UPPER_LIMIT = min(max(value, 20.0), 95.0)
-                    if HUMIDITY_UPPER_LIMIT < HUMIDITY_LOWER_LIMIT:
-                        HUMIDITY_LOWER_LIMIT = HUMIDITY_UPPER_LIMIT
-                        print(f"[remote] 湿度下限已同步调整为: {HUMIDITY_LOWER_LIMIT}")
-                    print(f"[remote] 设置湿度上限: {HUMIDITY_UPPER_LIMIT}")
-                elif param_name == 'SETHUMIDLOWER':
-                    HUMIDITY_LOWER_LIMIT = min(max(value, 10.0), 80.0)
-                    if HUMIDITY_LOWER_LIMIT > HUMIDITY_UPPER_LIMIT:
-                        HUMIDITY_UPPER_LIMIT = HUMIDITY_LOWER_LIMIT
-                        print(f"[remote] 湿度上限已同步调整为: {HUMIDITY_UPPER_LIMIT}")
-                    print(f"[remote] 设置湿度下限: {HUMIDITY_LOWER_LIMIT}")
-                elif param_name == 'SETLIGHTUPPER':
-                    LUX_UPPER_LIMIT = min(max(int(value), 500), 20000)
-                    if LUX_UPPER_LIMIT < LUX_LOWER_LIMIT:
-                        LUX_LOWER_LIMIT = LUX_UPPER_LIMIT
-                        print(f"[remote] 光照下限已同步调整为: {LUX_LOWER_LIMIT}")
-                    print(f"[remote] 设置光照上限: {LUX_UPPER_LIMIT}")
-                elif param_name == 'SETLIGHTLOWER':
-                    LUX_LOWER_LIMIT = min(max(int(value), 10), 5000)
-                    if LUX_LOWER_LIMIT > LUX_UPPER_LIMIT:
-                        LUX_UPPER_LIMIT = LUX_LOWER_LIMIT
-                        print(f"[remote] 设置光照上限: {LUX_UPPER_LIMIT}")
-                    print(f"[remote] 设置光照下限: {LUX_LOWER_LIMIT}")
-            except ValueError:
-                print(f"[remote] 无效的数值: {value_str} for {param_name}")
-        elif 'RESTORE' in msg:
-            
-            TEMP_UPPER_LIMIT = 30.0
-            TEMP_LOWER_LIMIT = 15.0
-            HUMIDITY_UPPER_LIMIT = 70.0
-            HUMIDITY_LOWER_LIMIT = 30.0
-            LUX_UPPER_LIMIT = 10000
-            LUX_LOWER_LIMIT = 100
-            
-            print("[remote] 所有参数已重置为默认值。")
-        
-        # 更新已处理的消息
-        last_limit_message = msg
+        msg = poll_remote(TOPIC_TEMP_5, 1)
+        if msg is not None:
+            apply_limit_message(msg)
 
     except Exception as e:
-        print(f"[remote] Error setting threshold: {e}")
+        evlog.error(evlog.E_REMOTE_POLL_ERR, 1, e)
+
+def apply_settings(body):
+    # "TEMPUPPER=32" 或 "TU=32;HL=40;LL=200"：先全部解析，有一项无效时整帧不应用；
+    # 各项按顺序应用，与逐条发送的结果相同，阈值版本号在本轮只增加一次
+    items = []
+    for part in body.split(';'):
+        kv = part.split('=', 1)
+        setter = REMOTE_SETTERS.get(kv[0].strip())
+        if setter is None or len(kv) < 2:
+            raise ValueError(part)
+        items.append((setter[0], setter[1], float(kv[1])))
+    for kind, arg, value in items:
+        if kind == P_LIMIT:
+            set_limit(arg, value, 1)
+        elif kind == P_FILTER:
+            set_filter_preset(arg, int(value))
+        elif kind == P_WINDOW:
+            set_report_param(REPORT_WINDOW, arg, value)
+        else:
+            set_report_param(REPORT_DEADBAND, arg, value)
+
+def apply_limit_message(msg):
+    global last_limit_message
+    tracer.msg(5, msg)
+    # 检查是否为已处理的消息
+    if msg == last_limit_message:
+        return
+    last_limit_message = msg
+    body = remote_frame(1, msg)
+    if body is None:
+        return
+    if body.startswith('SET'):
+        try:
+            apply_settings(body[3:].strip())
+        except ValueError:
+            evlog.log(evlog.E_REMOTE_BAD_VALUE, 0, 0, 0, msg[:12])
+    elif 'RESTORE' in body:
+        restore_limits(1)
+
+def publish_status():
+    # 由状态服务在收到请求时回调；仅更新变化的字段，JSON 快照在变化后才重新生成
+    # 事件字段（读数、阈值、龙头等）每次请求都检查；每次调用都会变化的运行计数
+    # 最多每 STATUS_STATS_INTERVAL 秒刷新一次，其间的请求直接复用缓存的快照
+    global last_status_stats
+    status_srv.set('station1', [temp1_val, hum1_val, lux1_val, pressure1_val, height1_val])
+    status_srv.set('station2', [temp2_val, hum2_val, lux2_val, pressure2_val, height2_val])
+    status_srv.set('thresholds', [TEMP_UPPER_LIMIT, TEMP_LOWER_LIMIT, HUMIDITY_UPPER_LIMIT,
+                                  HUMIDITY_LOWER_LIMIT, LUX_UPPER_LIMIT, LUX_LOWER_LIMIT])
+    status_srv.set('tap', tap_status)
+    status_srv.set('buzzer', buzzer_on)
+    status_srv.set('manual_override', manual_override)
+    status_srv.set('alarms', [alarm_mgr.mask(1), alarm_mgr.mask(2)])
+    status_srv.set('online', tcp_client is not None)
+    status_srv.set('remote_seq', list(remote_seq))
+    status_srv.set('filters', [FILTER_CONFIG[name] for name in FILTER_CHANNELS])
+    status_srv.set('report', {'aggregate': UPLINK_AGGREGATE,
+                              'window': [REPORT_WINDOW[name] for name in FILTER_CHANNELS],
+                              'deadband': [REPORT_DEADBAND[name] for name in FILTER_CHANNELS]})
+    if last_status_stats is not None and clock.elapsed_ms(last_status_stats) < STATUS_STATS_INTERVAL * 1000:
+        return
+    last_status_stats = clock.ticks_ms()
+    status_srv.set('link', link_mgr.stats())
+    status_srv.set('log', events.stats())
+    status_srv.set('uplink_bytes', uplink_bytes)
+    status_srv.set('i2c', {bus.name: {'util': round(bus.utilization(), 3), 'devices': bus.report()}
+                           for bus in (i2c0_oled, i2c1_oled, bmp_i2c)})
+    status_srv.set('heap', heap_mon.stats())
+    status_srv.set('display', screens.stats())
+    status_srv.set('sampling', sampler.report())
+    status_srv.set('clock', {'synced': clock.synced(), 'epoch_ms': clock.epoch_ms(),
+                             'correction_ms': clock.last_correction()})
 
 def update_display():
     global show_threshold, temp1_val, hum1_val, lux1_val, temp2_val, hum2_val, lux2_val
@@ -686,154 +1104,153 @@ def update_display():
     if show_threshold:
         display_parameters(oled1, oled2)
     else:
-        display_normal(oled1, 1, temp1_val, hum1_val, lux1_val, pressure1_val, height1_val)
-        display_normal(oled2, 2, temp2_val, hum2_val, lux2_val, pressure2_val, height2_val)
+        # 两块屏都有变化时并行刷新，只有一块变化时只刷新这一块
+        which = display_normal(oled1, 1, temp1_val, hum1_val, lux1_val, pressure1_val, height1_val)
+        if display_normal(oled2, 2, temp2_val, hum2_val, lux2_val, pressure2_val, height2_val):
+            which |= display.SECOND
+        if which:
+            screens.show(which)
 
-def main():
-    global tcp_client, temp1_val, hum1_val, lux1_val, temp2_val, hum2_val, lux2_val
+def read_bmp(bmp, station):
+    # 读数写入 pressure/height 全局变量，读取失败时为 None
     global pressure1_val, height1_val, pressure2_val, height2_val
-    global record_count, last_record_time
-    global last_handled_message
-    global alarms
-    oled1.fill(0)
-    oled1.text("Initializing...", 0, 20)
-    oled1.show()
-    oled2.fill(0)
-    oled2.text("Initializing...", 0, 20)
-    oled2.show()
+    pressure = height = None
+    try:
+        data = bmp.get()
+        if data:
+            tracer.bmp(station, bmp.adc_T, bmp.adc_P)
+            pressure = filter_bank.update_fixed((station - 1) * 4 + F_PRESS, data[1], 100)
+            height = bmp.getAltitude()
+        else:
+            tracer.bmp_error(station)
+            evlog.log(evlog.E_BMP_INVALID, station)
+    except Exception as e:
+        tracer.bmp_error(station)
+        evlog.error(evlog.E_BMP_ERR, station, e)
+    if station == 1:
+        pressure1_val, height1_val = pressure, height
+    else:
+        pressure2_val, height2_val = pressure, height
 
-    if not wifi_connect():
-        oled1.fill(0)
-        oled1.text("WiFi Error!", 0, 30)
-        oled1.show()
-        return
-    if not tcp_connect():
+def setup():
+    global status_srv, last_upload, last_record_time, last_handled_message, tracer
+    try:
         oled1.fill(0)
-        oled1.text("TCP Error!", 0, 30)
-        oled1.show()
-        return
+        oled1.show_image_file(SPLASH_IMAGE)
+        screens.mirror()
+        screens.show()
+        clock.sleep(1)
+    except OSError:
+        pass
+    screens.message("Initializing...", 0, 20)
+    configure_logging()
+    try:
+        atlas = GlyphAtlas.load(HANZI_ATLAS)  # 两块屏共用一个字库缓冲
+        oled1.use_atlas(atlas)
+        oled2.use_atlas(atlas)
+    except OSError:
+        pass
+
+    # 联网在主循环中由 link_mgr 完成（首次连上 WiFi 后对时），离线时照常采样与控制
+    link_mgr.connect = open_transport
+    link_mgr.start()
+    configure_filters()
+    configure_reporting()
+    configure_sampling()
+    try:
+        status_srv = status_server.StatusServer(STATUS_PORT)
+        status_srv.provider = publish_status
+    except Exception as e:
+        evlog.error(evlog.E_STATUS_ERR, 0, e)
+    if TRACE_ENABLED:
+        try:
+            tracer = recorder.Recorder(TRACE_PATH, TRACE_MAX_BYTES)
+            tracer.bmp_cal(1, BMP1.cal)
+            tracer.bmp_cal(2, BMP2.cal)
+        except OSError as e:
+            evlog.error(evlog.E_TRACE_ERR, 0, e)
 
-    last_upload = time.time()
-    last_record_time = time.time()
-    has_saved = False
+    last_upload = clock.ticks_ms()
+    last_record_time = clock.time()
     last_handled_message=''
-    while True:
-        handle_keyboard()
-        if tcp_client:
-            try:
-                data = tcp_client.recv(1024)
-                if data:
-                    messages = data.decode('utf-8').strip().split('\r\n')
-                    for message in messages:
-                        if message.startswith('SET'):
-                            set_limit_message()
-                        elif message.startswith('{'):
-                            handle_tcp_message()
-            except Exception as e:
-                print(f"Recv error: {e}")
-        
+    heap_mon.idle(force=True)  # 进入稳态前清理初始化产生的垃圾
+    return True
+
+def loop_once():
+    # 控制循环的一轮；replay.py 在虚拟时钟下直接调用
+    global tcp_client
+    global last_remote_poll, last_upload, alarm_count
+    heap_mon.begin()
+    tracer.loop()
+    handle_keyboard()
+    if tcp_client:
+        try:
+            # 服务器推送的控制/阈值消息直接处理
+            for topic, message in tcp_client.receive():
+                if topic == TOPIC_TEMP_4:
+                    apply_control_message(message)
+                elif topic == TOPIC_TEMP_5:
+                    apply_limit_message(message)
+        except Exception as e:
+            evlog.error(evlog.E_RECV_ERR, 0, e)
+            link_mgr.fail(e)
+            tcp_client = None
+
+    if REMOTE_POLL and link_mgr.wifi_up() and clock.elapsed_ms(last_remote_poll) >= REMOTE_POLL_INTERVAL * 1000:
         handle_tcp_message()
         set_limit_message()
+        last_remote_poll = clock.ticks_ms()
 
-        lux1_val = calculate_lux(light1_ao)
-        lux2_val = calculate_lux(light2_ao)
-        temp1_val, hum1_val, alarm1 = check_sensor(dht1, 1)
-        temp2_val, hum2_val, alarm2 = check_sensor(dht2, 2)
+    sample_sensors()
 
-        try:
-            bmp_data1 = BMP1.get()
-            if bmp_data1:
-                pressure1_val = bmp_data1[1] / 100
-                height1_val = BMP1.getAltitude()
-            else:
-                pressure1_val = None
-                height1_val = None
-                print("BMP1 读取错误或数据无效。")
-        except Exception as e:
-            print(f"读取 BMP1 异常: {e}")
-            pressure1_val = None
-            height1_val = None
-        
-        try:
-            bmp_data2 = BMP2.get()
-            if bmp_data2:
-                pressure2_val = bmp_data2[1] / 100
-                height2_val = BMP2.getAltitude()
-            else:
-                pressure2_val = None
-                height2_val = None
-                print("BMP2 读取错误或数据无效。")
-        except Exception as e:
-            print(f"读取 BMP2 异常: {e}")
-            pressure2_val = None
-            height2_val = None
-
-#         # 数据记录
-#         
-# 
-#         current_time =time.time()
-#         if record_count < MAX_RECORDS and current_time - last_record_time >= RECORD_INTERVAL:
-#             save_to_csv()
-#             record_count += 1
-#             last_record_time = current_time
-#             if record_count >= MAX_RECORDS:
-#                 print(f"[csv] 已完成 {MAX_RECORDS} 组数据记录，停止记录")
-#         if not has_saved:
-#             save_to_csv()
-#             has_saved = True
-        update_leds(temp1_val, temp2_val)
-        update_display()
-
-        alarms = []
-        if alarm1:
-            alarms.extend(alarm1)
-        if alarm2:
-            alarms.extend(alarm2)
-        if lux1_val < LUX_LOWER_LIMIT:
-            trigger_alarm("LIGHT_LOW")
-            alarms.append("1-光强低")
-        elif lux1_val > LUX_UPPER_LIMIT:
-            trigger_alarm("LIGHT_HIGH")
-            alarms.append("1-光强高")
-        if lux2_val < LUX_LOWER_LIMIT:
-            trigger_alarm("LIGHT_LOW")
-            alarms.append("2-光强低")
-        elif lux2_val > LUX_UPPER_LIMIT:
-            trigger_alarm("LIGHT_HIGH")
-            alarms.append("2-光强高")
-        if not alarms and \
-           all(v is not None for v in [temp1_val, hum1_val, lux1_val, temp2_val, hum2_val, lux2_val]) and \
-           TEMP_LOWER_LIMIT <= temp1_val <= TEMP_UPPER_LIMIT and \
-           HUMIDITY_LOWER_LIMIT <= hum1_val <= HUMIDITY_UPPER_LIMIT and \
-           LUX_LOWER_LIMIT <= lux1_val <= LUX_UPPER_LIMIT and \
-           TEMP_LOWER_LIMIT <= temp2_val <= TEMP_UPPER_LIMIT and \
-           HUMIDITY_LOWER_LIMIT <= hum2_val <= HUMIDITY_UPPER_LIMIT and \
-           LUX_LOWER_LIMIT <= lux2_val <= LUX_UPPER_LIMIT:
-            send_alarm("所有参数正常")
-        send_alarm(alarms)
-
-        if time.time() - last_upload > 1:
-            data1_upload = [f"{temp1_val:.1f}" if temp1_val is not None else "0",
-                            f"{hum1_val:.1f}" if hum1_val is not None else "0",
-                            str(int(lux1_val)) if lux1_val is not None else "0",
-                            f"{pressure1_val:.1f}" if pressure1_val is not None else "0",
-                            f"{height1_val}" if height1_val is not None else "0",
-                            '已开启' if tap_status=='on' else '已关闭']
-            send_data(TOPIC_TEMP_1, *data1_upload)
-            data2_upload = [f"{temp2_val:.1f}" if temp2_val is not None else "0",
-                            f"{hum2_val:.1f}" if hum2_val is not None else "0",
-                            str(int(lux2_val)) if lux2_val is not None else "0",
-                            f"{pressure2_val:.1f}" if pressure2_val is not None else "0",
-                            f"{height2_val}" if height2_val is not None else "0",
-                            '已开启' if buzzer_on else '已关闭']
-            send_data(TOPIC_TEMP_2, *data2_upload)
-            threshold_data = [f"{TEMP_UPPER_LIMIT:.1f}", f"{TEMP_LOWER_LIMIT:.1f}",
-                              f"{HUMIDITY_UPPER_LIMIT:.1f}", f"{HUMIDITY_LOWER_LIMIT:.1f}",
-                              str(int(LUX_UPPER_LIMIT)), str(int(LUX_LOWER_LIMIT))]
-            send_data(TOPIC_TEMP_3, *threshold_data)
-            last_upload = time.time()
-
-        time.sleep(0.1)
+#     # 数据记录
+#     current_time = clock.time()
+#     if record_count < MAX_RECORDS and current_time - last_record_time >= RECORD_INTERVAL:
+#         save_to_csv()
+#         record_count += 1
+#         last_record_time = current_time
+#         if record_count >= MAX_RECORDS:
+#             print(f"[csv] 已完成 {MAX_RECORDS} 组数据记录，停止记录")
+    update_control(temp1_val, temp2_val)
+    check_limits()
+    update_display()
+
+    # 报警状态按站点记为位掩码，只在跳变时上报
+    alarm_mgr.set(1, dht_alarm[0] | light_alarm_mask(lux1_val))
+    alarm_mgr.set(2, dht_alarm[1] | light_alarm_mask(lux2_val))
+    alarm_count = alarm_mgr.count()
+    send_alarm()
+
+    if UPLINK_AGGREGATE:
+        aggregate_samples()
+        upload_aggregated(clock.time())
+    elif clock.elapsed_ms(last_upload) >= UPLOAD_INTERVAL_MS:
+        if UPLINK_COMPACT and UPLINK_BATCH:
+            upload_batch(clock.time())
+        elif UPLINK_COMPACT:
+            upload_compact(clock.time())
+        else:
+            upload_legacy()
+        last_upload = clock.ticks_ms()
+
+    heap_mon.end()
+    # 链路状态机：断线时按退避重连，状态变化会分配内存，放在计量区间之外
+    tcp_client = link_mgr.poll()
+    status_led.value(link_mgr.led(clock.ticks_ms()))
+    if link_mgr.wifi_up() and clock.sync_due(NTP_INTERVAL):
+        sync_clock()  # 对时会分配内存、最多阻塞 1 秒，放在计量区间之外
+    if status_srv:
+        status_srv.serve(100)  # 空闲时段处理局域网请求
+    else:
+        clock.sleep(0.1)
+    evlog.drain(LOG_DRAIN)  # 事件日志在空闲时段输出
+    heap_mon.idle()  # 空闲堆不足时在这里回收，而不是在循环中途
+
+def main():
+    if not setup():
+        return
+    while True:
+        loop_once()
 
 if __name__ == '__main__':
     try:
@@ -847,9 +1264,8 @@ if __name__ == '__main__':
         status_led.value(1)
         if tcp_client:
             tcp_client.close()
-        oled1.fill(0)
-        oled2.fill(0)
-        oled1.text("System Off", 0, 30)
-        oled2.text("System Off", 0, 30)
-        oled1.show()
-        oled2.show()
+        if status_srv:
+            status_srv.close()
+        tracer.close()
+        screens.message("System Off", 0, 30)
+        screens.close()
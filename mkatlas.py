@@ -0,0 +1,56 @@
+# 生成 OLED 汉字字库文件（上位机运行，需要 Pillow）
+# 输出格式与 ssd1306.GlyphAtlas.load() 一致：首行为 UTF-8 字符表，其后每字 32 字节 16x16 MONO_VLSB 点阵。
+# 用法: python mkatlas.py --font simsun.ttc [--chars "温度过高"] [-o hanzi.bin]
+# 不指定 --chars 时收录报警文本（alarm.ALARM_TEXT）用到的全部汉字，生成后把 hanzi.bin 上传到开发板根目录。
+import argparse
+
+from PIL import Image, ImageDraw, ImageFont
+
+import alarm
+
+
+def default_chars():
+    text = ''.join(alarm.ALARM_TEXT.values()) + alarm.NORMAL_TEXT + '解除'
+    chars = []
+    for ch in text:
+        if ord(ch) > 0x7F and ch not in chars:
+            chars.append(ch)
+    return ''.join(chars)
+
+
+def render_glyph(font, ch, threshold=128):
+    img = Image.new('L', (16, 16), 0)
+    ImageDraw.Draw(img).text((0, 0), ch, fill=255, font=font)
+    px = img.load()
+    data = bytearray(32)
+    # MONO_VLSB: 每字节为一列中的 8 个像素，低位在上；两页共 2 x 16 字节
+    for page in range(2):
+        for x in range(16):
+            byte = 0
+            for bit in range(8):
+                if px[x, page * 8 + bit] >= threshold:
+                    byte |= 1 << bit
+            data[page * 16 + x] = byte
+    return data
+
+
+def build(font_path, chars, size=16):
+    font = ImageFont.truetype(font_path, size)
+    data = bytearray()
+    for ch in chars:
+        data += render_glyph(font, ch)
+    return chars.encode() + b'\n' + bytes(data)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a 16x16 glyph atlas for ssd1306.GlyphAtlas')
+    parser.add_argument('--font', required=True, help='TrueType/OpenType font containing the characters')
+    parser.add_argument('--chars', default=None, help='characters to include (default: alarm texts)')
+    parser.add_argument('--size', type=int, default=16)
+    parser.add_argument('-o', '--output', default='hanzi.bin')
+    args = parser.parse_args()
+    chars = args.chars or default_chars()
+    blob = build(args.font, chars, args.size)
+    with open(args.output, 'wb') as f:
+        f.write(blob)
+    print(f'{len(chars)} glyphs -> {args.output} ({len(blob)} bytes)')
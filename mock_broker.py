@@ -0,0 +1,208 @@
+# 本地代理替身（上位机运行），用于联调和 transport 基准测试
+#   MQTT 3.1.1 子集: CONNECT/SUBSCRIBE/PUBLISH(QoS 0/1)/PUBACK/PINGREQ/DISCONNECT，支持持久会话
+#   巴法云 TCP 文本协议: cmd=1 订阅、cmd=2 发布、ping 心跳
+# 用法: python mock_broker.py [--tcp-port 8344] [--mqtt-port 9501]
+import argparse
+import asyncio
+import struct
+
+
+class Broker:
+    def __init__(self):
+        self.subs = {}          # topic -> {session: qos}
+        self.sessions = {}      # client_id -> MQTTSession（持久会话）
+        self.published = 0
+
+    def subscribe(self, session, topic, qos=0):
+        self.subs.setdefault(topic, {})[session] = qos
+
+    def unsubscribe_all(self, session):
+        for subscribers in self.subs.values():
+            subscribers.pop(session, None)
+
+    def route(self, topic, msg, qos=0):
+        self.published += 1
+        for session, sub_qos in list(self.subs.get(topic, {}).items()):
+            session.deliver(topic, msg, min(qos, sub_qos))
+
+
+class TCPSession:
+    def __init__(self, broker, writer):
+        self.broker = broker
+        self.writer = writer
+
+    def deliver(self, topic, msg, qos):
+        if isinstance(msg, bytes):
+            msg = msg.decode(errors='replace')
+        self.writer.write(f'cmd=2&uid=broker&topic={topic}&msg={msg}\r\n'.encode())
+
+    async def run(self, reader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                line = line.strip().decode()
+                if line.startswith('cmd=1&'):
+                    fields = dict(p.split('=', 1) for p in line.split('&') if '=' in p)
+                    for topic in fields.get('topic', '').split(','):
+                        self.broker.subscribe(self, topic)
+                    self.writer.write(b'cmd=1&res=1\r\n')
+                elif line.startswith('cmd=2&'):
+                    t = line.find('&topic=')
+                    m = line.find('&msg=')
+                    if t >= 0 and m >= 0:
+                        end = line.find('&', t + 7)
+                        self.broker.route(line[t + 7:end if 0 <= end < m else m], line[m + 5:])
+                    self.writer.write(b'cmd=2&res=1\r\n')
+                elif line == 'ping' or line.startswith('cmd=0'):
+                    self.writer.write(b'cmd=0&res=1\r\n')
+                await self.writer.drain()
+        finally:
+            self.broker.unsubscribe_all(self)
+            self.writer.close()
+
+
+def _remaining_length(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def _mqtt_str(data, offset):
+    n = struct.unpack_from('!H', data, offset)[0]
+    return data[offset + 2:offset + 2 + n].decode(), offset + 2 + n
+
+
+class MQTTSession:
+    def __init__(self, broker):
+        self.broker = broker
+        self.writer = None
+        self.client_id = None
+        self.next_pid = 1
+        self.offline = []       # 持久会话断线期间的 QoS 1 消息
+
+    def deliver(self, topic, msg, qos):
+        if self.writer is None:
+            if qos:
+                self.offline.append((topic, msg))
+            return
+        topic_b = topic.encode()
+        payload = msg.encode() if isinstance(msg, str) else msg
+        body = struct.pack('!H', len(topic_b)) + topic_b
+        if qos:
+            body += struct.pack('!H', self.next_pid)
+            self.next_pid = self.next_pid % 0xFFFF + 1
+        body += payload
+        self.writer.write(bytes([0x30 | (qos << 1)]) + _remaining_length(len(body)) + body)
+
+    def send(self, packet):
+        self.writer.write(packet)
+
+
+async def _read_packet(reader):
+    header = await reader.readexactly(1)
+    n, shift = 0, 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        n |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            break
+    return header[0], await reader.readexactly(n)
+
+
+async def handle_mqtt(broker, reader, writer):
+    session = None
+    try:
+        while True:
+            first, body = await _read_packet(reader)
+            kind = first >> 4
+            if kind == 1:       # CONNECT
+                _, offset = _mqtt_str(body, 0)
+                flags = body[offset + 1]
+                client_id, _ = _mqtt_str(body, offset + 4)
+                clean = bool(flags & 0x02)
+                present = 0
+                if not clean and client_id in broker.sessions:
+                    session = broker.sessions[client_id]
+                    present = 1
+                else:
+                    old = broker.sessions.pop(client_id, None)
+                    if old:
+                        broker.unsubscribe_all(old)
+                    session = MQTTSession(broker)
+                    if not clean:
+                        broker.sessions[client_id] = session
+                session.client_id = client_id
+                session.writer = writer
+                session.send(bytes([0x20, 0x02, present, 0x00]))
+                for topic, msg in session.offline:
+                    session.deliver(topic, msg, 1)
+                session.offline = []
+            elif kind == 8:     # SUBSCRIBE
+                pid = body[:2]
+                offset, granted = 2, bytearray()
+                while offset < len(body):
+                    topic, offset = _mqtt_str(body, offset)
+                    qos = min(body[offset] & 0x03, 1)
+                    offset += 1
+                    broker.subscribe(session, topic, qos)
+                    granted.append(qos)
+                session.send(bytes([0x90]) + _remaining_length(2 + len(granted)) + pid + bytes(granted))
+            elif kind == 3:     # PUBLISH
+                qos = (first >> 1) & 0x03
+                topic, offset = _mqtt_str(body, 0)
+                if qos:
+                    session.send(bytes([0x40, 0x02]) + body[offset:offset + 2])
+                    offset += 2
+                broker.route(topic, body[offset:], qos)
+            elif kind == 12:    # PINGREQ
+                session.send(bytes([0xD0, 0x00]))
+            elif kind == 14:    # DISCONNECT
+                break
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        if session:
+            session.writer = None
+            if session.client_id not in broker.sessions:
+                broker.unsubscribe_all(session)
+        writer.close()
+
+
+async def serve(host='0.0.0.0', tcp_port=8344, mqtt_port=9501, broker=None):
+    broker = broker or Broker()
+
+    async def on_tcp(reader, writer):
+        await TCPSession(broker, writer).run(reader)
+
+    async def on_mqtt(reader, writer):
+        await handle_mqtt(broker, reader, writer)
+
+    tcp_server = await asyncio.start_server(on_tcp, host, tcp_port)
+    mqtt_server = await asyncio.start_server(on_mqtt, host, mqtt_port)
+    return broker, tcp_server, mqtt_server
+
+
+async def _main(args):
+    _, tcp_server, mqtt_server = await serve(args.host, args.tcp_port, args.mqtt_port)
+    print(f'mock broker: bemfa tcp on {args.tcp_port}, mqtt on {args.mqtt_port}')
+    async with tcp_server, mqtt_server:
+        await asyncio.gather(tcp_server.serve_forever(), mqtt_server.serve_forever())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Bemfa TCP / MQTT broker stand-in')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--tcp-port', type=int, default=8344)
+    parser.add_argument('--mqtt-port', type=int, default=9501)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
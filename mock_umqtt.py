@@ -0,0 +1,213 @@
+# umqtt.simple 的上位机替身：与 MicroPython 的 umqtt.simple 相同的 MQTTClient 接口与报文编码
+# （长度按传入对象的 len() 计算、QoS 1 发布等待 PUBACK、check_msg 非阻塞），
+# 用于在电脑上对 mock_broker.py 运行 transport.BemfaMQTT（bench_transport.py 自动安装）。
+# 额外统计 tx_bytes（写出的字节数），供核对 transport.publish_size()。
+import socket
+import struct
+import sys
+import types
+
+
+class MQTTException(Exception):
+    pass
+
+
+class _Sock:
+    # 提供 MicroPython 套接字的 read/write：非阻塞模式下没有数据时 read 返回 None
+    def __init__(self, sock):
+        self.sock = sock
+        self.tx_bytes = 0
+
+    def write(self, data, n=None):
+        if isinstance(data, str):
+            data = data.encode()
+        data = bytes(data[:n] if n is not None else data)
+        self.sock.sendall(data)
+        self.tx_bytes += len(data)
+        return len(data)
+
+    def read(self, n):
+        buf = b''
+        while len(buf) < n:
+            try:
+                chunk = self.sock.recv(n - len(buf))
+            except BlockingIOError:
+                if not buf:
+                    return None
+                self.sock.setblocking(True)
+                continue
+            if not chunk:
+                return buf
+            buf += chunk
+        return buf
+
+    def setblocking(self, flag):
+        self.sock.setblocking(flag)
+
+    def close(self):
+        self.sock.close()
+
+
+class MQTTClient:
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0, ssl=False):
+        self.client_id = client_id
+        self.sock = None
+        self.server = server
+        self.port = port or 1883
+        self.keepalive = keepalive
+        self.pid = 0
+        self.cb = None
+        self.tx_bytes = 0
+        self.pubacks = 0
+
+    def _send_str(self, s):
+        self.sock.write(struct.pack('!H', len(s)))
+        self.sock.write(s)
+
+    def _recv_len(self):
+        n = 0
+        sh = 0
+        while True:
+            b = self.sock.read(1)[0]
+            n |= (b & 0x7F) << sh
+            if not b & 0x80:
+                return n
+            sh += 7
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def connect(self, clean_session=True):
+        sock = socket.create_connection((self.server, self.port))
+        # umqtt 分多次小块写出一个报文；主机协议栈的 Nagle 与延迟 ACK 会让每个报文多等约 40 ms
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock = _Sock(sock)
+        premsg = bytearray(b'\x10\0\0\0\0\0')
+        msg = bytearray(b'\x04MQTT\x04\x02\0\0')
+        sz = 10 + 2 + len(self.client_id)
+        msg[6] = clean_session << 1
+        msg[7] |= self.keepalive >> 8
+        msg[8] |= self.keepalive & 0xFF
+        i = 1
+        while sz > 0x7F:
+            premsg[i] = (sz & 0x7F) | 0x80
+            sz >>= 7
+            i += 1
+        premsg[i] = sz
+        self.sock.write(premsg, i + 2)
+        self.sock.write(msg)
+        self._send_str(self.client_id)
+        resp = self.sock.read(4)
+        if resp[0] != 0x20 or resp[1] != 0x02:
+            raise MQTTException('bad CONNACK')
+        if resp[3] != 0:
+            raise MQTTException(resp[3])
+        return resp[2] & 1
+
+    def disconnect(self):
+        self.sock.write(b'\xe0\0')
+        self.sock.close()
+
+    def ping(self):
+        self.sock.write(b'\xc0\0')
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        start = self.sock.tx_bytes
+        pkt = bytearray(b'\x30\0\0\0')
+        pkt[0] |= qos << 1 | retain
+        sz = 2 + len(topic) + len(msg)
+        if qos > 0:
+            sz += 2
+        i = 1
+        while sz > 0x7F:
+            pkt[i] = (sz & 0x7F) | 0x80
+            sz >>= 7
+            i += 1
+        pkt[i] = sz
+        self.sock.write(pkt, i + 1)
+        self._send_str(topic)
+        if qos > 0:
+            self.pid += 1
+            pid = self.pid
+            struct.pack_into('!H', pkt, 0, pid)
+            self.sock.write(pkt, 2)
+        self.sock.write(msg)
+        self.tx_bytes = self.sock.tx_bytes - start
+        if qos == 1:
+            while True:
+                op = self.wait_msg()
+                if op == 0x40:
+                    sz = self.sock.read(1)
+                    assert sz == b'\x02'
+                    rcv_pid = self.sock.read(2)
+                    if pid == rcv_pid[0] << 8 | rcv_pid[1]:
+                        self.pubacks += 1
+                        return
+
+    def subscribe(self, topic, qos=0):
+        assert self.cb is not None, 'Subscribe callback is not set'
+        pkt = bytearray(b'\x82\0\0\0')
+        self.pid += 1
+        struct.pack_into('!BH', pkt, 1, 2 + 2 + len(topic) + 1, self.pid)
+        self.sock.write(pkt)
+        self._send_str(topic)
+        self.sock.write(bytes((qos,)))
+        while True:
+            op = self.wait_msg()
+            if op == 0x90:
+                resp = self.sock.read(4)
+                assert resp[1] == pkt[2] and resp[2] == pkt[3]
+                if resp[3] == 0x80:
+                    raise MQTTException(resp[3])
+                return
+
+    def wait_msg(self):
+        res = self.sock.read(1)
+        self.sock.setblocking(True)
+        if res is None:
+            return None
+        if res == b'':
+            raise OSError(-1)
+        if res == b'\xd0':  # PINGRESP
+            self.sock.read(1)
+            return None
+        op = res[0]
+        if op & 0xF0 != 0x30:
+            return op
+        sz = self._recv_len()
+        topic_len = self.sock.read(2)
+        topic_len = (topic_len[0] << 8) | topic_len[1]
+        topic = self.sock.read(topic_len)
+        sz -= topic_len + 2
+        if op & 6:
+            pid = self.sock.read(2)
+            pid = pid[0] << 8 | pid[1]
+            sz -= 2
+        msg = self.sock.read(sz)
+        self.cb(topic, msg)
+        if op & 6 == 2:
+            pkt = bytearray(b'\x40\x02\0\0')
+            struct.pack_into('!H', pkt, 2, pid)
+            self.sock.write(pkt)
+        return op
+
+    def check_msg(self):
+        self.sock.setblocking(False)
+        return self.wait_msg()
+
+
+def install():
+    # 没有真正的 umqtt.simple 时注册本模块，之后 from umqtt.simple import MQTTClient 可用
+    try:
+        import umqtt.simple  # noqa: F401
+        return False
+    except ImportError:
+        pass
+    simple = types.ModuleType('umqtt.simple')
+    simple.MQTTClient = MQTTClient
+    simple.MQTTException = MQTTException
+    package = types.ModuleType('umqtt')
+    package.simple = simple
+    sys.modules['umqtt'] = package
+    sys.modules['umqtt.simple'] = simple
+    return True
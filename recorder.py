@@ -0,0 +1,230 @@
+# 现场记录：把传感器原始输入、按键和远程消息连同时间写入紧凑的二进制轨迹文件，
+# 上位机用 replay.py 在虚拟时钟下重放控制逻辑。
+#
+# 文件以 b'GHTR' + 版本字节开头，之后每条记录为
+#   类型(uint8) 距上一条记录的毫秒数(uint16) 负载
+# 间隔超过 65535 ms 时先写一条 EV_GAP 记录补足。传感器输入只在原始值变化时记录，
+# 重放时未记录的读数沿用上一次的值。
+import struct
+
+import clock
+
+MAGIC = b'GHTR'
+VERSION = 1
+
+EV_START = 0      # 负载: 起始时间 time()（uint32 秒）
+EV_GAP = 1        # 负载: 额外经过的毫秒数（uint32）
+EV_LOOP = 2       # 控制循环开始
+EV_DHT = 3        # 站点, DHT22 原始 5 字节
+EV_DHT_ERR = 4    # 站点
+EV_LUX = 5        # 站点, ADC 原始值（uint16）
+EV_BMP = 6        # 站点, adc_T, adc_P（uint32）
+EV_BMP_CAL = 7    # 站点, 12 个校准字
+EV_BMP_ERR = 8    # 站点
+EV_KEY = 9        # 按键字符
+EV_MSG = 10       # 主题编号（4 控制 / 5 阈值）, 长度, UTF-8 消息
+
+NAMES = ('start', 'gap', 'loop', 'dht', 'dht_err', 'lux', 'bmp', 'bmp_cal', 'bmp_err', 'key', 'msg')
+
+_HEAD = '<BH'
+_CAL_FMT = '<HhhHhhhhhhhh'
+_PAYLOAD = {
+    EV_START: '<I',
+    EV_GAP: '<I',
+    EV_LOOP: '',
+    EV_DHT: '<B5s',
+    EV_DHT_ERR: '<B',
+    EV_LUX: '<BH',
+    EV_BMP: '<BII',
+    EV_BMP_CAL: '<B' + _CAL_FMT[1:],
+    EV_BMP_ERR: '<B',
+    EV_KEY: '<c',
+}
+
+
+class NullRecorder:
+    # 未启用记录时使用，所有方法为空操作
+    def loop(self):
+        pass
+
+    def dht(self, station, buf):
+        pass
+
+    def dht_error(self, station):
+        pass
+
+    def lux(self, station, raw):
+        pass
+
+    def bmp(self, station, adc_T, adc_P):
+        pass
+
+    def bmp_cal(self, station, cal):
+        pass
+
+    def bmp_error(self, station):
+        pass
+
+    def key(self, key):
+        pass
+
+    def msg(self, topic_id, msg):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL = NullRecorder()
+
+
+class Recorder(NullRecorder):
+    def __init__(self, path, max_bytes=512 * 1024, buffer_size=512):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.buf = bytearray(buffer_size)
+        self.pos = 0
+        self.written = 0
+        self.full = False
+        self.last_ms = clock.ticks_ms()
+        self.last_dht = (bytearray(5), bytearray(5))
+        self.dht_valid = bytearray(2)
+        self.last_lux = [None, None]
+        self.last_bmp = [None, None, None, None]
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + bytes((VERSION,)))
+        self.written = len(MAGIC) + 1
+        self._record(EV_START, clock.time())
+
+    def _header(self, kind, size):
+        # 写记录头并返回负载写入位置；空间不足时先落盘
+        if self.full:
+            return -1
+        if self.pos + size + 8 > len(self.buf):
+            self.flush()
+        if self.written + self.pos + size + 8 > self.max_bytes:
+            # 达到上限后停止记录，保留已写入的部分
+            self.flush()
+            self.full = True
+            return -1
+        now = clock.ticks_ms()
+        dt = (now - self.last_ms) & 0x3FFFFFFF
+        self.last_ms = now
+        if dt > 0xFFFF:
+            struct.pack_into('<BHI', self.buf, self.pos, EV_GAP, 0, dt)
+            self.pos += 7
+            dt = 0
+        struct.pack_into(_HEAD, self.buf, self.pos, kind, dt)
+        self.pos += 3
+        return self.pos
+
+    def _record(self, kind, *values):
+        fmt = _PAYLOAD[kind]
+        size = struct.calcsize(fmt) if fmt else 0
+        pos = self._header(kind, size)
+        if pos >= 0 and size:
+            struct.pack_into(fmt, self.buf, pos, *values)
+            self.pos += size
+
+    def loop(self):
+        self._record(EV_LOOP)
+
+    def dht(self, station, buf):
+        last = self.last_dht[station - 1]
+        if self.dht_valid[station - 1] and last == buf:
+            return
+        last[:] = buf
+        self.dht_valid[station - 1] = 1
+        self._record(EV_DHT, station, bytes(buf))
+
+    def dht_error(self, station):
+        self.dht_valid[station - 1] = 0
+        self._record(EV_DHT_ERR, station)
+
+    def lux(self, station, raw):
+        if self.last_lux[station - 1] != raw:
+            self.last_lux[station - 1] = raw
+            self._record(EV_LUX, station, raw)
+
+    def bmp(self, station, adc_T, adc_P):
+        i = (station - 1) * 2
+        if self.last_bmp[i] != adc_T or self.last_bmp[i + 1] != adc_P:
+            self.last_bmp[i] = adc_T
+            self.last_bmp[i + 1] = adc_P
+            self._record(EV_BMP, station, adc_T, adc_P)
+
+    def bmp_cal(self, station, cal):
+        self._record(EV_BMP_CAL, station, *cal)
+
+    def bmp_error(self, station):
+        i = (station - 1) * 2
+        self.last_bmp[i] = None
+        self._record(EV_BMP_ERR, station)
+
+    def key(self, key):
+        self._record(EV_KEY, key.encode())
+
+    def msg(self, topic_id, msg):
+        data = msg.encode()
+        if len(data) > 255:
+            # 在字符边界截断：退过 UTF-8 续字节（10xxxxxx），不把中文字符截成半个
+            n = 255
+            while n and data[n] & 0xC0 == 0x80:
+                n -= 1
+            data = data[:n]
+        pos = self._header(EV_MSG, 2 + len(data))
+        if pos >= 0:
+            self.buf[pos] = topic_id
+            self.buf[pos + 1] = len(data)
+            self.buf[pos + 2:pos + 2 + len(data)] = data
+            self.pos += 2 + len(data)
+
+    def flush(self):
+        if self.pos:
+            self.file.write(memoryview(self.buf)[:self.pos])
+            self.file.flush()
+            self.written += self.pos
+            self.pos = 0
+
+    def close(self):
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.file = None
+            self.full = True
+
+
+def read(path):
+    # 上位机解析：逐条返回 (毫秒时间, 类型, 负载元组)，时间从记录开始计
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError('not a trace file')
+    if data[4] != VERSION:
+        raise ValueError('unsupported trace version %d' % data[4])
+    pos = 5
+    t = 0
+    while pos + 3 <= len(data):
+        kind, dt = struct.unpack_from(_HEAD, data, pos)
+        pos += 3
+        t += dt
+        if kind == EV_MSG:
+            topic_id, n = data[pos], data[pos + 1]
+            payload = (topic_id, data[pos + 2:pos + 2 + n].decode('utf-8', 'replace'))
+            pos += 2 + n
+        else:
+            fmt = _PAYLOAD.get(kind)
+            if fmt is None:
+                raise ValueError('unknown record type %d at offset %d' % (kind, pos - 3))
+            if not fmt:
+                payload = ()
+            else:
+                payload = struct.unpack_from(fmt, data, pos)
+                pos += struct.calcsize(fmt)
+        if kind == EV_GAP:
+            t += payload[0]
+            continue
+        yield t, kind, payload
@@ -0,0 +1,480 @@
+# 现场轨迹重放（上位机运行）：在虚拟时钟下用记录的输入驱动 main.py 的控制逻辑
+# 用法:
+#   python replay.py trace.bin [--timeline out.csv] [--expect tap=on@3600] [-v]
+#   python replay.py --synth day.bin [--hours 24]     生成一天的合成轨迹（用于自测）
+#
+# 硬件相关模块（machine、dht、network、framebuf 等）由本文件的替身代替，main.py 原样导入；
+# 每条 EV_LOOP 记录驱动一次 main.loop_once()，期间的传感器/按键/消息记录先注入替身。
+# 输出执行器时间线（龙头、蜂鸣器、LED、手动锁定）、内置不变量检查与 --expect 断言结果。
+import argparse
+import math
+import os
+import struct
+import sys
+import time as _time
+import types
+
+import clock
+import evlog
+import recorder
+
+TOPICS = {4: 'temp4004', 5: 'temp5004'}
+
+
+# ---------- 硬件替身 ----------
+
+class Board:
+    # 替身共享的状态：按引脚号登记的 Pin、当前按键、执行器变化回调
+    def __init__(self):
+        self.pins = {}
+        self.key_pins = None          # (行引脚号, 列引脚号)
+        self.on_change = None
+
+    def changed(self, signal, value):
+        if self.on_change:
+            self.on_change(signal, value)
+
+
+board = Board()
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_DOWN = 2
+    PULL_UP = 3
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self.v = value if value is not None else 0
+        self.signal = None            # 需要记入时间线的引脚由 Replay 命名，键盘扫描等不触发回调
+        board.pins[id] = self
+
+    def value(self, v=None):
+        if v is None:
+            key = board.key_pins
+            if key and key[1] == self.id and board.pins[key[0]].v:
+                board.key_pins = None     # 按键被扫描到一次后视为松开
+                return 1
+            return self.v
+        if v != self.v:
+            self.v = v
+            if self.signal:
+                board.changed(self.signal, v)
+
+    def __call__(self, v=None):
+        return self.value(v)
+
+
+class PWM:
+    def __init__(self, pin, freq=0, duty=0):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty(self, d=None):
+        if d is None:
+            return self._duty
+        if (d > 0) != (self._duty > 0) and self.pin.signal:
+            board.changed(self.pin.signal + '_pwm', 1 if d > 0 else 0)
+        self._duty = d
+
+
+class ADC:
+    ATTN_11DB = 3
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.raw = 0
+
+    def atten(self, a):
+        pass
+
+    def read(self):
+        return self.raw
+
+
+class I2C:
+    # OLED 等只写设备；读寄存器时返回 0
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def scan(self):
+        return []
+
+    def writeto(self, addr, buf, stop=True):
+        return len(buf)
+
+    def writevto(self, addr, vector, stop=True):
+        pass
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        for i in range(len(buf)):
+            buf[i] = 0
+
+    def readfrom_mem(self, addr, memaddr, n):
+        return bytes(n)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        pass
+
+
+class BMPDevice(I2C):
+    # 单个 BMP280：校准参数与原始 ADC 值来自轨迹，驱动的补偿代码照常执行
+    def __init__(self, cal):
+        self.cal = struct.pack('<HhhHhhhhhhhh', *cal)
+        self.adc_T = 0
+        self.adc_P = 0
+        self.error = False
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        if self.error:
+            raise OSError(5)
+        if memaddr == 0x88:
+            buf[:] = self.cal[:len(buf)]
+        elif memaddr == 0xF7:
+            p, t = self.adc_P, self.adc_T
+            buf[:] = bytes(((p >> 12) & 0xFF, (p >> 4) & 0xFF, (p & 0x0F) << 4,
+                            (t >> 12) & 0xFF, (t >> 4) & 0xFF, (t & 0x0F) << 4))
+        else:
+            super().readfrom_mem_into(addr, memaddr, buf)
+
+
+class DHT22:
+    def __init__(self, pin):
+        self.pin = pin
+        self.buf = bytearray(5)
+        self.error = False
+
+    def measure(self):
+        if self.error:
+            raise OSError(116)
+
+    def humidity(self):
+        return (self.buf[0] << 8 | self.buf[1]) * 0.1
+
+    def temperature(self):
+        t = ((self.buf[2] & 0x7F) << 8 | self.buf[3]) * 0.1
+        return -t if self.buf[2] & 0x80 else t
+
+
+class FrameBuffer:
+    # 只保留接口，重放不关心像素
+    def __init__(self, buf, width, height, fmt, stride=None):
+        self.buf = buf
+
+    def _noop(self, *args):
+        pass
+
+    fill = pixel = hline = vline = line = rect = fill_rect = text = scroll = blit = _noop
+
+
+class WLAN:
+    def __init__(self, interface):
+        pass
+
+    def isconnected(self):
+        return True
+
+    def active(self, *args):
+        return True
+
+    def connect(self, *args):
+        pass
+
+    def ifconfig(self):
+        return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
+
+
+class ReplayTransport:
+    # 替代 tcp_client：receive() 交付轨迹中的远程消息，publish() 记录上行
+    def __init__(self):
+        self.inbox = []
+        self.sent = 0
+        self.bytes = 0
+        self.connected = True
+
+    def receive(self):
+        messages, self.inbox = self.inbox, []
+        return messages
+
+    def publish(self, topic, msg, qos=0):
+        self.sent += 1
+        self.bytes += len(msg)
+        return len(msg)
+
+    def subscribe(self, topic):
+        pass
+
+    def close(self):
+        pass
+
+
+def install_fakes():
+    def module(name, **attrs):
+        m = types.ModuleType(name)
+        m.__dict__.update(attrs)
+        sys.modules[name] = m
+        return m
+
+    module('micropython', const=lambda x: x)
+    module('framebuf', FrameBuffer=FrameBuffer, MONO_VLSB=0, MONO_HLSB=3, MONO_HMSB=4)
+    module('machine', Pin=Pin, I2C=I2C, SoftI2C=I2C, PWM=PWM, ADC=ADC,
+           reset=lambda: None, reset_cause=lambda: 0, freq=lambda *a: 240000000)
+    module('dht', DHT22=DHT22, DHT11=DHT22)
+    module('network', WLAN=WLAN, STA_IF=0, AP_IF=1)
+    module('urequests', get=lambda *a, **k: None)
+    import json
+    sys.modules['ujson'] = json
+
+
+# ---------- 重放 ----------
+
+class Replay:
+    SIGNALS = ('tap', 'buzzer', 'manual_override', 'led_r', 'led_g', 'buzzer_pwm')
+
+    def __init__(self, main, verbose=False):
+        self.main = main
+        self.verbose = verbose
+        self.vclock = clock.use(clock.VirtualClock())
+        self.start = 0
+        self.timeline = []            # (虚拟秒, 信号, 值)
+        self.state = {}
+        self.violations = []
+        self.loops = 0
+        self.inputs = {'key': 0, 'msg': 0}
+        self.bmp = [None, None]
+        board.pins[main.PIN_LED_R].signal = 'led_r'
+        board.pins[main.PIN_LED_G].signal = 'led_g'
+        board.pins[main.PIN_BUZZER].signal = 'buzzer'
+        board.on_change = self.record
+        main.tcp_client = ReplayTransport()
+        if verbose:
+            main.events.sink = evlog.TextSink()   # 事件日志渲染为文字，随 -v 输出
+        main.link_mgr.attach(main.tcp_client)
+        main.REMOTE_POLL = False
+        main.status_srv = None
+        main.configure_filters()
+        main.configure_reporting()
+        main.configure_sampling()
+
+    def now(self):
+        return self.vclock.now - self.start
+
+    def record(self, signal, value):
+        if self.state.get(signal) != value:
+            self.state[signal] = value
+            self.timeline.append((round(self.now(), 3), signal, value))
+
+    def sample(self):
+        m = self.main
+        self.record('tap', m.tap_status)
+        self.record('buzzer', 'on' if m.buzzer_on else 'off')
+        self.record('manual_override', 'on' if m.manual_override else 'off')
+
+    def apply(self, kind, payload):
+        m = self.main
+        if kind == recorder.EV_DHT:
+            sensor = m.dht1 if payload[0] == 1 else m.dht2
+            sensor.buf[:] = payload[1]
+            sensor.error = False
+        elif kind == recorder.EV_DHT_ERR:
+            (m.dht1 if payload[0] == 1 else m.dht2).error = True
+        elif kind == recorder.EV_LUX:
+            (m.light1_ao if payload[0] == 1 else m.light2_ao).raw = payload[1]
+        elif kind == recorder.EV_BMP_CAL:
+            station = payload[0]
+            dev = BMPDevice(payload[1:])
+            self.bmp[station - 1] = dev
+            bmp = m.bmp280.BMP280(dev)
+            if station == 1:
+                m.BMP1 = bmp
+            else:
+                m.BMP2 = bmp
+        elif kind == recorder.EV_BMP:
+            dev = self.bmp[payload[0] - 1]
+            if dev:
+                dev.adc_T, dev.adc_P, dev.error = payload[1], payload[2], False
+        elif kind == recorder.EV_BMP_ERR:
+            dev = self.bmp[payload[0] - 1]
+            if dev:
+                dev.error = True
+        elif kind == recorder.EV_KEY:
+            key = payload[0].decode()
+            for i, row in enumerate(m.KEYBOARD_MATRIX):
+                if key in row:
+                    board.key_pins = (m.ROW_PINS[i], m.COL_PINS[row.index(key)])
+            self.inputs['key'] += 1
+        elif kind == recorder.EV_MSG:
+            m.tcp_client.inbox.append((TOPICS.get(payload[0], ''), payload[1]))
+            self.inputs['msg'] += 1
+
+    def run_loop(self, t_ms, had_input):
+        m = self.main
+        self.vclock.advance_to(self.start + t_ms / 1000)
+        before = (m.tap_status, m.manual_override, m.last_manual_time)
+        m.loop_once()
+        self.loops += 1
+        self.sample()
+        self.check(before, had_input)
+
+    def check(self, before, had_input):
+        # 不变量：手动/远程锁定有效期内，没有按键或远程命令、温度也未超上限时，龙头不应改变
+        m = self.main
+        tap, override, manual_time = before
+        if m.tap_status == tap or had_input:
+            return
+        over = ((m.temp1_val is not None and m.temp1_val > m.TEMP_UPPER_LIMIT) or
+                (m.temp2_val is not None and m.temp2_val > m.TEMP_UPPER_LIMIT))
+        if override and clock.elapsed_ms(manual_time) < m.manual_override_timeout * 1000 and not over:
+            self.violations.append((round(self.now(), 3), 'tap %s -> %s during manual override' % (tap, m.tap_status)))
+
+    def run(self, events):
+        pending = []
+        loop_t = None
+        for t, kind, payload in events:
+            if kind == recorder.EV_START:
+                self.vclock.now = self.start = payload[0]
+                continue
+            if kind != recorder.EV_LOOP:
+                pending.append((kind, payload))
+                continue
+            if loop_t is not None:
+                self._step(loop_t, pending)
+                pending = []
+            loop_t = t
+        if loop_t is not None:
+            self._step(loop_t, pending)
+
+    def _step(self, loop_t, pending):
+        had_input = False
+        for kind, payload in pending:
+            self.apply(kind, payload)
+            if kind in (recorder.EV_KEY, recorder.EV_MSG):
+                had_input = True
+        self.run_loop(loop_t, had_input)
+
+    def value_at(self, signal, t):
+        value = None
+        for when, name, v in self.timeline:
+            if when > t:
+                break
+            if name == signal:
+                value = v
+        return value
+
+
+def parse_expect(spec):
+    # tap=on@3600 -> ('tap', 'on', 3600.0)
+    name, rest = spec.split('=', 1)
+    value, at = rest.rsplit('@', 1)
+    return name, value, float(at)
+
+
+def synthesize(path, hours=24, period=0.5):
+    # 合成轨迹：正弦日变化的温湿度和光照，12:00 起 10 分钟站点 1 过温；
+    # 每小时第 30 分钟按一次 '#' 切换龙头，1.5 小时处收到一次远程 tapon
+    vclock = clock.use(clock.VirtualClock(700000000))
+    rec = recorder.Recorder(path, max_bytes=64 * 1024 * 1024)
+    cal = (27504, 26435, -1000, 36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000)
+    rec.bmp_cal(1, cal)
+    rec.bmp_cal(2, cal)
+    buf = bytearray(5)
+    loops = int(hours * 3600 / period)
+    for n in range(loops):
+        t = n * period
+        rec.loop()
+        day = math.sin(2 * math.pi * t / 86400)
+        for station in (1, 2):
+            temp = 22 + 5 * day + station * 0.5
+            if station == 1 and 43200 <= t < 43800:
+                temp = 31.5
+            temp = int(round(temp * 10))
+            hum = int(round((55 - 10 * day) * 10))
+            buf[0], buf[1] = hum >> 8, hum & 0xFF
+            buf[2], buf[3] = (temp >> 8) & 0x7F, temp & 0xFF
+            buf[4] = (buf[0] + buf[1] + buf[2] + buf[3]) & 0xFF
+            rec.dht(station, buf)
+            rec.lux(station, int(1100 - 600 * day))
+            rec.bmp(station, 519888 + int(200 * day), 415148 + int(300 * day))
+        if n % int(3600 / period) == 1800 / period:
+            rec.key('#')
+        if n == int(5400 / period):
+            rec.msg(4, 'tapon')
+        vclock.sleep(period)
+    rec.close()
+    clock.use(clock.SystemClock())
+    return loops
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a field trace against the control logic')
+    parser.add_argument('trace', nargs='?')
+    parser.add_argument('--timeline', help='write the actuator timeline as CSV')
+    parser.add_argument('--expect', action='append', default=[], metavar='SIGNAL=VALUE@SECONDS',
+                        help='assert a signal value at a time offset, e.g. tap=on@3600')
+    parser.add_argument('--synth', metavar='PATH', help='write a synthetic trace and exit')
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('-v', '--verbose', action='store_true', help='show output printed by main.py')
+    args = parser.parse_args(argv)
+
+    if args.synth:
+        loops = synthesize(args.synth, args.hours)
+        print('%s: %d loops, %d bytes' % (args.synth, loops, os.path.getsize(args.synth)))
+        return 0
+    if not args.trace:
+        parser.print_help()
+        return 2
+
+    install_fakes()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    quiet = None if args.verbose else open(os.devnull, 'w')
+    real_stdout = sys.stdout
+    if quiet:
+        sys.stdout = quiet
+    try:
+        import main as control
+        replay = Replay(control, args.verbose)
+        wall = _time.perf_counter()
+        replay.run(recorder.read(args.trace))
+        wall = _time.perf_counter() - wall
+    finally:
+        sys.stdout = real_stdout
+        if quiet:
+            quiet.close()
+
+    virtual = replay.now()
+    print('loops replayed   %d' % replay.loops)
+    print('virtual time     %.1f h in %.1f s wall (%.0fx real time)' % (virtual / 3600, wall, virtual / wall if wall else 0))
+    print('inputs           %d keys, %d remote messages' % (replay.inputs['key'], replay.inputs['msg']))
+    for signal in Replay.SIGNALS:
+        changes = [e for e in replay.timeline if e[1] == signal]
+        print('%-16s %d changes, final %s' % (signal, len(changes), replay.state.get(signal)))
+
+    failed = 0
+    for when, text in replay.violations:
+        print('VIOLATION  t=%.1fs  %s' % (when, text))
+        failed += 1
+    for spec in args.expect:
+        name, value, at = parse_expect(spec)
+        got = replay.value_at(name, at)
+        ok = str(got) == value
+        print('%s  %s (got %s)' % ('PASS' if ok else 'FAIL', spec, got))
+        failed += not ok
+
+    if args.timeline:
+        with open(args.timeline, 'w') as f:
+            f.write('t,signal,value\n')
+            for when, name, v in replay.timeline:
+                f.write('%.3f,%s,%s\n' % (when, name, v))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# 自适应采样调度：按信号变化快慢与距阈值远近调整每个传感器的采样间隔
+# 每个数据源（一个 DHT22、一路光照 ADC、一个 BMP280）有自己的间隔：
+#   - 相邻两次采样的变化超过 delta（显著变化）时，间隔立即缩为 1/4（快速跟进）
+#   - 读数距报警阈值不到 near 时，间隔不超过 near_ms（保证报警反应时间）
+#   - 变化小于 delta/2 时，间隔加倍（指数退避），直到 max_ms
+# 间隔不低于传感器允许的最小值 min_ms（DHT22 两次读取间隔 2 s，BMP280 一次转换约 14 ms）。
+# 时间一律用 ticks_ms 整数，不产生浮点对象。
+from array import array
+
+import clock
+
+
+class AdaptiveSampler:
+    def __init__(self, sources):
+        self.sources = sources
+        self.names = [None] * sources
+        self.min_ms = array('i', bytes(4 * sources))
+        self.max_ms = array('i', bytes(4 * sources))
+        self.near_ms = array('i', bytes(4 * sources))
+        self.interval = array('i', bytes(4 * sources))
+        self.last_ms = array('i', bytes(4 * sources))   # 上次采样的 ticks_ms
+        self.delta = [0] * sources                        # 每个数据源最多两个量（如温度和湿度）
+        self.delta2 = [0] * sources
+        self.last = [None] * sources
+        self.last2 = [None] * sources
+        self.sampled = bytearray(sources)                 # 是否采样过
+        self.count = array('i', bytes(4 * sources))
+        self.since = clock.ticks_ms()                     # 统计起点
+
+    def configure(self, i, name, min_ms, max_ms, delta, delta2=0, near_ms=0):
+        self.names[i] = name
+        self.min_ms[i] = min_ms
+        self.max_ms[i] = max_ms
+        self.near_ms[i] = near_ms or min_ms
+        self.interval[i] = min_ms
+        self.delta[i] = delta
+        self.delta2[i] = delta2
+        self.sampled[i] = 0
+
+    def due(self, i, now):
+        return not self.sampled[i] or clock.ticks_diff(now, self.last_ms[i]) >= self.interval[i]
+
+    def update(self, i, now, value, value2=None, near=False):
+        # 采样完成后调用：value/value2 为本次读数（读取失败为 None），near 表示已接近报警阈值
+        # 或调用方的滤波器仍在跟进阶跃（此时即使原始读数不再变化也不退避）
+        self.count[i] += 1
+        self.sampled[i] = 1
+        self.last_ms[i] = now
+        interval = self.interval[i]
+        if value is None:
+            # 读取失败：按最短间隔重试
+            interval = self.min_ms[i]
+        else:
+            change = self._change(self.last[i], value, self.delta[i])
+            if value2 is not None:
+                change = max(change, self._change(self.last2[i], value2, self.delta2[i]))
+            if change == 2:
+                interval >>= 2
+            elif change == 0:
+                interval <<= 1
+            self.last[i] = value
+            self.last2[i] = value2
+        if near and interval > self.near_ms[i]:
+            interval = self.near_ms[i]
+        self.interval[i] = min(max(interval, self.min_ms[i]), self.max_ms[i])
+
+    def _change(self, last, value, delta):
+        # 0 平稳（< delta/2），1 一般，2 显著（>= delta）
+        if last is None or not delta:
+            return 1
+        d = abs(value - last)
+        if d >= delta:
+            return 2
+        return 1 if d * 2 >= delta else 0
+
+    def rates(self):
+        # 各数据源自上次 reset_stats() 以来的实际采样率（次/分钟，整数）
+        elapsed = clock.ticks_diff(clock.ticks_ms(), self.since)
+        if elapsed <= 0:
+            return [0] * self.sources
+        return [self.count[i] * 60000 // elapsed for i in range(self.sources)]
+
+    def report(self):
+        rates = self.rates()
+        return {self.names[i]: {'interval_ms': self.interval[i], 'per_min': rates[i]}
+                for i in range(self.sources)}
+
+    def reset_stats(self):
+        for i in range(self.sources):
+            self.count[i] = 0
+        self.since = clock.ticks_ms()
+
+
+def near_limit(value, lower, upper, band):
+    # 读数距上限或下限不到 band 时为 True（越限较多时不算，例如夜间光照长期低于下限）
+    if value is None:
+        return False
+    return abs(value - lower) < band or abs(upper - value) < band
+
+
+if __name__ == '__main__':
+    # 上位机运行：模拟一天的温度与光照（含云层遮挡造成的光照跳变和一次过温），
+    # 对比每 300 ms 固定采样与自适应采样的采样次数和越限发现延迟
+    import math
+    import random
+
+    vclock = clock.use(clock.VirtualClock())
+    random.seed(1)
+    TEMP_UPPER, LUX_LOWER, LUX_UPPER = 30.0, 100, 10000
+    sampler = AdaptiveSampler(2)
+    sampler.configure(0, 'dht', 2000, 30000, 0.2, 1.0, near_ms=2000)
+    sampler.configure(1, 'lux', 300, 1000, 100, near_ms=300)
+
+    def temp_at(t):
+        return 24 + 5 * math.sin(2 * math.pi * t / 86400) + (3 if 21600 <= t < 21900 else 0)
+
+    clouds = sorted(random.uniform(0, 86400) for _ in range(40))
+
+    def lux_at(t):
+        lux = max(0.0, 8000 * math.sin(math.pi * (t - 21600) / 43200))
+        for c in clouds:
+            if c <= t < c + 120:
+                lux *= 0.01            # 云层遮挡：两分钟内降到 1%
+        return lux
+
+    fixed = 86400 * 1000 // 300       # 现有主循环约 300 ms 一轮，每轮读取所有传感器
+    samples = [0, 0]
+    over_temp = None
+    low_lux = []                      # 自适应采样读到光照低于下限的时刻
+    for step in range(fixed):
+        now_ms = step * 300
+        vclock.advance_to(now_ms / 1000)
+        now = clock.ticks_ms()
+        t = now_ms / 1000
+        if sampler.due(0, now):
+            temp = round(temp_at(t), 1)
+            sampler.update(0, now, temp, 60.0, near_limit(temp, -100, TEMP_UPPER, 1.0))
+            samples[0] += 1
+            if temp > TEMP_UPPER and over_temp is None:
+                over_temp = t
+        if sampler.due(1, now):
+            lux = int(lux_at(t))
+            sampler.update(1, now, lux, near=near_limit(lux, LUX_LOWER, LUX_UPPER, 50))
+            samples[1] += 1
+            if lux < LUX_LOWER:
+                low_lux.append(t)
+
+    # 白天（8-16 时）每次云层遮挡从开始到被发现的延迟
+    delays = []
+    for c in clouds:
+        if 8 * 3600 < c < 16 * 3600:
+            seen = next(t for t in low_lux if t >= c)
+            delays.append(seen - c)
+    print('DHT22 reads : %6d adaptive vs %6d every loop (%d at the 2 s minimum)' % (samples[0], fixed, 43200))
+    print('lux reads   : %6d adaptive vs %6d every loop' % (samples[1], fixed))
+    print('over-temp detected after %.1f s (2 s budget)' % (over_temp - 21600))
+    print('cloud detected after %.2f s mean, %.2f s max over %d clouds (loop: 0.3 s max)' % (
+        sum(delays) / len(delays), max(delays), len(delays)))
+    print(sampler.report())
@@ -0,0 +1,413 @@
+# 温室空间插值（上位机，NumPy）：多个站点的温度、湿度、光照插值到平面网格，
+# 输出分区超限统计与热力图动画
+# 用法:
+#   python spatial.py layout.json data/                     读取网关日志（目录或 .log 文件），输出分区统计
+#   python spatial.py layout.json data/ --animate temp.gif  同时输出温度热力图动画（.gif/.webp，用 Pillow 写出）
+#   python spatial.py layout.json --demo 14                 按布局生成 14 天模拟数据，用于测速
+#
+# 布局文件（JSON）：温室尺寸与网格间距（米），站点坐标，分区矩形 [x0, y0, x1, y1]
+#   {"size": [40, 12], "cell": 0.5,
+#    "sensors": {"<uid>/1": [4, 3], "<uid>/2": [20, 9]},
+#    "zones": {"west": [0, 0, 20, 12], "east": [20, 0, 40, 12]}}
+# 站点名与 dashboard.py 相同（uid/站点号）。
+#
+# 计算方式：
+# - 各站点读数按 --step 秒分桶取平均，对齐到同一时间轴；缺失的桶沿用前值最多 --hold 步，之后视为缺失
+# - 插值权重（IDW 或高斯核）只与布局有关，预先算成 (站点数, 网格数) 矩阵，按布局缓存；
+#   每个时间步的网格 = (读数 * 有效掩码) @ W / (有效掩码 @ W)，整段时间一次矩阵乘法完成，
+#   缺失站点只影响分母，不需要为每种缺失组合重新计算权重
+# - 分区统计用 (网格数, 分区数) 的隶属矩阵，同样按块做矩阵乘法
+import argparse
+import hashlib
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+import dashboard
+import gateway
+import wire
+
+FIELDS = ('temp', 'hum', 'lux')                  # 插值的字段，下标与 wire.STATION_FIELDS 一致
+LABELS = {'temp': 'Temperature (°C)', 'hum': 'Humidity (%)', 'lux': 'Lux'}
+CMAPS = {'temp': 'inferno', 'hum': 'Blues', 'lux': 'viridis'}
+CHUNK = 2048                                      # 每块处理的时间步数，限制 (时间步, 网格数) 数组的内存
+
+_weights = {}                                     # 内存中的权重矩阵缓存：键 -> (站点数, 网格数) float32
+
+
+class Layout:
+    def __init__(self, size, cell, sensors, zones=None):
+        self.size = (float(size[0]), float(size[1]))
+        self.cell = float(cell)
+        self.labels = list(sensors)
+        self.xy = np.array([sensors[k] for k in self.labels], dtype=np.float64).reshape(-1, 2)
+        self.nx = max(1, int(math.ceil(self.size[0] / self.cell)))
+        self.ny = max(1, int(math.ceil(self.size[1] / self.cell)))
+        gx = (np.arange(self.nx) + 0.5) * self.cell
+        gy = (np.arange(self.ny) + 0.5) * self.cell
+        self.cells = np.stack(np.meshgrid(gx, gy), axis=-1).reshape(-1, 2)   # 按行展开：下标 = y * nx + x
+        # 分区隶属矩阵，第 0 列为整个温室
+        self.zones = {'house': [0.0, 0.0, self.size[0], self.size[1]]}
+        self.zones.update(zones or {})
+        self.zone_names = list(self.zones)
+        self.members = np.zeros((len(self.cells), len(self.zones)), dtype=np.float32)
+        for j, name in enumerate(self.zone_names):
+            x0, y0, x1, y1 = self.zones[name]
+            x, y = self.cells[:, 0], self.cells[:, 1]
+            self.members[:, j] = (x >= x0) & (x < x1) & (y >= y0) & (y < y1)
+        self.zone_cells = np.maximum(self.members.sum(axis=0), 1)
+
+    def key(self):
+        # 布局指纹：站点坐标与网格相同的布局共用权重矩阵
+        h = hashlib.sha1()
+        h.update(np.array([self.size[0], self.size[1], self.cell], dtype=np.float64).tobytes())
+        h.update(self.xy.tobytes())
+        return h.hexdigest()[:16]
+
+
+def load_layout(path):
+    with open(path, encoding='utf-8') as f:
+        spec = json.load(f)
+    return Layout(spec['size'], spec.get('cell', 0.5), spec['sensors'], spec.get('zones'))
+
+
+def weights(layout, method='idw', power=2.0, scale=3.0, cache_dir=None):
+    # 返回 (站点数, 网格数) 权重矩阵；idw: 1/d^power，gauss: exp(-d²/2scale²)
+    key = '%s-%s-%g-%g' % (layout.key(), method, power, scale)
+    w = _weights.get(key)
+    if w is not None:
+        return w
+    path = os.path.join(cache_dir, 'weights-%s.npy' % key) if cache_dir else None
+    if path and os.path.exists(path):
+        w = np.load(path)
+    else:
+        d = np.hypot(layout.xy[:, None, 0] - layout.cells[None, :, 0], layout.xy[:, None, 1] - layout.cells[None, :, 1])
+        if method == 'idw':
+            # 与站点重合的网格几乎只取该站点读数
+            w = 1.0 / np.maximum(d, layout.cell * 1e-3) ** power
+        elif method == 'gauss':
+            w = np.exp(-0.5 * (d / scale) ** 2)
+        else:
+            raise ValueError('unknown method %r' % method)
+        w = (w / w.max(axis=0)).astype(np.float32)    # 每个网格的最大权重归一为 1，避免 float32 溢出
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(path, w)
+    _weights[key] = w
+    return w
+
+
+# ---------- 读取网关日志 ----------
+
+def _values(values):
+    return [math.nan if v is None else v for v in values]
+
+
+def iter_samples(line):
+    # 从一行网关日志中取出 (时间戳, 站点名, [temp, hum, lux])；聚合帧缺少的字段为 NaN
+    parsed = dashboard.parse_feed_line(line)
+    if parsed is None or line.count(b'\t') < 3:
+        return
+    uid, topic, msg = parsed
+    try:
+        ts = float(line.split(b'\t', 1)[0])
+    except ValueError:
+        return
+    uid = uid.decode(errors='replace')
+    if msg.startswith(b'#') and msg.count(b'#') > 2:
+        station = dashboard.TOPIC_STATIONS.get(topic)
+        if station:
+            values = gateway.parse_values(msg)[:len(FIELDS)]
+            yield ts, '%s/%d' % (uid, station), values + [math.nan] * (len(FIELDS) - len(values))
+        return
+    try:
+        frame = wire.decode(msg.decode())
+    except wire.DECODE_ERRORS:
+        return
+    if frame['kind'] == 'telemetry':
+        for n, st in enumerate(frame['stations'], 1):
+            yield ts, '%s/%d' % (uid, n), _values(st[f] for f in FIELDS)
+    elif frame['kind'] == 'samples':
+        samples = frame['samples']
+        shift = 0.0 if frame['synced'] or not samples else ts - samples[-1]['t']
+        for sample in samples:
+            for n, st in enumerate(sample['stations'], 1):
+                yield sample['t'] + shift, '%s/%d' % (uid, n), _values(st[f] for f in FIELDS)
+    elif frame['kind'] == 'aggregate':
+        by_station = {}
+        for ch in frame['channels']:
+            if ch['field'] in FIELDS:
+                by_station.setdefault(ch['station'], [math.nan] * len(FIELDS))[FIELDS.index(ch['field'])] = (
+                    math.nan if ch['mean'] is None else ch['mean'])
+        for n, values in by_station.items():
+            yield ts, '%s/%d' % (uid, n), values
+
+
+def load_logs(source, labels):
+    # 返回 (时间戳数组, 站点下标数组, (样本数, 字段数) 读数数组)，只保留布局中的站点
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(source, f) for f in os.listdir(source) if f.endswith('.log'))
+    else:
+        paths = [source]
+    index = {label: i for i, label in enumerate(labels)}
+    ts, idx, rows = [], [], []
+    for path in paths:
+        with open(path, 'rb') as f:
+            for line in f:
+                for t, label, values in iter_samples(line):
+                    i = index.get(label)
+                    if i is not None:
+                        ts.append(t)
+                        idx.append(i)
+                        rows.append(values)
+    return (np.array(ts, dtype=np.float64), np.array(idx, dtype=np.int64),
+            np.array(rows, dtype=np.float64).reshape(-1, len(FIELDS)))
+
+
+# ---------- 时间对齐与插值 ----------
+
+def align(ts, idx, rows, sensors, step=60.0, hold=5):
+    # 按 step 秒分桶取平均，返回 (桶起点时间, (字段数, 时间步, 站点数) float32，缺失为 NaN)
+    if not len(ts):
+        return np.zeros(0), np.full((len(FIELDS), 0, sensors), np.nan, dtype=np.float32)
+    t0 = math.floor(ts.min() / step) * step
+    bucket = ((ts - t0) // step).astype(np.int64)
+    steps = int(bucket.max()) + 1
+    values = np.empty((len(FIELDS), steps, sensors), dtype=np.float32)
+    for k in range(len(FIELDS)):
+        v = rows[:, k]
+        ok = ~np.isnan(v)
+        cell = bucket[ok] * sensors + idx[ok]
+        total = np.bincount(cell, weights=v[ok], minlength=steps * sensors)
+        count = np.bincount(cell, minlength=steps * sensors)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values[k] = (total / count).reshape(steps, sensors)
+    if hold:
+        # 缺失的桶沿用前值，最多 hold 步：每个位置记下最近一次有值的时间步
+        t = np.arange(steps)[:, None]
+        for k in range(len(FIELDS)):
+            have = ~np.isnan(values[k])
+            last = np.maximum.accumulate(np.where(have, t, -1), axis=0)
+            fill = ~have & (last >= 0) & (t - last <= hold)
+            src = values[k][np.maximum(last, 0), np.arange(sensors)]
+            values[k][fill] = src[fill]
+    return t0 + step * np.arange(steps), values
+
+
+def interpolate(values, w):
+    # values: (时间步, 站点数)，w: (站点数, 网格数) -> (时间步, 网格数)；某时刻所有站点都缺失时为 NaN
+    have = ~np.isnan(values)
+    v = np.where(have, values, 0).astype(np.float32)
+    if have.all():
+        return v @ (w / w.sum(axis=0))
+    num = v @ w
+    den = have.astype(np.float32) @ w
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return num / den
+
+
+def chunks(values, w, chunk=CHUNK):
+    # 分块插值：依次产生 (起始时间步, (块长, 网格数) 网格)
+    for start in range(0, values.shape[0], chunk):
+        yield start, interpolate(values[start:start + chunk], w)
+
+
+def zone_stats(layout, values, w, lower, upper, step, chunk=CHUNK):
+    # 每个分区：平均值、最高值、超上限/低于下限的面积×时间占比、出现超限的累计分钟数、最大超出量
+    # 能先在时间轴上归约的量（总和、最值、超限次数）先归约成每个网格一个值，再乘隶属矩阵
+    members = layout.members
+    cells = len(layout.cells)
+    total = np.zeros(cells)
+    high = np.full(cells, -np.inf, dtype=np.float32)
+    low = np.full(cells, np.inf, dtype=np.float32)
+    above = np.zeros(cells)
+    below = np.zeros(cells)
+    minutes = np.zeros(members.shape[1])
+    steps = 0
+    for _, grid in chunks(values, w, chunk):
+        grid = grid[~np.isnan(grid[:, 0])]
+        if not len(grid):
+            continue
+        steps += len(grid)
+        total += grid.sum(axis=0)
+        np.maximum(high, grid.max(axis=0), out=high)
+        np.minimum(low, grid.min(axis=0), out=low)
+        hi = grid > upper
+        lo = grid < lower
+        above += np.count_nonzero(hi, axis=0)
+        below += np.count_nonzero(lo, axis=0)
+        # 分区内任一网格超限的时间步
+        minutes += ((hi | lo).astype(np.float32) @ members > 0).sum(axis=0) * step / 60
+    steps = max(steps, 1)
+    inside = members.astype(bool)
+    excess = np.maximum(np.maximum(high - upper, lower - low), 0)
+    stats = {}
+    for j, name in enumerate(layout.zone_names):
+        n = layout.zone_cells[j]
+        stats[name] = {'mean': total @ members[:, j] / n / steps, 'max': high[inside[:, j]].max(),
+                       'above_pct': 100 * (above @ members[:, j]) / n / steps,
+                       'below_pct': 100 * (below @ members[:, j]) / n / steps,
+                       'violation_min': minutes[j], 'worst_excess': excess[inside[:, j]].max()}
+    return stats
+
+
+def field_limits(limits, k):
+    lo_name, hi_name = dashboard.BANDS[k]
+    return limits.get(lo_name, -math.inf), limits.get(hi_name, math.inf)
+
+
+def animate(layout, times, values, w, field, limits, out, every=1, fps=10, max_frames=600):
+    # 每 every 个时间步取一帧，输出热力图动画（Pillow 支持的 .gif/.webp/.png）；帧数超过 max_frames 时自动加大间隔
+    # 与 dashboard.py 一样使用 blitting：坐标轴、色标等静态部分只画一次，每帧只重画热力图、站点、分区与标题
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Rectangle
+    from PIL import Image
+
+    k = FIELDS.index(field)
+    every = max(every, int(math.ceil(len(times) / max_frames)))
+    frames = np.arange(0, len(times), every)
+    grids = interpolate(values[k][frames], w).reshape(len(frames), layout.ny, layout.nx)
+    lower, upper = field_limits(limits, k)
+    finite = grids[np.isfinite(grids)]
+    vmin = min(finite.min(), lower) if finite.size else lower
+    vmax = max(finite.max(), upper) if finite.size else upper
+    fig, ax = plt.subplots(figsize=(10, 10 * layout.size[1] / layout.size[0] + 1.5))
+    image = ax.imshow(grids[0], origin='lower', extent=(0, layout.size[0], 0, layout.size[1]),
+                      cmap=CMAPS[field], vmin=vmin, vmax=vmax, interpolation='bilinear', animated=True)
+    fig.colorbar(image, ax=ax, label=LABELS[field], fraction=0.03)
+    overlay = [ax.scatter(layout.xy[:, 0], layout.xy[:, 1], c='w', edgecolors='k', s=30, animated=True)]
+    for name in layout.zone_names[1:]:
+        x0, y0, x1, y1 = layout.zones[name]
+        overlay.append(ax.add_patch(Rectangle((x0, y0), x1 - x0, y1 - y0, fill=False, ec='w', lw=0.8, ls='--',
+                                              animated=True)))
+        overlay.append(ax.text(x0 + 0.2, y1 - 0.2, name, color='w', va='top', fontsize='small', animated=True))
+    ax.set_xlabel('x (m)')
+    ax.set_ylabel('y (m)')
+    title = ax.set_title(' ', animated=True)
+    # 超上限/低于下限的等值线
+    levels = [v for v in (lower, upper) if vmin < v < vmax]
+    cx = (np.arange(layout.nx) + 0.5) * layout.cell
+    cy = (np.arange(layout.ny) + 0.5) * layout.cell
+
+    canvas = fig.canvas
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+    images = []
+    for i in range(len(frames)):
+        canvas.restore_region(background)
+        image.set_data(grids[i])
+        ax.draw_artist(image)
+        if levels and np.isfinite(grids[i]).all():
+            contour = ax.contour(cx, cy, grids[i], levels=levels, colors='r', linewidths=1)
+            contour.set_animated(True)
+            ax.draw_artist(contour)
+            contour.remove()
+        for artist in overlay:
+            ax.draw_artist(artist)
+        title.set_text('%s  %s' % (LABELS[field], time.strftime('%Y-%m-%d %H:%M', time.localtime(times[frames[i]]))))
+        ax.draw_artist(title)
+        images.append(Image.fromarray(np.asarray(canvas.buffer_rgba())[..., :3].copy()))
+    plt.close(fig)
+    if out.lower().endswith('.gif'):
+        # 所有帧共用一个调色板，避免逐帧量化：色图取 224 级，另加灰阶（坐标轴、文字）与等值线的红色
+        colors = np.vstack([image.cmap(np.linspace(0, 1, 224))[:, :3] * 255,
+                            np.repeat(np.linspace(0, 255, 31)[:, None], 3, axis=1), [[255, 0, 0]]])
+        palette = Image.new('P', (1, 1))
+        palette.putpalette(colors.round().astype(np.uint8).tobytes())
+        images = [im.quantize(palette=palette, dither=Image.Dither.NONE) for im in images]
+    images[0].save(out, save_all=True, append_images=images[1:], duration=int(1000 / fps), loop=0, optimize=False)
+    return len(frames)
+
+
+# ---------- 模拟数据 ----------
+
+def demo_layout(sensors=12):
+    # 40 m × 12 m 的温室，站点沿两条通道均匀分布，分为西、中、东三区
+    xs = np.linspace(3, 37, (sensors + 1) // 2)
+    spec = {}
+    for i in range(sensors):
+        spec['demo%02d/%d' % (i // 2, i % 2 + 1)] = [float(xs[i // 2]), 3.0 if i % 2 == 0 else 9.0]
+    return Layout((40, 12), 0.5, spec, {'west': [0, 0, 13, 12], 'middle': [13, 0, 27, 12], 'east': [27, 0, 40, 12]})
+
+
+def demo_data(layout, days, step=60.0, seed=0):
+    # 日变化 + 东侧午后热点 + 噪声，约 1% 的读数缺失，返回与 align() 相同的形状
+    rng = np.random.default_rng(seed)
+    steps = int(days * 86400 / step)
+    t = np.arange(steps) * step
+    day = np.sin(2 * np.pi * (t / 86400 - 0.25))[:, None]
+    x = layout.xy[None, :, 0] / layout.size[0]
+    hot = np.clip(day, 0, None) * np.exp(-((x - 0.85) / 0.15) ** 2)
+    values = np.empty((len(FIELDS), steps, len(layout.labels)), dtype=np.float32)
+    values[0] = 22 + 5 * day + 6 * hot + rng.normal(0, 0.3, (steps, len(layout.labels)))
+    values[1] = 55 - 12 * day - 10 * hot + rng.normal(0, 1.5, (steps, len(layout.labels)))
+    values[2] = np.clip(6000 * day + 800 * (1 - x), 0, None) + rng.normal(0, 50, (steps, len(layout.labels)))
+    values[:, rng.random((steps, len(layout.labels))) < 0.01] = np.nan
+    return time.time() - steps * step + t, values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Spatial interpolation of multi-station greenhouse readings')
+    parser.add_argument('layout', nargs='?', help='layout JSON (station coordinates and zones)')
+    parser.add_argument('source', nargs='?', help='gateway log file or directory')
+    parser.add_argument('--demo', type=float, metavar='DAYS', help='use simulated data instead of logs')
+    parser.add_argument('--step', type=float, default=60, help='time step in seconds')
+    parser.add_argument('--hold', type=int, default=5, help='steps a missing reading keeps its last value')
+    parser.add_argument('--method', choices=('idw', 'gauss'), default='idw')
+    parser.add_argument('--power', type=float, default=2.0, help='IDW power')
+    parser.add_argument('--scale', type=float, default=3.0, help='Gaussian kernel length in metres')
+    parser.add_argument('--cache', help='directory to cache weight matrices in')
+    parser.add_argument('--limits', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'),
+                        help='file to read the *_LIMIT thresholds from')
+    parser.add_argument('--animate', metavar='OUT', help='write a heatmap animation (.gif or .webp)')
+    parser.add_argument('--field', choices=FIELDS, default='temp', help='field to animate')
+    parser.add_argument('--every', type=int, default=1, help='animate every Nth time step')
+    parser.add_argument('--fps', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.demo:
+        layout = load_layout(args.layout) if args.layout else demo_layout()
+    elif args.layout and args.source:
+        layout = load_layout(args.layout)
+    else:
+        parser.print_help()
+        return 2
+    limits = dashboard.load_limits(args.limits)
+
+    start = time.perf_counter()
+    if args.demo:
+        times, values = demo_data(layout, args.demo, args.step)
+    else:
+        ts, idx, rows = load_logs(args.source, layout.labels)
+        times, values = align(ts, idx, rows, len(layout.labels), args.step, args.hold)
+    loaded = time.perf_counter()
+    w = weights(layout, args.method, args.power, args.scale, args.cache)
+    stats = [zone_stats(layout, values[k], w, *field_limits(limits, k), args.step) for k in range(len(FIELDS))]
+    done = time.perf_counter()
+
+    print('sensors %d  grid %dx%d (%d cells)  steps %d x %gs (%.1f days)' % (
+        len(layout.labels), layout.nx, layout.ny, len(layout.cells), len(times), args.step,
+        len(times) * args.step / 86400))
+    print('load/align %.2f s  interpolate + zone stats %.2f s (%.0f grids/s)' % (
+        loaded - start, done - loaded, len(FIELDS) * len(times) / max(done - loaded, 1e-9)))
+    for k, field in enumerate(FIELDS):
+        lower, upper = field_limits(limits, k)
+        print('\n%s  limits %g..%g' % (LABELS[field], lower, upper))
+        print('  %-10s %9s %9s %8s %8s %9s %9s' % ('zone', 'mean', 'max', '>upper%', '<lower%', 'viol_min', 'worst'))
+        for name, z in stats[k].items():
+            print('  %-10s %9.2f %9.2f %8.2f %8.2f %9.0f %9.2f' % (
+                name, z['mean'], z['max'], z['above_pct'], z['below_pct'], z['violation_min'], z['worst_excess']))
+    if args.animate:
+        start = time.perf_counter()
+        frames = animate(layout, times, values, w, args.field, limits, args.animate, args.every, args.fps)
+        print('\n%s: %d frames in %.1f s' % (args.animate, frames, time.perf_counter() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -24,6 +24,73 @@ SET_PRECHARGE       = const(0xd9)
 SET_VCOM_DESEL      = const(0xdb)
 SET_CHARGE_PUMP     = const(0x8d)
 
+# 16x16 MONO_VLSB glyph size in bytes
+GLYPH_BYTES         = const(32)
+
+
+class GlyphAtlas:
+    # All 16x16 glyphs packed into one contiguous MONO_VLSB buffer (32 bytes each).
+    # File layout: first line is the UTF-8 character list, followed by the glyph data.
+    def __init__(self, chars, data):
+        self.buf = data
+        self.index = {}
+        self.glyphs = []
+        mv = memoryview(data)
+        for i, ch in enumerate(chars):
+            self.index[ch] = i
+            # one FrameBuffer per glyph, created once over a slice of the shared buffer
+            self.glyphs.append(framebuf.FrameBuffer(mv[i*GLYPH_BYTES:(i+1)*GLYPH_BYTES], 16, 16, framebuf.MONO_VLSB))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            chars = f.readline().decode().rstrip('\n')
+            data = bytearray(len(chars) * GLYPH_BYTES)
+            f.readinto(data)
+        return cls(chars, data)
+
+    def glyph(self, ch):
+        i = self.index.get(ch)
+        return None if i is None else self.glyphs[i]
+
+
+class ImageCache:
+    # Raw MONO_VLSB images (.bin) streamed from flash with readinto() into
+    # preallocated buffers; the least recently used slot is reused on a miss.
+    def __init__(self, slots=2, width=128, height=96, path='/img/'):
+        self.width = width
+        self.height = height
+        self.path = path
+        size = width * ((height + 7) // 8)
+        self.bufs = [bytearray(size) for _ in range(slots)]
+        self.fbufs = [framebuf.FrameBuffer(b, width, height, framebuf.MONO_VLSB) for b in self.bufs]
+        self.names = [None] * slots
+        self.used = [0] * slots
+        self.tick = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name):
+        self.tick += 1
+        for i in range(len(self.names)):
+            if self.names[i] == name:
+                self.used[i] = self.tick
+                self.hits += 1
+                return self.fbufs[i]
+        i = 0
+        for j in range(1, len(self.used)):
+            if self.used[j] < self.used[i]:
+                i = j
+        self.names[i] = None
+        with open(self.path + name + '.bin', 'rb') as f:
+            n = f.readinto(self.bufs[i])
+        if n != len(self.bufs[i]):
+            raise OSError('short image file: ' + name)
+        self.names[i] = name
+        self.used[i] = self.tick
+        self.misses += 1
+        return self.fbufs[i]
+
 
 class SSD1306:
     def __init__(self, width, height, external_vcc, color=framebuf.MONO_VLSB):
@@ -47,10 +114,20 @@ class SSD1306:
         self.text = fb.text
         self.scroll = fb.scroll
         self.blit = fb.blit
+        self.atlas = None
+        self.images = None
+        x0 = 0
+        x1 = self.width - 1
+        if self.width == 64:
+            # displays with width of 64 pixels are shifted by 32
+            x0 += 32
+            x1 += 32
+        # window commands sent before every frame, as one transaction
+        self.show_cmds = bytes((SET_COL_ADDR, x0, x1, SET_PAGE_ADDR, 0, self.pages - 1))
         self.init_display()
 
     def init_display(self):
-        for cmd in (
+        self.write_cmds(bytes((
             SET_DISP | 0x00, # off
             # address setting
             SET_MEM_ADDR, 0x00, # horizontal
@@ -71,8 +148,7 @@ class SSD1306:
             SET_NORM_INV, # not inverted
             # charge pump
             SET_CHARGE_PUMP, 0x10 if self.external_vcc else 0x14,
-            SET_DISP | 0x01): # on
-            self.write_cmd(cmd)
+            SET_DISP | 0x01))) # on
         self.fill(0)
         self.show()
 
@@ -90,39 +166,67 @@ class SSD1306:
         self.write_cmd(SET_NORM_INV | (invert & 1))
 
     def show(self):
-        x0 = 0
-        x1 = self.width - 1
-        if self.width == 64:
-            # displays with width of 64 pixels are shifted by 32
-            x0 += 32
-            x1 += 32
-        self.write_cmd(SET_COL_ADDR)
-        self.write_cmd(x0)
-        self.write_cmd(x1)
-        self.write_cmd(SET_PAGE_ADDR)
-        self.write_cmd(0)
-        self.write_cmd(self.pages - 1)
+        self.write_cmds(self.show_cmds)
         self.write_data(self.buffer)
     #下面函数为添加的功能，根据pyboard板子厂商提供的例程修改
 
     def show_hanzi(self, row, col, charlist1):
+        # charlist1 is either a 32-byte glyph list or a character looked up in the atlas;
+        # without an atlas, or for a character it lacks, fall back to the 8x8 font
+        if isinstance(charlist1, str):
+            fbuf = self.atlas.glyph(charlist1) if self.atlas else None
+            if fbuf is None:
+                self.text(charlist1, col, (row-1)*16 + 4)
+            else:
+                self.blit(fbuf, col, (row-1)*16)
+            return
         data = bytearray(charlist1)
         fbuf = framebuf.FrameBuffer(data, 16, 16, framebuf.MONO_VLSB)
         self.blit(fbuf,col,(row-1)*16)
         del fbuf
 
+    def use_atlas(self, atlas):
+        self.atlas = atlas
+
+    def show_text_hanzi(self, row, col, text):
+        # lay out a phrase: atlas glyphs are 16 px wide, other characters use the 8x8 font
+        x = col
+        y = (row-1)*16
+        atlas = self.atlas
+        for ch in text:
+            fbuf = atlas.glyph(ch) if atlas else None
+            w = 8 if fbuf is None else 16
+            if x + w > self.width:
+                x = col
+                y += 16
+            if fbuf is not None:
+                self.blit(fbuf, x, y)
+            else:
+                self.text(ch, x, y + 4)
+            x += w
+        return x, y
+
     def show_image(self, image_list):
         data = bytearray(image_list)
         fbuf = framebuf.FrameBuffer(data, 128, 96, framebuf.MONO_VLSB)
         self.blit(fbuf, 0, 0)
         del fbuf
 
+    def use_images(self, cache):
+        self.images = cache
+
+    def show_image_file(self, name, x=0, y=0):
+        # draw <cache.path><name>.bin without building a list or a new FrameBuffer
+        self.blit(self.images.get(name), x, y)
+
 
 class SSD1306_I2C(SSD1306):
     def __init__(self, width, height, i2c, addr=0x3c, external_vcc=False, color=framebuf.MONO_VLSB):
         self.i2c = i2c
         self.addr = addr
         self.temp = bytearray(2)
+        self.write_list = [b'\x40', None]  # Co=0, D/C#=1
+        self.cmds_list = [b'\x00', None]   # Co=0, D/C#=0
         super().__init__(width, height, external_vcc, color)
 
     def write_cmd(self, cmd):
@@ -130,8 +234,15 @@ class SSD1306_I2C(SSD1306):
         self.temp[1] = cmd
         self.i2c.writeto(self.addr, self.temp)
 
+    def write_cmds(self, cmds):
+        # a command stream in a single transaction
+        self.cmds_list[1] = cmds
+        self.i2c.writevto(self.addr, self.cmds_list)
+
     def write_data(self, buf):
-        self.i2c.writeto(self.addr, b'\x40' + buf)
+        # control byte and framebuffer sent as one transaction without concatenating them
+        self.write_list[1] = buf
+        self.i2c.writevto(self.addr, self.write_list)
 
 
 class SSD1306_SPI(SSD1306):
@@ -160,6 +271,14 @@ class SSD1306_SPI(SSD1306):
         self.spi.write(bytearray([cmd]))
         self.cs(1)
 
+    def write_cmds(self, cmds):
+        self.spi.init(baudrate=self.rate, polarity=0, phase=0)
+        self.cs(1)
+        self.dc(0)
+        self.cs(0)
+        self.spi.write(cmds)
+        self.cs(1)
+
     def write_data(self, buf):
         self.spi.init(baudrate=self.rate, polarity=0, phase=0)
         self.cs(1)
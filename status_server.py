@@ -0,0 +1,157 @@
+# 局域网状态服务：select 驱动的非阻塞 HTTP/JSON 接口
+# GET / 或 /status 返回全部站点数据、阈值、龙头/蜂鸣器与报警状态的 JSON 快照。
+# 快照只在数据变化后的首个请求时重新生成，其余请求只是把缓存的响应写入套接字。
+# 连接后超过 timeout_ms 仍未完成请求与响应的客户端被关闭，空闲或半开连接不会占满 max_clients。
+import socket
+import select
+import json
+import time
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+_MAX_REQUEST = 512
+_NOT_FOUND = b'HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+
+
+class StatusServer:
+    def __init__(self, port=80, max_clients=4, timeout_ms=3000):
+        self.max_clients = max_clients
+        self.timeout_ms = timeout_ms
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(socket.getaddrinfo('0.0.0.0', port)[0][-1])
+        self.sock.listen(max_clients)
+        self.sock.setblocking(False)
+        self.poller = select.poll()
+        self.poller.register(self.sock, select.POLLIN)
+        self.fds = {}           # CPython 的 poll 返回文件描述符，MicroPython 返回套接字对象
+        self._track(self.sock)
+        self.clients = {}       # sock -> [请求缓冲, 响应, 已发送字节数, 接受连接时的 ticks_ms]
+        self.state = {}
+        self.provider = None    # 可选回调：收到请求、生成快照前调用以更新数据，无人访问时不产生开销
+        self.response = b''
+        self.dirty = True
+        self.requests = 0
+        self.renders = 0
+        self.timeouts = 0
+
+    def _track(self, sock):
+        if hasattr(sock, 'fileno'):
+            self.fds[sock.fileno()] = sock
+
+    def set(self, key, value):
+        if self.state.get(key) != value:
+            self.state[key] = value
+            self.dirty = True
+
+    def _snapshot(self):
+        if self.dirty:
+            body = json.dumps(self.state).encode()
+            header = ('HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n'
+                      'Access-Control-Allow-Origin: *\r\nConnection: close\r\n'
+                      'Content-Length: %d\r\n\r\n' % len(body))
+            self.response = header.encode() + body
+            self.dirty = False
+            self.renders += 1
+        return self.response
+
+    def poll(self, timeout=0):
+        # 处理一次就绪事件；timeout 为 0 时完全不阻塞
+        # MicroPython 使用 ipoll，避免每次轮询分配结果列表
+        events = self.poller.ipoll(timeout) if hasattr(self.poller, 'ipoll') else self.poller.poll(timeout)
+        for obj, event in events:
+            sock = self.fds.get(obj, obj)
+            if sock is self.sock:
+                self._accept()
+            elif sock in self.clients:
+                if event & (select.POLLHUP | select.POLLERR):
+                    self._drop(sock)
+                elif event & select.POLLIN:
+                    self._read(sock)
+                elif event & select.POLLOUT:
+                    self._write(sock)
+        if self.clients:
+            self._expire()
+
+    def _expire(self):
+        # 关闭超时的客户端（连接后不发请求，或不再读取响应）
+        now = ticks_ms()
+        stale = [sock for sock, entry in self.clients.items() if ticks_diff(now, entry[3]) >= self.timeout_ms]
+        for sock in stale:
+            self._drop(sock)
+            self.timeouts += 1
+
+    def serve(self, ms):
+        # 在控制循环的空闲时段内处理请求，代替 time.sleep
+        start = ticks_ms()
+        while True:
+            remaining = ms - ticks_diff(ticks_ms(), start)
+            if remaining <= 0:
+                break
+            self.poll(remaining)
+
+    def _accept(self):
+        try:
+            client, _ = self.sock.accept()
+        except OSError:
+            return
+        if len(self.clients) >= self.max_clients:
+            client.close()
+            return
+        client.setblocking(False)
+        self.clients[client] = [b'', None, 0, ticks_ms()]
+        self._track(client)
+        self.poller.register(client, select.POLLIN)
+
+    def _read(self, sock):
+        entry = self.clients[sock]
+        try:
+            data = sock.recv(_MAX_REQUEST)
+        except OSError:
+            return
+        if not data:
+            self._drop(sock)
+            return
+        entry[0] += data
+        if b'\r\n\r\n' not in entry[0] and len(entry[0]) < _MAX_REQUEST:
+            return
+        line = entry[0].split(b'\r\n', 1)[0].split()
+        path = line[1] if len(line) > 1 else b''
+        self.requests += 1
+        if path in (b'/', b'/status'):
+            if self.provider:
+                self.provider()
+            entry[1] = self._snapshot()
+        else:
+            entry[1] = _NOT_FOUND
+        self.poller.modify(sock, select.POLLOUT)
+        self._write(sock)
+
+    def _write(self, sock):
+        entry = self.clients[sock]
+        try:
+            entry[2] += sock.send(memoryview(entry[1])[entry[2]:])
+        except OSError:
+            return
+        if entry[2] >= len(entry[1]):
+            self._drop(sock)
+
+    def _drop(self, sock):
+        self.poller.unregister(sock)
+        self.clients.pop(sock, None)
+        if hasattr(sock, 'fileno'):
+            self.fds.pop(sock.fileno(), None)
+        sock.close()
+
+    def close(self):
+        for sock in list(self.clients):
+            self._drop(sock)
+        self.poller.unregister(self.sock)
+        self.sock.close()
@@ -0,0 +1,243 @@
+# 传输层：统一 connect/subscribe/publish/receive 接口
+# 后端:
+#   BemfaTCP  巴法云 TCP 文本协议（cmd=1 订阅 / cmd=2 发布，端口 8344）
+#   BemfaMQTT 巴法云 MQTT（umqtt.simple，QoS 0/1，持久会话，端口 9501）
+# 两种后端都由服务器推送已订阅主题的消息，receive() 不阻塞地取回 (topic, msg)。
+import socket
+import select
+import time
+
+MAX_LINE = 1024         # 接收缓冲上限：对端超过该长度仍未发送 \r\n 时丢弃缓冲，避免耗尽堆
+
+
+class Transport:
+    def __init__(self, uid, keepalive=60):
+        self.uid = uid
+        self.keepalive = keepalive
+        self.topics = []
+        self.connected = False
+        self.last_tx = 0
+
+    def connect(self):
+        raise NotImplementedError
+
+    def subscribe(self, topic):
+        # 断线重连后 connect() 会自动重新订阅
+        if topic not in self.topics:
+            self.topics.append(topic)
+        if self.connected:
+            self._subscribe(topic)
+
+    def publish(self, topic, msg, qos=0):
+        # 返回写出的字节数
+        raise NotImplementedError
+
+    def receive(self):
+        # 返回已到达的 [(topic, msg), ...]，没有数据时立即返回空列表
+        raise NotImplementedError
+
+    def ping(self):
+        raise NotImplementedError
+
+    def close(self):
+        self.connected = False
+
+    def _subscribe(self, topic):
+        raise NotImplementedError
+
+    def _keepalive(self):
+        if self.keepalive and time.time() - self.last_tx >= self.keepalive:
+            self.ping()
+
+
+class BemfaTCP(Transport):
+    def __init__(self, uid, host='bemfa.com', port=8344, timeout=5, keepalive=60):
+        super().__init__(uid, keepalive)
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.poller = None
+        self.rxbuf = b''
+        self.overflows = 0  # 因超过 MAX_LINE 而丢弃接收缓冲的次数
+        self.lines = {}     # topic -> [msg, 已编码的发布行]，相同消息重复发布时不再重新编码
+
+    def connect(self):
+        addr = socket.getaddrinfo(self.host, self.port)[0][-1]
+        self.sock = socket.socket()
+        try:
+            # 超时在 connect() 之前设置，服务器不可达时最多阻塞 timeout 秒
+            self.sock.settimeout(self.timeout)
+            self.sock.connect(addr)
+            self.poller = select.poll()
+            self.poller.register(self.sock, select.POLLIN)
+            self.connected = True
+            for topic in self.topics:
+                self._subscribe(topic)
+        except Exception:
+            self.close()
+            raise
+
+    def _send(self, line):
+        data = line.encode() if isinstance(line, str) else line
+        self.sock.send(data)
+        self.last_tx = time.time()
+        return len(data)
+
+    def _subscribe(self, topic):
+        self._send(f'cmd=1&uid={self.uid}&topic={topic}\r\n')
+
+    def publish(self, topic, msg, qos=0):
+        entry = self.lines.get(topic)
+        if entry is None:
+            entry = self.lines[topic] = [None, b'']
+        if entry[0] != msg:
+            entry[0] = msg
+            entry[1] = f'cmd=2&uid={self.uid}&topic={topic}&msg={msg}\r\n'.encode()
+        return self._send(entry[1])
+
+    def ping(self):
+        self._send('ping\r\n')
+
+    def receive(self):
+        # 没有消息时返回空元组，不分配列表
+        messages = ()
+        while _ready(self.poller):
+            data = self.sock.recv(1024)
+            if not data:
+                self.close()
+                raise OSError('connection closed by server')
+            self.rxbuf += data
+            while b'\r\n' in self.rxbuf:
+                line, self.rxbuf = self.rxbuf.split(b'\r\n', 1)
+                parsed = parse_line(line)
+                if parsed:
+                    if not messages:
+                        messages = []
+                    messages.append(parsed)
+            if len(self.rxbuf) > MAX_LINE:
+                self.rxbuf = b''
+                self.overflows += 1
+        self._keepalive()
+        return messages
+
+    def close(self):
+        super().close()
+        if self.sock:
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+            self.sock = None
+        self.rxbuf = b''
+
+
+class BemfaMQTT(Transport):
+    def __init__(self, uid, host='bemfa.com', port=9501, keepalive=60, qos=0, clean_session=False):
+        super().__init__(uid, keepalive)
+        self.host = host
+        self.port = port
+        self.qos = qos
+        self.clean_session = clean_session
+        self.client = None
+        self.inbox = []
+
+    def connect(self):
+        from umqtt.simple import MQTTClient
+        self.client = MQTTClient(self.uid, self.host, port=self.port, keepalive=self.keepalive)
+        self.client.set_callback(self._on_message)
+        try:
+            self.client.connect(clean_session=self.clean_session)
+            self.connected = True
+            self.last_tx = time.time()
+            for topic in self.topics:
+                self._subscribe(topic)
+        except Exception:
+            self.close()
+            raise
+
+    def _on_message(self, topic, msg):
+        self.inbox.append((topic.decode(), msg.decode()))
+
+    def _subscribe(self, topic):
+        self.client.subscribe(topic, self.qos)
+
+    def publish(self, topic, msg, qos=None):
+        # QoS 1 时 umqtt 会等待 PUBACK 后返回
+        # umqtt 按 len() 计算报文长度，含中文的 str 必须先编码，否则长度按字符数计、报文错位
+        qos = self.qos if qos is None else qos
+        if isinstance(msg, str):
+            msg = msg.encode()
+        self.client.publish(topic, msg, qos=qos)
+        self.last_tx = time.time()
+        return publish_size(topic, msg, qos)
+
+    def ping(self):
+        self.client.ping()
+        self.last_tx = time.time()
+
+    def receive(self):
+        while True:
+            pending = len(self.inbox)
+            if self.client.check_msg() is None and len(self.inbox) == pending:
+                break
+        if not self.inbox:
+            messages = ()
+        else:
+            messages, self.inbox = self.inbox, []
+        self._keepalive()
+        return messages
+
+    def close(self):
+        super().close()
+        if self.client:
+            try:
+                self.client.disconnect()
+            except Exception:
+                pass
+            self.client = None
+
+
+def _utf8_len(s):
+    return len(s.encode()) if isinstance(s, str) else len(s)
+
+
+def publish_size(topic, msg, qos=0):
+    # MQTT PUBLISH 报文的线上字节数：固定头 1 字节 + 剩余长度（变长 1-4 字节）
+    # + 主题长度 2 字节 + 主题 + 报文标识 2 字节（QoS > 0）+ 负载，长度均按 UTF-8 字节计
+    remaining = 2 + _utf8_len(topic) + _utf8_len(msg) + (2 if qos else 0)
+    n = remaining
+    size = 2
+    while n > 0x7F:
+        n >>= 7
+        size += 1
+    return size + remaining
+
+
+def _ready(poller):
+    # MicroPython 的 ipoll 复用结果元组，不像 poll 每次返回新列表
+    if hasattr(poller, 'ipoll'):
+        for _ in poller.ipoll(0):
+            return True
+        return False
+    return bool(poller.poll(0))
+
+
+def parse_line(line):
+    # 解析巴法云推送行 cmd=2&uid=...&topic=...&msg=...，其他应答行（订阅/心跳）返回 None
+    if isinstance(line, (bytes, bytearray)):
+        line = line.decode()
+    if not line.startswith('cmd=2&'):
+        return None
+    t = line.find('&topic=')
+    m = line.find('&msg=')
+    if t < 0 or m < 0:
+        return None
+    end = line.find('&', t + 7)
+    return line[t + 7:end if 0 <= end < m else m], line[m + 5:]
+
+
+def create(kind, uid, host, **kwargs):
+    if kind == 'mqtt':
+        return BemfaMQTT(uid, host, **kwargs)
+    return BemfaTCP(uid, host, **kwargs)
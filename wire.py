@@ -0,0 +1,306 @@
+# 紧凑上行编码：定点整数、固定字段顺序、带版本号，URL 安全 base64 封装
+#
+# 帧首字节 = (SCHEMA_VERSION << 4) | 帧类型，其后为小端定点字段:
+#   遥测帧 KIND_TELEMETRY: 标志字节(bit0 龙头, bit1 蜂鸣器)，之后每站点
+#       温度x10(int16) 湿度x10(uint16) 光照/2(uint16) 气压hPa x10(uint16) 海拔m x10(int16)
+#       缺失值用哨兵值表示（int16 为 -32768，uint16 为 0xFFFF）；NaN、无穷大或超出字段范围的读数
+#       （例如气压异常算出的海拔）同样按缺失发送，不会让 struct.pack 抛出异常
+#   阈值帧 KIND_THRESHOLDS: 温度上/下限x10(int16) 湿度上/下限x10(uint16) 光照上/下限(uint16)
+#   聚合帧 KIND_AGGREGATE: 标志字节，之后每通道 通道字节((站点<<4)|字段下标) 样本数(uint16)
+#       最小 最大 平均（三者与遥测帧中该字段的类型、缩放相同）
+#   批量帧 KIND_SAMPLES: 站点数字节(bit7 = 时间已经 NTP 同步) 首样本 UTC 秒(uint32) 毫秒(uint16)，
+#       之后每个样本 距上一样本的毫秒数(LEB128 变长，首样本为 0) 标志字节 各站点字段（同遥测帧）
+# 编码结果只含 [A-Za-z0-9_-]，可直接作为巴法云 cmd=2 的 msg 字段发送。
+# 本文件在设备和上位机上均可导入，decode() 供上位机解析。
+import struct
+import binascii
+
+SCHEMA_VERSION = 1
+KIND_TELEMETRY = 1
+KIND_THRESHOLDS = 2
+KIND_AGGREGATE = 3
+KIND_SAMPLES = 4
+
+STATION_FIELDS = ('temp', 'hum', 'lux', 'pressure', 'height')
+THRESHOLD_FIELDS = ('temp_upper', 'temp_lower', 'hum_upper', 'hum_lower', 'lux_upper', 'lux_lower')
+
+_STATION_FMT = '<hHHHh'
+_STATION_SIZE = struct.calcsize(_STATION_FMT)
+_THRESHOLD_FMT = '<BhhHHHH'
+# 每个字段的缩放倍数与缺失哨兵值，与 STATION_FIELDS 顺序一致（光照分辨率 2 lux）
+_SCALE = (10, 10, 0.5, 10, 10)
+_MISSING = (-32768, 0xFFFF, 0xFFFF, 0xFFFF, -32768)
+# 缩放后的有效范围（不含哨兵值）
+_LOW = (-32767, 0, 0, 0, -32767)
+_HIGH = (32767, 0xFFFE, 0xFFFE, 0xFFFE, 32767)
+# 聚合帧各字段的条目格式：通道字节 + 样本数 + 最小/最大/平均
+_AGG_FMT = tuple('<BH' + c * 3 for c in _STATION_FMT[1:])
+_BATCH_HEAD = '<BBIH'
+_BATCH_HEAD_SIZE = struct.calcsize(_BATCH_HEAD)
+_MAX_DELTA = 0x0FFFFFFF           # 增量最多 4 字节（约 74 小时）
+_STRUCT_ERROR = getattr(struct, 'error', ValueError)   # MicroPython 的 struct 直接抛出 ValueError
+# 上位机解析不可信输入（节点报文、日志行）时应捕获的异常；decode() 本身只抛出 ValueError，
+# 其余几种用于兜底，一条坏报文不应中断调用方
+DECODE_ERRORS = (ValueError, UnicodeError, IndexError, _STRUCT_ERROR)
+
+
+def _b64(data):
+    s = binascii.b2a_base64(data).decode().rstrip('\n=')
+    return s.replace('+', '-').replace('/', '_')
+
+
+def _unb64(s):
+    s = s.strip('#').replace('-', '+').replace('_', '/')
+    return binascii.a2b_base64(s + '=' * (-len(s) % 4))
+
+
+def _header(kind):
+    return (SCHEMA_VERSION << 4) | kind
+
+
+def encode_telemetry(stations, tap_on, buzzer_on):
+    # stations: [(temp, hum, lux, pressure, height), ...]，缺失值为 None
+    parts = [struct.pack('<BB', _header(KIND_TELEMETRY), (1 if tap_on else 0) | (2 if buzzer_on else 0))]
+    for values in stations:
+        parts.append(struct.pack(_STATION_FMT, _scale(0, values[0]), _scale(1, values[1]),
+                                 _scale(2, values[2]), _scale(3, values[3]), _scale(4, values[4])))
+    return _b64(b''.join(parts))
+
+
+def _scale(i, v):
+    # 缺失、NaN 与超出范围的值都返回哨兵值（NaN 与任何数比较均为 False）
+    if v is None:
+        return _MISSING[i]
+    f = float(v) * _SCALE[i]
+    if not _LOW[i] <= f <= _HIGH[i]:
+        return _MISSING[i]
+    return int(round(f))
+
+
+def _clamp(v, low, high):
+    # 阈值帧没有缺失值，超出范围时取最近的可表示值
+    return low if v < low else high if v > high else v
+
+
+def encode_aggregate(entries, tap_on, buzzer_on):
+    # entries: [(站点, 字段下标, 样本数, 最小, 最大, 平均), ...]，字段下标对应 STATION_FIELDS
+    parts = [struct.pack('<BB', _header(KIND_AGGREGATE), (1 if tap_on else 0) | (2 if buzzer_on else 0))]
+    for station, field, count, vmin, vmax, mean in entries:
+        parts.append(struct.pack(_AGG_FMT[field], (station << 4) | field, min(count, 0xFFFF),
+                                 _scale(field, vmin), _scale(field, vmax), _scale(field, mean)))
+    return _b64(b''.join(parts))
+
+
+class SampleBatch:
+    # 设备端批量缓冲：样本按到达顺序直接打包进预分配的 bytearray，
+    # 时间只记 ticks_ms 增量；frame() 时才写入首样本的绝对时间
+    def __init__(self, capacity, stations=2):
+        self.capacity = capacity
+        self.stations = stations
+        self.buf = bytearray(_BATCH_HEAD_SIZE + capacity * (5 + stations * _STATION_SIZE))
+        self.clear()
+
+    def clear(self):
+        self.pos = _BATCH_HEAD_SIZE
+        self.count = 0
+        self.first = 0              # 首样本的 ticks_ms
+        self.last = 0
+
+    def add(self, ticks, flags, stations):
+        # stations: [(temp, hum, lux, pressure, height), ...]；已满或间隔过长时返回 False，调用方应先发送
+        if self.count >= self.capacity:
+            return False
+        dt = 0
+        if self.count:
+            dt = (ticks - self.last) & 0x3FFFFFFF
+            if dt > _MAX_DELTA:
+                return False
+        else:
+            self.first = ticks
+        self.last = ticks
+        buf = self.buf
+        pos = self.pos
+        while dt > 0x7F:
+            buf[pos] = (dt & 0x7F) | 0x80
+            dt >>= 7
+            pos += 1
+        buf[pos] = dt
+        buf[pos + 1] = flags
+        pos += 2
+        for values in stations:
+            struct.pack_into(_STATION_FMT, buf, pos, _scale(0, values[0]), _scale(1, values[1]),
+                             _scale(2, values[2]), _scale(3, values[3]), _scale(4, values[4]))
+            pos += _STATION_SIZE
+        self.pos = pos
+        self.count += 1
+        return True
+
+    def frame(self, epoch_ms, synced=True):
+        # epoch_ms: 首样本的 UTC 毫秒（clock.epoch_ms(batch.first)）
+        struct.pack_into(_BATCH_HEAD, self.buf, 0, _header(KIND_SAMPLES),
+                         self.stations | (0x80 if synced else 0), epoch_ms // 1000, epoch_ms % 1000)
+        return _b64(memoryview(self.buf)[:self.pos])
+
+
+def encode_thresholds(temp_upper, temp_lower, hum_upper, hum_lower, lux_upper, lux_lower):
+    return _b64(struct.pack(_THRESHOLD_FMT, _header(KIND_THRESHOLDS),
+                            _clamp(int(round(temp_upper * 10)), -32768, 32767),
+                            _clamp(int(round(temp_lower * 10)), -32768, 32767),
+                            _clamp(int(round(hum_upper * 10)), 0, 0xFFFF),
+                            _clamp(int(round(hum_lower * 10)), 0, 0xFFFF),
+                            _clamp(int(lux_upper), 0, 0xFFFF), _clamp(int(lux_lower), 0, 0xFFFF)))
+
+
+def decode(msg):
+    # 解析 msg 字段（可带 '#' 包裹），返回字典；版本或类型不符、帧被截断或损坏时一律抛出 ValueError
+    data = _unb64(msg)
+    if not data:
+        raise ValueError('empty frame')
+    version, kind = data[0] >> 4, data[0] & 0x0F
+    if version != SCHEMA_VERSION:
+        raise ValueError('unsupported schema version %d' % version)
+    try:
+        return _decode(data, kind)
+    except (IndexError, _STRUCT_ERROR):
+        raise ValueError('truncated frame')
+
+
+def _decode(data, kind):
+    if kind == KIND_TELEMETRY:
+        if len(data) < 2 + _STATION_SIZE or (len(data) - 2) % _STATION_SIZE:
+            raise ValueError('bad telemetry frame length %d' % len(data))
+        flags = data[1]
+        stations = [_station(data, offset)
+                    for offset in range(2, len(data) - _STATION_SIZE + 1, _STATION_SIZE)]
+        return {'kind': 'telemetry', 'tap_on': bool(flags & 1), 'buzzer_on': bool(flags & 2),
+                'stations': stations}
+    if kind == KIND_SAMPLES:
+        _, n, sec, ms = struct.unpack_from(_BATCH_HEAD, data)
+        synced = bool(n & 0x80)
+        n &= 0x7F
+        t = sec * 1000 + ms
+        samples = []
+        offset = _BATCH_HEAD_SIZE
+        while offset < len(data):
+            dt = shift = 0
+            while True:
+                b = data[offset]
+                offset += 1
+                dt |= (b & 0x7F) << shift
+                shift += 7
+                if not b & 0x80:
+                    break
+            t += dt
+            flags = data[offset]
+            offset += 1
+            stations = [_station(data, offset + k * _STATION_SIZE) for k in range(n)]
+            offset += n * _STATION_SIZE
+            samples.append({'t': t / 1000, 'tap_on': bool(flags & 1), 'buzzer_on': bool(flags & 2),
+                            'stations': stations})
+        return {'kind': 'samples', 'synced': synced, 'samples': samples}
+    if kind == KIND_THRESHOLDS:
+        fields = struct.unpack(_THRESHOLD_FMT, data)[1:]
+        values = [fields[0] / 10, fields[1] / 10, fields[2] / 10, fields[3] / 10, fields[4], fields[5]]
+        result = {'kind': 'thresholds'}
+        for name, v in zip(THRESHOLD_FIELDS, values):
+            result[name] = v
+        return result
+    if kind == KIND_AGGREGATE:
+        flags = data[1]
+        channels = []
+        offset = 2
+        while offset < len(data):
+            field = data[offset] & 0x0F
+            fmt = _AGG_FMT[field]
+            ch, count, vmin, vmax, mean = struct.unpack_from(fmt, data, offset)
+            offset += struct.calcsize(fmt)
+            entry = {'station': ch >> 4, 'field': STATION_FIELDS[field], 'count': count}
+            for name, v in (('min', vmin), ('max', vmax), ('mean', mean)):
+                entry[name] = None if v == _MISSING[field] else v / _SCALE[field]
+            channels.append(entry)
+        return {'kind': 'aggregate', 'tap_on': bool(flags & 1), 'buzzer_on': bool(flags & 2),
+                'channels': channels}
+    raise ValueError('unknown frame kind %d' % kind)
+
+
+def _station(data, offset):
+    fields = struct.unpack_from(_STATION_FMT, data, offset)
+    station = {}
+    for i, name in enumerate(STATION_FIELDS):
+        v = fields[i]
+        station[name] = None if v == _MISSING[i] else v / _SCALE[i]
+    return station
+
+
+def _legacy_line(topic, *values):
+    # 与 main.send_data 的旧格式一致，用于字节数对比
+    msg = "#".join(map(str, values))
+    return f'cmd=2&uid={"0" * 32}&topic={topic}&msg=#{msg}#\r\n'.encode()
+
+
+if __name__ == '__main__':
+    # 上位机运行：往返校验并对比每站点每秒上行字节数
+    THRESHOLD_REFRESH = 60
+    s1 = (24.5, 62.3, 742, 989.0, 203.7)
+    s2 = (25.1, None, 12034, 990.2, -3.4)
+    limits = (30.0, 15.0, 70.0, 30.0, 10000, 100)
+
+    frame = encode_telemetry((s1, s2), True, False)
+    decoded = decode('#' + frame + '#')
+    assert decoded['tap_on'] and not decoded['buzzer_on']
+    for sent, got in zip((s1, s2), decoded['stations']):
+        for name, v in zip(STATION_FIELDS, sent):
+            assert got[name] == v, (name, v, got[name])
+    limit_frame = encode_thresholds(*limits)
+    assert tuple(decode(limit_frame)[n] for n in THRESHOLD_FIELDS) == limits
+    agg_frame = encode_aggregate([(1, 0, 60, 24.1, 26.8, 25.3), (2, 2, 0, None, None, None)], False, True)
+    agg = decode(agg_frame)
+    assert agg['buzzer_on'] and agg['channels'][0] == {'station': 1, 'field': 'temp', 'count': 60,
+                                                       'min': 24.1, 'max': 26.8, 'mean': 25.3}
+    assert agg['channels'][1]['field'] == 'lux' and agg['channels'][1]['mean'] is None
+    batch = SampleBatch(10)
+    for k in range(10):
+        assert batch.add((0x3FFFFF00 + k * 1003) & 0x3FFFFFFF, k & 1, (s1, s2))
+    assert not batch.add(0, 0, (s1, s2))
+    batch_frame = batch.frame(1700000000123)
+    samples = decode(batch_frame)['samples']
+    assert [round(x['t'] * 1000) - 1700000000123 for x in samples] == [k * 1003 for k in range(10)]
+    assert samples[3]['tap_on'] and samples[3]['stations'][1] == decode(frame)['stations'][1]
+    # 超出范围与非有限值按缺失发送：约 600 hPa 算出的 4200 m 海拔、NaN、无穷大、负光照
+    odd = decode(encode_telemetry([(float('nan'), 101.0, -5, 600.2, 4200.0),
+                                   (float('inf'), -1, 200000, None, -4200.0)], False, False))['stations']
+    assert odd[0] == {'temp': None, 'hum': 101.0, 'lux': None, 'pressure': 600.2, 'height': None}, odd[0]
+    assert all(v is None for v in odd[1].values()), odd[1]
+    batch.clear()
+    assert batch.add(0, 0, ((float('nan'), 1e9, 5, 1013.2, 5000.0), s1))
+    assert decode(batch.frame(0))['samples'][0]['stations'][0]['height'] is None
+    agg = decode(encode_aggregate([(1, 4, 3, -10.0, 4300.0, float('nan'))], False, False))['channels'][0]
+    assert (agg['min'], agg['max'], agg['mean']) == (-10.0, None, None), agg
+    # 光照分辨率 2 lux：奇数读数解码后与原值相差 1
+    for lux in (0, 1, 101, 103, 999, 65535, 131068):
+        got = decode(encode_telemetry([(None, None, lux, None, None)], False, False))['stations'][0]['lux']
+        assert abs(got - lux) <= 1, (lux, got)
+    assert decode(encode_telemetry([(None, None, 101, None, None)], False, False))['stations'][0]['lux'] == 100
+    # 截断或损坏的帧只抛出 ValueError：上位机调用方只捕获 ValueError/UnicodeError
+    bad = ['EQ', 'EQAB', frame[:-3], batch_frame[:-2], _b64(b'\x14\x01'), _b64(b'\x13\x00\x0f'),
+           agg_frame[:-4], limit_frame[:-3], _b64(b'\x12'), _b64(b'\x14\x02\x00\x00\x00\x00\x00\x00\x80')]
+    for msg in bad:
+        try:
+            decode(msg)
+        except ValueError:
+            continue
+        raise AssertionError('decoded a truncated frame: %r' % msg)
+    # 阈值帧超出范围时取边界值
+    clamped = decode(encode_thresholds(4000.0, -4000.0, 7000.0, -1.0, 100000, -5))
+    assert tuple(clamped[n] for n in THRESHOLD_FIELDS) == (3276.7, -3276.8, 6553.5, 0.0, 65535, 0), clamped
+
+    legacy = (len(_legacy_line('temp004', '24.5', '62.3', '741', '989.0', '203.70', '已开启'))
+              + len(_legacy_line('temp2004', '25.1', '0', '12034', '990.2', '-3.40', '已关闭'))
+              + len(_legacy_line('temp3004', '30.0', '15.0', '70.0', '30.0', '10000', '100')))
+    compact = len(_legacy_line('temp004', frame)) + len(_legacy_line('temp3004', limit_frame)) / THRESHOLD_REFRESH
+    print('telemetry frame: %d chars, thresholds frame: %d chars' % (len(frame), len(limit_frame)))
+    print('legacy : %.1f B/s per station' % (legacy / 2))
+    print('compact: %.1f B/s per station' % (compact / 2))
+    print('ratio  : %.2fx' % (legacy / compact))
+    batched = len(_legacy_line('temp004', batch_frame)) / 10 + len(_legacy_line('temp3004', limit_frame)) / THRESHOLD_REFRESH
+    print('batched: %.1f B/s per station (10 samples per frame, ms timestamps)' % (batched / 2))